@@ -1,3 +1,18 @@
 from django.contrib import admin
 
-# Register your models here.
+from .caching import purge_movie
+from .models import Movie
+
+
+@admin.register(Movie)
+class MovieAdmin(admin.ModelAdmin):
+    list_display = ("id", "title", "year")
+    search_fields = ("id", "title")
+    actions = ["purge_tmdb_cache"]
+
+    @admin.action(description="Purge cached TMDB data for selected movies")
+    def purge_tmdb_cache(self, request, queryset):
+        movie_ids = list(queryset.values_list("id", flat=True))
+        for movie_id in movie_ids:
+            purge_movie(movie_id)
+        self.message_user(request, f"Purged TMDB cache for {len(movie_ids)} movies")
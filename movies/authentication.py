@@ -0,0 +1,39 @@
+"""
+Authentication for user-scoped endpoints
+"""
+import hmac
+
+from django.conf import settings
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import User
+
+
+class ClerkUserAuthentication(BaseAuthentication):
+    """
+    Authenticate requests forwarded by the frontend server
+
+    The frontend verifies the Clerk session itself and forwards the user's
+    Clerk ID in X-Clerk-User-Id together with the shared INTERNAL_API_TOKEN
+    in X-Internal-Token. Requests without the header stay anonymous.
+    """
+
+    def authenticate(self, request):
+        clerk_id = request.META.get("HTTP_X_CLERK_USER_ID")
+        if not clerk_id:
+            return None
+
+        token = request.META.get("HTTP_X_INTERNAL_TOKEN", "")
+        expected = settings.INTERNAL_API_TOKEN
+        if not expected or not hmac.compare_digest(token.encode(), expected.encode()):
+            raise AuthenticationFailed("Invalid internal API token")
+
+        try:
+            user = User.objects.select_related("preferences").get(clerk_id=clerk_id)
+        except User.DoesNotExist:
+            raise AuthenticationFailed("Unknown user")
+        return (user, None)
+
+    def authenticate_header(self, request):
+        return "X-Clerk-User-Id"
@@ -0,0 +1,260 @@
+"""
+In-process IP ban and allow lists
+
+Bans (automatic ones from the rate limiter and manual ones from
+manage.py ipban) live in a Redis sorted set scored by expiry time, allowed
+addresses/CIDRs in a plain set. Every worker keeps a compiled copy: single
+addresses in a set of integers, CIDR blocks as merged integer ranges
+searched with bisect. Checking a request is a couple of lookups and never
+touches Redis.
+
+Changes bump a version key and are published on a channel; a listener
+thread per process reloads the lists when a message arrives, and also
+when the earliest ban expires or the version changed without a message
+(checked every IP_BANLIST_REFRESH seconds).
+"""
+import ipaddress
+import logging
+import os
+import threading
+import time
+from bisect import bisect_right
+
+import redis
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+DENY_KEY = "ipban:deny"
+ALLOW_KEY = "ipban:allow"
+VERSION_KEY = "ipban:version"
+CHANNEL = "ipban:updates"
+
+BANNED = "banned"
+ALLOWED = "allowed"
+
+
+def parse_network(entry):
+    """ip_network for an address or CIDR string (or bytes), or None"""
+    if isinstance(entry, bytes):
+        entry = entry.decode()
+    try:
+        network = ipaddress.ip_network(str(entry).strip(), strict=False)
+    except ValueError:
+        return None
+    if network.version == 6 and network.prefixlen == 128 and network.network_address.ipv4_mapped:
+        return ipaddress.ip_network(network.network_address.ipv4_mapped)
+    return network
+
+
+def canonical(entry):
+    """How an entry is stored: a bare address for single IPs, else CIDR notation"""
+    network = parse_network(entry)
+    if network is None:
+        raise ValueError(f"Not an IP address or CIDR block: {entry}")
+    if network.num_addresses == 1:
+        return str(network.network_address)
+    return str(network)
+
+
+class IPSet:
+    """Immutable set of addresses and CIDR blocks with O(log n) membership"""
+
+    def __init__(self, entries=()):
+        exact = {4: set(), 6: set()}
+        spans = {4: [], 6: []}
+        for entry in entries:
+            network = parse_network(entry)
+            if network is None:
+                logger.warning("Ignoring malformed IP list entry %r", entry)
+                continue
+            start = int(network.network_address)
+            if network.num_addresses == 1:
+                exact[network.version].add(start)
+            else:
+                spans[network.version].append((start, int(network.broadcast_address)))
+
+        self._exact = exact
+        self._starts = {}
+        self._ends = {}
+        for version, ranges in spans.items():
+            merged = []
+            for start, end in sorted(ranges):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self._starts[version] = [start for start, _ in merged]
+            self._ends[version] = [end for _, end in merged]
+
+    def __len__(self):
+        return sum(len(s) for s in self._exact.values()) + sum(len(s) for s in self._starts.values())
+
+    def __contains__(self, address):
+        value = int(address)
+        if value in self._exact[address.version]:
+            return True
+        starts = self._starts[address.version]
+        i = bisect_right(starts, value) - 1
+        return i >= 0 and value <= self._ends[address.version][i]
+
+
+_deny = IPSet()
+_allow = IPSet()
+_version = None
+_next_expiry = None
+_listener_pid = None
+_lock = threading.Lock()
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def reload(connection=None):
+    """Rebuild this process's lists from Redis"""
+    global _deny, _allow, _version, _next_expiry
+    r = connection or get_redis_connection("default")
+    now = time.time()
+    pipe = r.pipeline(transaction=False)
+    pipe.get(VERSION_KEY)
+    pipe.zrangebyscore(DENY_KEY, now, "+inf", withscores=True)
+    pipe.smembers(ALLOW_KEY)
+    version, deny, allow = pipe.execute()
+
+    expiries = [score for _, score in deny if score != float("inf")]
+    _deny = IPSet(_decode(member) for member, _ in deny)
+    _allow = IPSet(_decode(member) for member in allow)
+    _version = _decode(version)
+    _next_expiry = min(expiries) if expiries else None
+    logger.debug("Loaded IP lists: %d denied, %d allowed", len(_deny), len(_allow))
+
+
+def _is_stale(connection):
+    if _next_expiry is not None and time.time() >= _next_expiry:
+        return True
+    return _decode(connection.get(VERSION_KEY)) != _version
+
+
+def _listen():
+    refresh = settings.IP_BANLIST_REFRESH
+    while True:
+        try:
+            # get_message blocks for up to the refresh interval, longer than
+            # the shared pool's socket timeout, so use a dedicated connection
+            connection = redis.Redis.from_url(
+                settings.CACHES["default"]["LOCATION"],
+                socket_timeout=refresh + 5,
+                health_check_interval=30,
+            )
+            pubsub = connection.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            # Catch up on anything published while we were not subscribed
+            reload(connection)
+            while True:
+                timeout = refresh
+                if _next_expiry is not None:
+                    timeout = max(0.1, min(timeout, _next_expiry - time.time()))
+                message = pubsub.get_message(timeout=timeout)
+                if message is not None or _is_stale(connection):
+                    reload(connection)
+        except Exception as e:
+            logger.warning("IP list listener failed, retrying in %ss: %s", refresh, e)
+            time.sleep(refresh)
+
+
+def _ensure_listener():
+    """Load the lists and start the listener once per process (again after a fork)"""
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        try:
+            reload()
+        except Exception as e:
+            # Fail open: the listener keeps retrying in the background
+            logger.warning("Could not load IP lists: %s", e)
+        threading.Thread(target=_listen, name="ip-banlist-listener", daemon=True).start()
+
+
+def check(ip):
+    """BANNED, ALLOWED or None for a client IP, from the in-process lists"""
+    if not settings.IP_BANLIST_ENABLED or not ip:
+        return None
+    _ensure_listener()
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    address = getattr(address, "ipv4_mapped", None) or address
+    if address in _allow:
+        return ALLOWED
+    if address in _deny:
+        return BANNED
+    return None
+
+
+def _publish(pipe):
+    pipe.incr(VERSION_KEY)
+    pipe.publish(CHANNEL, "changed")
+    pipe.execute()
+
+
+def ban(entry, duration=None):
+    """
+    Deny an address or CIDR block for duration seconds (None = until unbanned)
+
+    An existing ban is only ever extended, so the rate limiter's automatic
+    bans never shorten a manual one. Only new bans are published: workers
+    already enforce an extended one and re-read it when its old expiry
+    passes, so repeated bans of an address do not make every worker reload.
+    """
+    member = canonical(entry)
+    expires = time.time() + duration if duration else float("inf")
+    r = get_redis_connection("default")
+    pipe = r.pipeline(transaction=False)
+    pipe.zremrangebyscore(DENY_KEY, "-inf", time.time())
+    pipe.zadd(DENY_KEY, {member: expires}, gt=True)
+    _, added = pipe.execute()
+    if added:
+        _publish(r.pipeline(transaction=False))
+    return member
+
+
+def unban(entry):
+    member = canonical(entry)
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    pipe.zrem(DENY_KEY, member)
+    _publish(pipe)
+    return member
+
+
+def allow(entry):
+    """Exempt an address or CIDR block from bans and rate limits"""
+    member = canonical(entry)
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    pipe.sadd(ALLOW_KEY, member)
+    _publish(pipe)
+    return member
+
+
+def disallow(entry):
+    member = canonical(entry)
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    pipe.srem(ALLOW_KEY, member)
+    _publish(pipe)
+    return member
+
+
+def entries():
+    """(denied [(entry, expires or None)], allowed [entry]) as stored in Redis"""
+    r = get_redis_connection("default")
+    deny = r.zrangebyscore(DENY_KEY, time.time(), "+inf", withscores=True)
+    return (
+        [(_decode(m), None if score == float("inf") else score) for m, score in deny],
+        sorted(_decode(m) for m in r.smembers(ALLOW_KEY)),
+    )
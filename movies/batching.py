@@ -0,0 +1,118 @@
+"""
+Micro-batching of LLM preference analyses
+
+Requests that arrive within LLM_BATCH_WINDOW of each other (up to
+LLM_BATCH_MAX_SIZE) are sent to the LLM as one multi-item prompt, and the
+parsed results are handed back to each waiting caller. Each caller's
+context (TMDB priority, profiling recorder) is kept: a batch runs in its
+first caller's context, and single calls in their own. This only merges
+requests that are in flight in the same process at the same time, i.e.
+threaded gunicorn workers or the recommendation job worker running with
+--concurrency > 1; sync workers simply see batches of one.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+
+from .prompting import record_token_usage
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBatchDispatcher:
+    """Collects pending analyses and dispatches them to the LLM in batches"""
+
+    def __init__(self, max_batch_size=None, max_wait=None):
+        self.max_batch_size = max_batch_size or settings.LLM_BATCH_MAX_SIZE
+        self.max_wait = max_wait if max_wait is not None else settings.LLM_BATCH_WINDOW
+        self._pending = []
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-batch")
+        self._thread = threading.Thread(target=self._collect_loop, name="llm-batch-collector", daemon=True)
+        self._thread.start()
+
+    def submit(self, preferences, movie_data_list):
+        """Queue one analysis and block until its result (or error) is ready"""
+        future = Future()
+        with self._condition:
+            self._pending.append((preferences, movie_data_list, future, contextvars.copy_context()))
+            self._condition.notify()
+        return future.result(timeout=settings.LLM_READ_TIMEOUT + self.max_wait + 5)
+
+    def _collect_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                # Hold the batch open for the window unless it fills up first
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:self.max_batch_size]
+            # A context can only be entered by one thread at a time
+            self._executor.submit(batch[0][3].copy().run, self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        from .services import LLMService
+
+        llm_service = LLMService()
+        if len(batch) == 1:
+            preferences, movie_data_list, future, _ = batch[0]
+            self._run_single(llm_service, preferences, movie_data_list, future)
+            return
+
+        requests_by_id = {f"r{i}": (prefs, movies) for i, (prefs, movies, _, _) in enumerate(batch)}
+        futures = {f"r{i}": future for i, (_, _, future, _) in enumerate(batch)}
+        contexts = {f"r{i}": context for i, (_, _, _, context) in enumerate(batch)}
+        try:
+            response = llm_service._call_llm(llm_service._build_batch_prompt(requests_by_id))
+            record_token_usage(response, len(batch))
+            results = llm_service._parse_llm_response(response).get("results", [])
+        except Exception as e:
+            for future in futures.values():
+                future.set_exception(e)
+            return
+
+        for item in results:
+            future = futures.pop(str(item.pop("id", "")), None)
+            if future is not None:
+                future.set_result(item)
+
+        # Entries the model dropped or mislabeled get an individual call
+        if futures:
+            logger.warning("LLM batch returned %d/%d results", len(batch) - len(futures), len(batch))
+        for request_id, future in futures.items():
+            preferences, movie_data_list = requests_by_id[request_id]
+            contexts[request_id].copy().run(self._run_single, llm_service, preferences, movie_data_list, future)
+
+    def _run_single(self, llm_service, preferences, movie_data_list, future):
+        try:
+            response = llm_service._call_llm(llm_service._build_prompt(preferences, movie_data_list))
+            record_token_usage(response, 1)
+            future.set_result(llm_service._parse_llm_response(response))
+        except Exception as e:
+            future.set_exception(e)
+
+
+_dispatcher = None
+_dispatcher_pid = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Get this process's dispatcher (threads do not survive a fork, so one per pid)"""
+    global _dispatcher, _dispatcher_pid
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher_pid != os.getpid():
+            _dispatcher = LLMBatchDispatcher()
+            _dispatcher_pid = os.getpid()
+    return _dispatcher
@@ -0,0 +1,271 @@
+"""
+TMDB cache key families with generation counters
+
+Every cached TMDB response belongs to a family (trending, discover, one
+movie, ...). Keys embed the family's current generation, so bumping the
+counter invalidates the whole family in O(1): new requests miss and the
+old entries simply age out (or are removed by cleanup_orphans). Keys also
+embed a digest of the endpoint and params, so changing request params
+(e.g. without_genres) never serves entries cached under the old ones.
+
+Key shapes:
+    tmdb:{family}:g{gen}:{digest}
+    tmdb:movie:{movie_id}:g{family_gen}.{movie_gen}:{digest}
+
+Counters are bumped in the CacheGeneration table first and copied to
+Redis; a counter missing from Redis (restart, eviction) is restored from
+the table, so keys of the durable store stay reachable and purged
+generations never come back.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CacheGeneration
+
+logger = logging.getLogger(__name__)
+
+FAMILIES = [
+    "trending",
+    "top_rated",
+    "genre",
+    "search",
+    "discover",
+    "trending_genres",
+    "genre_list",
+    "movie",
+    "configuration",
+]
+
+KEY_PREFIX = "tmdb:"
+STALE_PREFIX = "stale:"
+
+# Keys written before key families existed; only removed by cleanup
+LEGACY_PATTERNS = [
+    "trending_movies_page_*",
+    "top_rated_movies_page_*",
+    "movies_genre_*",
+    "search_movie_*",
+    "movie_details_*",
+    "movie_keywords_*",
+    "discover_*",
+    "trending_genres_*",
+    "genre_list",
+]
+
+# Seconds a restored zero counter stays in Redis; most movies are never
+# purged, so their counters are not kept forever
+UNSET_GENERATION_TTL = 86400
+
+_generations = {}
+_lock = threading.Lock()
+
+
+def family_of(key):
+    """Family of a versioned key, or None for keys not built by tmdb_cache_key"""
+    if not key or not key.startswith(KEY_PREFIX):
+        return None
+    return key.split(":", 2)[1]
+
+
+def generation_key(family, movie_id=None):
+    if movie_id is not None:
+        return f"cache:gen:movie:{movie_id}"
+    return f"cache:gen:{family}"
+
+
+def _get_generations(keys):
+    """
+    Current values of generation counters, memoized in-process for
+    CACHE_GENERATION_REFRESH seconds
+    """
+    now = time.monotonic()
+    values = {}
+    missing = []
+    for key in keys:
+        memo = _generations.get(key)
+        if memo and now - memo[1] < settings.CACHE_GENERATION_REFRESH:
+            values[key] = memo[0]
+        else:
+            missing.append(key)
+
+    if missing:
+        fetched = current_generations(missing)
+        with _lock:
+            if len(_generations) > 10000:
+                _generations.clear()
+            for key in missing:
+                values[key] = fetched.get(key, 0)
+                _generations[key] = (values[key], now)
+    return values
+
+
+def current_generations(keys):
+    """
+    Generation counters from Redis, restoring the ones Redis lost from the
+    CacheGeneration table
+    """
+    values = cache.get_many(keys) if keys else {}
+    lost = [key for key in keys if key not in values]
+    if lost:
+        try:
+            stored = dict(CacheGeneration.objects.filter(key__in=lost).values_list("key", "value"))
+        except Exception as e:
+            # Without the table a lost counter reads as 0, as before
+            logger.warning("Could not read cache generations: %s", e)
+            stored = {}
+        for key in lost:
+            values[key] = stored.get(key, 0)
+            # add(): never overwrite a counter a concurrent purge just set
+            cache.add(key, values[key], None if values[key] else UNSET_GENERATION_TTL)
+    return values
+
+
+def tmdb_cache_key(family, endpoint, params=None, movie_id=None):
+    """Build the versioned cache key for a TMDB request"""
+    digest = hashlib.sha1(
+        f"{endpoint}?{json.dumps(params or {}, sort_keys=True, default=str)}".encode()
+    ).hexdigest()[:16]
+
+    if movie_id is not None:
+        family_key, movie_key = generation_key("movie"), generation_key("movie", movie_id)
+        gens = _get_generations([family_key, movie_key])
+        return f"{KEY_PREFIX}movie:{movie_id}:g{gens[family_key]}.{gens[movie_key]}:{digest}"
+
+    key = generation_key(family)
+    gen = _get_generations([key])[key]
+    return f"{KEY_PREFIX}{family}:g{gen}:{digest}"
+
+
+def _bump(key):
+    with transaction.atomic():
+        generation, _ = CacheGeneration.objects.select_for_update().get_or_create(key=key)
+        # Redis may be ahead for counters bumped before the table existed
+        value = max(generation.value, cache.get(key) or 0) + 1
+        CacheGeneration.objects.filter(key=key).update(value=value)
+        # Written while the row is locked, so concurrent purges land in order
+        cache.set(key, value, None)
+    with _lock:
+        _generations[key] = (value, time.monotonic())
+    return value
+
+
+def get_many(keys):
+    """Values for many keys in one round trip (MGET on django-redis); misses are left out"""
+    return cache.get_many(keys) if keys else {}
+
+
+def set_many(entries):
+    """
+    Write (key, value, timeout) entries in one pipelined round trip
+
+    Unlike cache.set_many, every entry keeps its own timeout.
+    """
+    client = getattr(cache, "client", None)
+    if client is None or not hasattr(client, "get_client"):
+        # Not django-redis (e.g. locmem in tests)
+        for key, value, timeout in entries:
+            cache.set(key, value, timeout)
+        return
+    pipeline = client.get_client(write=True).pipeline(transaction=False)
+    for key, value, timeout in entries:
+        client.set(key, value, timeout, client=pipeline)
+    pipeline.execute()
+
+
+def purge_family(family):
+    """Invalidate every cached response of a family; returns the new generation"""
+    if family not in FAMILIES:
+        raise ValueError(f"Unknown cache family: {family}")
+    return _bump(generation_key(family))
+
+
+def purge_movie(movie_id):
+    """Invalidate cached details, keywords, ... of one movie"""
+    return _bump(generation_key("movie", movie_id))
+
+
+def purge_all():
+    return {family: purge_family(family) for family in FAMILIES}
+
+
+def _is_orphan(key, generations):
+    """Whether a versioned key belongs to an older generation"""
+    parts = key.split(":")
+    try:
+        if parts[1] == "movie":
+            family_gen, movie_gen = parts[3][1:].split(".")
+            return (
+                int(family_gen) != generations.get(generation_key("movie"), 0)
+                or int(movie_gen) != generations.get(generation_key("movie", parts[2]), 0)
+            )
+        return int(parts[2][1:]) != generations.get(generation_key(parts[1]), 0)
+    except (IndexError, ValueError):
+        # Not a shape we write; leave it alone
+        return False
+
+
+def _generation_keys_for(key):
+    parts = key.split(":")
+    if len(parts) > 2 and parts[1] == "movie":
+        return [generation_key("movie"), generation_key("movie", parts[2])]
+    return [generation_key(parts[1])] if len(parts) > 1 else []
+
+
+def cleanup_orphans(batch_size=500, include_legacy=True, dry_run=False):
+    """
+    Delete entries left behind by purged generations (and pre-family keys)
+
+    Uses SCAN (django-redis iter_keys) rather than KEYS so Redis is never
+    blocked, and deletes in batches. Returns the number of keys removed
+    (or that would be removed with dry_run); 0 on other cache backends,
+    which cannot be scanned.
+    """
+    if not hasattr(cache, "iter_keys"):
+        logger.warning("Cache cleanup skipped: the cache backend is not django-redis")
+        return 0
+
+    removed = 0
+
+    def flush(batch):
+        nonlocal removed
+        if batch and not dry_run:
+            cache.delete_many(batch)
+        removed += len(batch)
+
+    for pattern in (f"{KEY_PREFIX}*", f"{STALE_PREFIX}{KEY_PREFIX}*"):
+        batch = []
+        for key in cache.iter_keys(pattern, itersize=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                flush(orphaned_keys(batch))
+                batch = []
+        flush(orphaned_keys(batch))
+
+    if include_legacy:
+        for pattern in LEGACY_PATTERNS:
+            for prefix in ("", STALE_PREFIX):
+                batch = []
+                for key in cache.iter_keys(f"{prefix}{pattern}", itersize=batch_size):
+                    batch.append(key)
+                    if len(batch) >= batch_size:
+                        flush(batch)
+                        batch = []
+                flush(batch)
+
+    logger.info("Cache cleanup %s %d orphaned keys", "found" if dry_run else "removed", removed)
+    return removed
+
+
+def orphaned_keys(keys):
+    """The keys (optionally stale:-prefixed) that belong to an older generation"""
+    bare = [k[len(STALE_PREFIX):] if k.startswith(STALE_PREFIX) else k for k in keys]
+    needed = {gen_key for key in bare for gen_key in _generation_keys_for(key)}
+    generations = current_generations(list(needed))
+    return [key for key, bare_key in zip(keys, bare) if _is_orphan(bare_key, generations)]
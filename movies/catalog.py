@@ -0,0 +1,410 @@
+"""
+Compact columnar movie catalog for in-process filtering and sorting
+
+Holding the catalog as TMDB dicts would cost every gunicorn worker
+hundreds of bytes per movie in repeated keys and boxed numbers. Instead
+manage.py build_catalog writes the Movie table out as NumPy columns, one
+.npy file each, and workers open them with mmap: the pages live once in
+the OS page cache and are shared by every process on the machine.
+
+Columns, one entry per movie (row):
+- ids, years (0 = unknown), release_days (days since 1970, NO_DATE when
+  unknown), vote_average, vote_count, popularity, title_rank
+- genre_bits: a 64-bit set of genres, bit i = meta["genres"][i]; genres
+  past the 64th are listed in meta["dropped_genres"] and filters on them
+  are refused
+- languages: index into meta["languages"]
+- keywords as an interned vocabulary (keyword_vocab, sorted TMDB IDs) with
+  CSR lists both ways: row -> keyword codes (row_keyword_offsets,
+  row_keywords) and keyword code -> rows (keyword_row_offsets,
+  keyword_rows)
+
+Builds go into a new directory under CATALOG_ROOT and are published by
+atomically swapping the `current` symlink; workers notice within
+CATALOG_REFRESH seconds. Numpy is only imported by modules that use the
+catalog, never at worker boot.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CURRENT = "current"
+NO_DATE = np.iinfo(np.int32).min
+EPOCH = date(1970, 1, 1)
+
+COLUMNS = {
+    "ids": np.int32,
+    "years": np.int16,
+    "release_days": np.int32,
+    "vote_average": np.float32,
+    "vote_count": np.int32,
+    "popularity": np.float32,
+    "title_rank": np.int32,
+    "genre_bits": np.uint64,
+    "languages": np.int16,
+    "keyword_vocab": np.int32,
+    "row_keyword_offsets": np.int64,
+    "row_keywords": np.int32,
+    "keyword_row_offsets": np.int64,
+    "keyword_rows": np.int32,
+}
+
+# TMDB sort_by field -> column; title sorts by the precomputed rank
+SORT_COLUMNS = {
+    "popularity": "popularity",
+    "vote_average": "vote_average",
+    "vote_count": "vote_count",
+    "primary_release_date": "release_days",
+    "release_date": "release_days",
+    "title": "title_rank",
+    "original_title": "title_rank",
+}
+
+
+def _days(value):
+    return (value - EPOCH).days if value else NO_DATE
+
+
+class Catalog:
+    """A read-only, memory-mapped catalog build"""
+
+    def __init__(self, path, columns, meta):
+        self.path = path
+        self.meta = meta
+        self.version = path.name
+        for name, column in columns.items():
+            setattr(self, name, column)
+        self.genre_positions = {genre_id: bit for bit, genre_id in enumerate(meta["genres"])}
+        self.dropped_genres = set(meta.get("dropped_genres", []))
+        self.language_positions = {code: i for i, code in enumerate(meta["languages"])}
+
+    @classmethod
+    def open(cls, path):
+        path = Path(path)
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        columns = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in COLUMNS}
+        return cls(path, columns, meta)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_of(self, movie_id):
+        """Row of a TMDB movie ID, or None (ids are stored sorted)"""
+        i = int(np.searchsorted(self.ids, movie_id))
+        return i if i < len(self.ids) and self.ids[i] == movie_id else None
+
+    def genre_mask(self, genre_ids):
+        """(bit mask of the known genres, whether any genre was unknown)"""
+        bits, unknown = 0, False
+        for genre_id in genre_ids:
+            bit = self.genre_positions.get(int(genre_id))
+            if bit is None:
+                unknown = True
+            else:
+                bits |= 1 << bit
+        return np.uint64(bits), unknown
+
+    def keyword_codes(self, keyword_ids):
+        """Interned codes of the keywords present in the catalog"""
+        keyword_ids = np.asarray([int(k) for k in keyword_ids], dtype=np.int32)
+        codes = np.searchsorted(self.keyword_vocab, keyword_ids)
+        codes = np.minimum(codes, max(0, len(self.keyword_vocab) - 1))
+        found = self.keyword_vocab[codes] == keyword_ids if len(self.keyword_vocab) else np.zeros(len(codes), bool)
+        return codes[found]
+
+    def rows_with_keyword(self, code):
+        return self.keyword_rows[self.keyword_row_offsets[code]:self.keyword_row_offsets[code + 1]]
+
+    def movie_keywords(self, row):
+        """TMDB keyword IDs of a row"""
+        codes = self.row_keywords[self.row_keyword_offsets[row]:self.row_keyword_offsets[row + 1]]
+        return self.keyword_vocab[codes]
+
+    def _keyword_mask(self, keyword_ids, match_all):
+        codes = self.keyword_codes(keyword_ids)
+        mask = np.zeros(len(self), dtype=bool)
+        if match_all:
+            if len(codes) < len({int(k) for k in keyword_ids}):
+                return mask
+            rows = None
+            # Smallest posting list first keeps the intersections short
+            for code in sorted(codes, key=lambda c: self.keyword_row_offsets[c + 1] - self.keyword_row_offsets[c]):
+                posting = self.rows_with_keyword(code)
+                rows = posting if rows is None else np.intersect1d(rows, posting, assume_unique=True)
+            if rows is not None:
+                mask[rows] = True
+            return mask
+        for code in codes:
+            mask[self.rows_with_keyword(code)] = True
+        return mask
+
+    def filter(
+        self,
+        genres_all=(),
+        genres_any=(),
+        genres_none=(),
+        keywords_all=(),
+        keywords_any=(),
+        keywords_none=(),
+        min_votes=None,
+        min_rating=None,
+        year=None,
+        released_from=None,
+        released_to=None,
+        language=None,
+    ):
+        """
+        Rows matching every given filter, as an array of row indices, or
+        None when a genre filter names a genre the build had to drop
+        """
+        if self.dropped_genres.intersection(int(g) for g in (*genres_all, *genres_any, *genres_none)):
+            return None
+        n = len(self)
+        mask = np.ones(n, dtype=bool)
+
+        if genres_all:
+            bits, unknown = self.genre_mask(genres_all)
+            if unknown:
+                return np.empty(0, dtype=np.intp)
+            mask &= (self.genre_bits & bits) == bits
+        if genres_any:
+            bits, _ = self.genre_mask(genres_any)
+            mask &= (self.genre_bits & bits) != 0
+        if genres_none:
+            bits, _ = self.genre_mask(genres_none)
+            mask &= (self.genre_bits & bits) == 0
+        if keywords_all:
+            mask &= self._keyword_mask(keywords_all, match_all=True)
+        if keywords_any:
+            mask &= self._keyword_mask(keywords_any, match_all=False)
+        if keywords_none:
+            mask &= ~self._keyword_mask(keywords_none, match_all=False)
+        if min_votes is not None:
+            mask &= self.vote_count >= min_votes
+        if min_rating is not None:
+            mask &= self.vote_average >= min_rating
+        if year is not None:
+            mask &= self.years == year
+        if released_from is not None:
+            mask &= (self.release_days >= _days(released_from)) & (self.release_days != NO_DATE)
+        if released_to is not None:
+            mask &= (self.release_days <= _days(released_to)) & (self.release_days != NO_DATE)
+        if language is not None:
+            position = self.language_positions.get(language)
+            if position is None:
+                return np.empty(0, dtype=np.intp)
+            mask &= self.languages == position
+        return np.flatnonzero(mask)
+
+    def sort_key(self, rows, sort_by):
+        """Ascending float64 key for rows under a TMDB sort_by, or None if unsupported"""
+        field, _, direction = (sort_by or "popularity.desc").partition(".")
+        column = SORT_COLUMNS.get(field)
+        if column is None or direction not in ("asc", "desc"):
+            return None
+        values = getattr(self, column)[rows]
+        key = values.astype(np.float64)
+        if column == "release_days":
+            # Undated movies go last either way
+            key[values == NO_DATE] = np.inf if direction == "asc" else -np.inf
+        return -key if direction == "desc" else key
+
+    def page(self, rows, sort_by="popularity.desc", offset=0, limit=20):
+        """
+        Rows offset..offset+limit of `rows` in sort_by order, or None if the
+        sort is not supported
+
+        Only the first offset+limit rows are ordered (partition, then a sort
+        of those); ties are broken by TMDB ID, so pages never overlap.
+        """
+        key = self.sort_key(rows, sort_by)
+        if key is None:
+            return None
+        k = min(offset + limit, len(rows))
+        if k <= 0:
+            return rows[:0]
+        if k < len(rows):
+            # Everything at least as good as the k-th key, ties included
+            keep = key <= np.partition(key, k - 1)[k - 1]
+            rows, key = rows[keep], key[keep]
+        order = np.lexsort((self.ids[rows], key))
+        return rows[order][offset:offset + limit]
+
+
+def _root():
+    return Path(settings.CATALOG_ROOT)
+
+
+def build(movies, root=None):
+    """
+    Write a catalog build from (id, title, release_date, vote_average,
+    vote_count, popularity, genre_ids, keyword_ids, language) tuples and
+    publish it; returns the new build's path
+    """
+    ids, titles, release_days, years = [], [], [], []
+    vote_average, vote_count, popularity = [], [], []
+    genre_lists, keyword_lists, languages = [], [], []
+    for movie_id, title, release_date, rating, votes, pop, genre_ids, keyword_ids, language in movies:
+        if not str(movie_id).isdigit():
+            continue
+        ids.append(int(movie_id))
+        titles.append((title or "").casefold())
+        release_days.append(_days(release_date))
+        years.append(release_date.year if release_date else 0)
+        vote_average.append(rating or 0.0)
+        vote_count.append(votes or 0)
+        popularity.append(pop or 0.0)
+        genre_lists.append(genre_ids or [])
+        keyword_lists.append(keyword_ids or [])
+        languages.append(language or "")
+
+    # Rows sorted by ID, so a movie's row can be found with a binary search
+    order = np.argsort(np.asarray(ids, dtype=np.int64), kind="stable")
+    n = len(order)
+
+    genre_ids = sorted({g for genres in genre_lists for g in genres})
+    dropped_genres = genre_ids[64:]
+    if dropped_genres:
+        logger.warning("Catalog supports 64 genres, ignoring %d", len(dropped_genres))
+        genre_ids = genre_ids[:64]
+    genre_positions = {g: bit for bit, g in enumerate(genre_ids)}
+    genre_bits = np.zeros(n, dtype=np.uint64)
+    for row, i in enumerate(order):
+        bits = 0
+        for g in genre_lists[i]:
+            if g in genre_positions:
+                bits |= 1 << genre_positions[g]
+        genre_bits[row] = bits
+
+    language_codes = sorted(set(languages))
+    language_positions = {code: i for i, code in enumerate(language_codes)}
+
+    keyword_vocab = np.asarray(sorted({k for keywords in keyword_lists for k in keywords}), dtype=np.int32)
+    counts = np.asarray([len(set(keyword_lists[i])) for i in order], dtype=np.int64)
+    flat = np.asarray([k for i in order for k in sorted(set(keyword_lists[i]))], dtype=np.int32)
+    row_keywords = np.searchsorted(keyword_vocab, flat).astype(np.int32)
+    row_keyword_offsets = np.concatenate([[0], np.cumsum(counts)])
+    # Invert the row -> keyword lists into keyword -> row postings
+    owners = np.repeat(np.arange(n, dtype=np.int32), counts)
+    by_keyword = np.argsort(row_keywords, kind="stable")
+    keyword_rows = owners[by_keyword]
+    keyword_row_offsets = np.searchsorted(row_keywords[by_keyword], np.arange(len(keyword_vocab) + 1))
+
+    title_rank = np.empty(n, dtype=np.int32)
+    title_rank[np.argsort(np.asarray([titles[i] for i in order], dtype=object), kind="stable")] = np.arange(n)
+
+    def column(values):
+        return np.asarray(values)[order] if n else np.asarray(values)
+
+    columns = {
+        "ids": column(ids),
+        "years": column(years),
+        "release_days": column(release_days),
+        "vote_average": column(vote_average),
+        "vote_count": column(vote_count),
+        "popularity": column(popularity),
+        "title_rank": title_rank,
+        "genre_bits": genre_bits,
+        "languages": np.asarray([language_positions[languages[i]] for i in order]),
+        "keyword_vocab": keyword_vocab,
+        "row_keyword_offsets": row_keyword_offsets,
+        "row_keywords": row_keywords,
+        "keyword_row_offsets": keyword_row_offsets,
+        "keyword_rows": keyword_rows,
+    }
+    meta = {
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "movies": n,
+        "genres": genre_ids,
+        "dropped_genres": dropped_genres,
+        "languages": language_codes,
+        "keywords": len(keyword_vocab),
+    }
+    return _publish(columns, meta, Path(root) if root else _root())
+
+
+def _publish(columns, meta, root):
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=root, prefix=".build-"))
+    try:
+        for name, dtype in COLUMNS.items():
+            np.save(tmp / f"{name}.npy", np.ascontiguousarray(columns[name], dtype=dtype))
+        with open(tmp / "meta.json", "w") as f:
+            json.dump(meta, f)
+        path = root / datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+        os.rename(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    # Swap the symlink atomically; readers see the old build or the new one
+    link = root / f".{CURRENT}-{os.getpid()}"
+    if link.is_symlink():
+        link.unlink()
+    os.symlink(path.name, link)
+    os.replace(link, root / CURRENT)
+    _prune(root, keep=settings.CATALOG_KEEP_BUILDS)
+    logger.info("Published catalog %s: %d movies, %d keywords", path.name, meta["movies"], meta["keywords"])
+    return path
+
+
+def _prune(root, keep):
+    # Workers still mapping a deleted build keep reading it until they reload
+    builds = sorted(p for p in root.iterdir() if p.is_dir() and not p.is_symlink() and not p.name.startswith("."))
+    for path in builds[:-keep] if keep > 0 else []:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def build_from_movies(root=None):
+    """Build and publish a catalog from the Movie table"""
+    from .models import Movie
+
+    rows = (
+        Movie.objects.filter(adult=False)
+        .values_list(
+            "id", "title", "release_date", "vote_average", "vote_count",
+            "popularity", "genre_ids", "keyword_ids", "language",
+        )
+        .iterator(chunk_size=5000)
+    )
+    return build(rows, root=root)
+
+
+_catalog = None
+_checked = 0.0
+_lock = threading.Lock()
+
+
+def get_catalog():
+    """The published catalog, memory-mapped, or None when none has been built"""
+    global _catalog, _checked
+    if time.monotonic() - _checked < settings.CATALOG_REFRESH:
+        return _catalog
+    with _lock:
+        if time.monotonic() - _checked < settings.CATALOG_REFRESH:
+            return _catalog
+        _checked = time.monotonic()
+        try:
+            version = os.readlink(_root() / CURRENT)
+        except OSError:
+            _catalog = None
+            return None
+        if _catalog is None or _catalog.version != version:
+            try:
+                _catalog = Catalog.open(_root() / version)
+                logger.info("Loaded catalog %s (%d movies)", version, len(_catalog))
+            except (OSError, ValueError) as e:
+                logger.warning("Could not load catalog %s: %s", version, e)
+    return _catalog
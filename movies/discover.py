@@ -0,0 +1,277 @@
+"""
+TMDB /discover/movie answered from the local catalog
+
+discover_movies, get_movies_by_genre and get_trending_genres send filter
+combinations (genres x keywords x years x sorts x pages) that almost never
+repeat, so their cache hit rate is poor. When a catalog has been built
+(see catalog.py) the same parameters are evaluated locally: the catalog
+filters and sorts the IDs and only the requested page is read from the
+Movie table. Parameters the engine does not understand fall back to TMDB.
+
+TMDB is then only needed to keep the Movie table fresh: sync() fetches
+movies that changed on TMDB (/movie/changes), newly discovered ones and
+rows not refreshed for a while, then rebuilds the catalog.
+"""
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils.dateparse import parse_date
+
+from . import governor
+from .favorites import movie_from_tmdb
+from .models import Movie
+from .services import TMDBService
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 20
+MAX_PAGE = 500  # TMDB's limit
+
+# discover parameters handled locally; any other one goes to TMDB, as do
+# requests for translated titles (Movie rows hold TMDB's default language)
+# or for video releases (never synced)
+DEFAULT_LANGUAGES = {"en", "en-US"}
+SUPPORTED_PARAMS = {
+    "page", "sort_by", "with_genres", "without_genres", "with_keywords", "without_keywords",
+    "vote_count.gte", "vote_average.gte", "primary_release_year",
+    "primary_release_date.gte", "primary_release_date.lte",
+    "release_date.gte", "release_date.lte", "with_original_language",
+    "include_adult", "include_video", "language",
+}
+
+# Movie columns written by a sync
+SYNC_FIELDS = [
+    "title", "year", "genres", "language", "runtime", "overview", "poster_url", "release_date",
+    "genre_ids", "keyword_ids", "vote_average", "vote_count", "popularity", "poster_path",
+    "backdrop_path", "adult", "synced_at",
+]
+
+
+def _id_list(value):
+    """
+    (IDs, match_any) for a TMDB list parameter: "1,2" means all of them,
+    "1|2" any of them; None if it is not a list of IDs
+    """
+    text = str(value).strip()
+    match_any = "|" in text
+    parts = [p.strip() for p in text.replace("|", ",").split(",") if p.strip()]
+    if not all(p.isdigit() for p in parts):
+        return None, False
+    return [int(p) for p in parts], match_any
+
+
+def _filters(params):
+    """Catalog.filter() arguments for discover params, or None if not supported"""
+    if set(params) - SUPPORTED_PARAMS or str(params.get("include_adult", "false")).lower() != "false":
+        return None
+    if str(params.get("include_video", "false")).lower() != "false":
+        return None
+    if params.get("language") not in (None, "", *DEFAULT_LANGUAGES):
+        return None
+    filters = {}
+    for name, all_key, any_key in (
+        ("with_genres", "genres_all", "genres_any"),
+        ("with_keywords", "keywords_all", "keywords_any"),
+    ):
+        if params.get(name) not in (None, ""):
+            ids, match_any = _id_list(params[name])
+            if ids is None:
+                return None
+            filters[any_key if match_any else all_key] = ids
+    for name, key in (("without_genres", "genres_none"), ("without_keywords", "keywords_none")):
+        if params.get(name) not in (None, ""):
+            ids, _ = _id_list(params[name])
+            if ids is None:
+                return None
+            filters[key] = ids
+
+    try:
+        if params.get("vote_count.gte") not in (None, ""):
+            filters["min_votes"] = int(params["vote_count.gte"])
+        if params.get("vote_average.gte") not in (None, ""):
+            filters["min_rating"] = float(params["vote_average.gte"])
+        if params.get("primary_release_year") not in (None, ""):
+            filters["year"] = int(params["primary_release_year"])
+    except (TypeError, ValueError):
+        return None
+    for prefix in ("primary_release_date", "release_date"):
+        for suffix, key in (("gte", "released_from"), ("lte", "released_to")):
+            value = params.get(f"{prefix}.{suffix}")
+            if value:
+                try:
+                    parsed = parse_date(str(value))
+                except ValueError:  # well formed but not a date, e.g. 2019-13-45
+                    return None
+                if parsed is None:
+                    return None
+                filters[key] = parsed
+    if params.get("with_original_language"):
+        filters["language"] = str(params["with_original_language"])
+    return filters
+
+
+def _as_result(movie):
+    """A Movie row in the shape of a TMDB discover result"""
+    return {
+        "adult": movie.adult,
+        "backdrop_path": movie.backdrop_path,
+        "genre_ids": movie.genre_ids,
+        "id": int(movie.id),
+        "original_language": movie.language,
+        "original_title": movie.title,
+        "overview": movie.overview or "",
+        "popularity": movie.popularity or 0,
+        "poster_path": movie.poster_path,
+        "release_date": movie.release_date.isoformat() if movie.release_date else "",
+        "title": movie.title,
+        "video": False,
+        "vote_average": movie.vote_average or 0,
+        "vote_count": movie.vote_count or 0,
+    }
+
+
+def discover(params):
+    """
+    A /discover/movie page computed locally, in TMDB's response shape
+
+    Returns None when local discover is off, no catalog (or too small a
+    one) is available, or the parameters (or genres) are not supported.
+    """
+    if not settings.LOCAL_DISCOVER_ENABLED:
+        return None
+    # Imported here: numpy stays off the worker boot path
+    from .catalog import get_catalog
+
+    catalog = get_catalog()
+    if catalog is None or len(catalog) < settings.LOCAL_DISCOVER_MIN_MOVIES:
+        return None
+    filters = _filters(params)
+    if filters is None:
+        return None
+    try:
+        page = max(1, int(params.get("page") or 1))
+    except (TypeError, ValueError):
+        return None
+
+    rows = catalog.filter(**filters)
+    if rows is None:
+        return None
+    page_rows = catalog.page(rows, params.get("sort_by") or "popularity.desc", (page - 1) * PAGE_SIZE, PAGE_SIZE)
+    if page_rows is None:
+        return None
+
+    ids = [str(movie_id) for movie_id in catalog.ids[page_rows].tolist()]
+    movies = Movie.objects.in_bulk(ids)
+    return {
+        "page": page,
+        # A movie deleted since the build is simply left out
+        "results": [_as_result(movies[movie_id]) for movie_id in ids if movie_id in movies],
+        "total_pages": min(MAX_PAGE, math.ceil(len(rows) / PAGE_SIZE)),
+        "total_results": len(rows),
+    }
+
+
+def _changed_ids(tmdb_service, days):
+    """IDs of movies TMDB reports as changed in the last `days` days (at most 14)"""
+    end = date.today()
+    params = {"start_date": (end - timedelta(days=min(days, 14))).isoformat(), "end_date": end.isoformat(), "page": 1}
+    ids = []
+    while True:
+        data = tmdb_service._fetch("/movie/changes", params)
+        ids.extend(r["id"] for r in data.get("results", []) if not r.get("adult"))
+        if params["page"] >= data.get("total_pages", 0):
+            return ids
+        params["page"] += 1
+
+
+def _discovered_ids(tmdb_service, years, pages, min_votes):
+    """IDs of the most popular movies of each year, to pick up new ones"""
+    ids = []
+    for year in years:
+        for page in range(1, pages + 1):
+            data = tmdb_service._fetch("/discover/movie", {
+                "primary_release_year": year,
+                "sort_by": "popularity.desc",
+                "vote_count.gte": min_votes,
+                "page": page,
+            })
+            ids.extend(r["id"] for r in data.get("results", []))
+            if page >= data.get("total_pages", 0):
+                break
+    return ids
+
+
+def refresh_movies(movie_ids, workers=4):
+    """
+    Fetch details and keywords for movies straight from TMDB (bypassing
+    the cache) and upsert their Movie rows; returns (updated, failed)
+    """
+    tmdb_service = TMDBService()
+
+    def fetch(movie_id):
+        try:
+            return movie_from_tmdb(tmdb_service._fetch(f"/movie/{movie_id}", {"append_to_response": "keywords"}))
+        except Exception as e:
+            logger.warning("Could not refresh movie %s: %s", movie_id, e)
+            return None
+        finally:
+            connection.close()
+
+    movie_ids = list(dict.fromkeys(int(m) for m in movie_ids))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        movies = [m for m in pool.map(governor.bind(fetch), movie_ids) if m is not None]
+    for start in range(0, len(movies), 500):
+        Movie.objects.bulk_create(
+            movies[start:start + 500],
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=SYNC_FIELDS,
+        )
+    return len(movies), len(movie_ids) - len(movies)
+
+
+def sync(changed_days=1, years=(), pages=5, min_votes=10, stale_days=None, movie_ids=(), workers=4, build=True):
+    """
+    Bring the Movie table up to date with TMDB and rebuild the catalog
+
+    Refreshes movies changed on TMDB in the last changed_days days that we
+    already have, the top `pages` discover pages of each of `years`, rows
+    not synced for stale_days days and movie_ids. Runs at background
+    priority. Returns (updated, failed).
+    """
+    from .catalog import build_from_movies
+
+    tmdb_service = TMDBService()
+    start = time.monotonic()
+    with governor.priority(governor.BACKGROUND):
+        wanted = list(movie_ids)
+        if changed_days:
+            changed = _changed_ids(tmdb_service, changed_days)
+            # /movie/changes lists every movie on TMDB; only follow ones we store
+            known = set()
+            for chunk in range(0, len(changed), 5000):
+                known.update(Movie.objects.filter(
+                    id__in=[str(m) for m in changed[chunk:chunk + 5000]]
+                ).values_list("id", flat=True))
+            wanted.extend(int(m) for m in known)
+        if years:
+            discovered = _discovered_ids(tmdb_service, years, pages, min_votes)
+            existing = set(Movie.objects.filter(
+                id__in=[str(m) for m in discovered]
+            ).values_list("id", flat=True))
+            wanted.extend(m for m in discovered if str(m) not in existing)
+        if stale_days:
+            cutoff = date.today() - timedelta(days=stale_days)
+            stale = Movie.objects.exclude(synced_at__date__gte=cutoff).values_list("id", flat=True)
+            wanted.extend(int(m) for m in stale if m.isdigit())
+        updated, failed = refresh_movies(wanted, workers=workers) if wanted else (0, 0)
+
+    logger.info("Synced %d movies (%d failed) in %.1fs", updated, failed, time.monotonic() - start)
+    if build:
+        build_from_movies()
+    return updated, failed
@@ -0,0 +1,309 @@
+"""
+Offline evaluation of recommendation quality against latency
+
+A fixture set of recommendation requests is replayed through
+RecommendationView under several configurations (setting overrides, e.g.
+local filters, streaming, smaller prompts, no reranking). TMDB and LLM
+traffic goes through a CassetteAdapter mounted on the shared upstream
+sessions, so every configuration sees the same recorded responses and the
+upstream calls it makes can be counted.
+
+Each case is a JSON object (one per line):
+    {"movie_ids": [...], "preferences": {...}, "held_out": [...]}
+held_out are favorites not given as seeds; precision@k and recall@k are
+measured against them, genre overlap against their genres and keyword
+overlap between the analysis keywords and their TMDB keywords.
+"""
+import hashlib
+import io
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from unittest import mock
+from urllib.parse import parse_qsl, urlsplit, urlunsplit, urlencode
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from rest_framework.test import APIRequestFactory
+
+from . import recommendations
+from .extractor import extract_filters
+from .resilience import get_session
+from .resolution import normalize
+
+logger = logging.getLogger(__name__)
+
+# Upstream sessions the cassette is mounted on
+SESSIONS = ["tmdb", "llm", "tmdb_images"]
+
+# Settings every run shares: a private in-memory cache, and nothing that
+# writes outside the run or paces calls against the real rate limit
+BASE_OVERRIDES = {
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "evaluation"}},
+    "TMDB_STORE_ENABLED": False,
+    "TMDB_GOVERNOR_ENABLED": False,
+    "LLM_BATCH_ENABLED": False,
+    "LOCAL_DISCOVER_ENABLED": False,
+}
+
+# name -> setting overrides; "FILTERS": "local" skips the LLM entirely,
+# local-discover answers discover from the catalog built on this machine
+CONFIGURATIONS = {
+    "baseline": {},
+    "stream": {"LLM_STREAM_ENABLED": True},
+    "local-filters": {"FILTERS": "local"},
+    "small-prompt": {"LLM_PROMPT_TOKEN_BUDGET": 600, "LLM_MAX_SEED_MOVIES": 4},
+    "no-rerank": {"RERANK_ENABLED": False},
+    "local-discover": {"LOCAL_DISCOVER_ENABLED": True},
+}
+
+
+class CassetteMiss(requests.ConnectionError):
+    """A request with no recorded response, in replay-only mode"""
+
+
+def request_signature(request):
+    """Stable key for a prepared request: method, URL with sorted query, body digest"""
+    parts = urlsplit(request.url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    signature = f"{request.method} {urlunsplit(parts._replace(query=query, fragment=''))}"
+    body = request.body
+    if body:
+        if isinstance(body, str):
+            body = body.encode()
+        signature += f" {hashlib.sha1(body).hexdigest()}"
+    return signature
+
+
+class CassetteAdapter(BaseAdapter):
+    """
+    requests adapter answering from recorded responses
+
+    With record=True, requests missing from the cassette go to the network
+    and their responses are added. Request headers (and so credentials)
+    are never stored. With simulate_latency, replies take as long as they
+    did when recorded.
+    """
+
+    def __init__(self, entries=None, record=False, simulate_latency=False):
+        super().__init__()
+        self.entries = entries if entries is not None else {}
+        self.record = record
+        self.simulate_latency = simulate_latency
+        self.calls = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self._http = HTTPAdapter() if record else None
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = {}
+        return cls(entries, **kwargs)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls.clear()
+            self.misses.clear()
+
+    def send(self, request, **kwargs):
+        host = urlsplit(request.url).hostname
+        signature = request_signature(request)
+        with self._lock:
+            self.calls[host] += 1
+            entry = self.entries.get(signature)
+
+        if entry is None:
+            if not self.record:
+                with self._lock:
+                    self.misses[host] += 1
+                raise CassetteMiss(f"No recorded response for {signature}", request=request)
+            start = time.monotonic()
+            live = self._http.send(request, **kwargs)
+            entry = {
+                "status": live.status_code,
+                "headers": {k: v for k, v in live.headers.items() if k.lower() in ("content-type", "retry-after")},
+                "body": live.content.decode(live.encoding or "utf-8", errors="replace"),
+                "elapsed": round(time.monotonic() - start, 4),
+            }
+            with self._lock:
+                self.entries[signature] = entry
+        elif self.simulate_latency:
+            time.sleep(entry.get("elapsed", 0))
+
+        return self._build_response(request, entry)
+
+    def _build_response(self, request, entry):
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = get_encoding_from_headers(response.headers) or "utf-8"
+        # A file-like raw body also serves stream=True / iter_lines readers
+        response.raw = io.BytesIO(entry["body"].encode(response.encoding))
+        response.url = request.url
+        response.request = request
+        response.reason = "Recorded"
+        return response
+
+    def close(self):
+        if self._http is not None:
+            self._http.close()
+
+
+def load_cases(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a | b else None
+
+
+def score_case(case, response_data, held_out_movies, k):
+    """Quality metrics of one recommendation response"""
+    results = (response_data.get("recommendations") or {}).get("results", [])[:k]
+    recommended = {str(r["id"]) for r in results}
+    held_out = {str(m) for m in case.get("held_out", [])}
+
+    held_out_genres = {g["id"] for m in held_out_movies for g in m.get("genres", [])}
+    held_out_keywords = {
+        normalize(kw["name"]) for m in held_out_movies for kw in m.get("keywords", {}).get("keywords", [])
+    }
+    analysis_keywords = {normalize(kw) for kw in response_data.get("analysis", {}).get("keywords", []) if kw}
+
+    hits = len(recommended & held_out)
+    return {
+        "precision": hits / k if held_out else None,
+        "recall": hits / len(held_out) if held_out else None,
+        "genre_overlap": _jaccard({g for r in results for g in r.get("genre_ids", [])}, held_out_genres)
+        if held_out_movies else None,
+        "keyword_overlap": len(analysis_keywords & held_out_keywords) / len(analysis_keywords)
+        if analysis_keywords and held_out_movies else None,
+        "source": response_data.get("analysis", {}).get("source"),
+    }
+
+
+def _local_filters(preferences, movie_data_list):
+    return extract_filters(preferences, movie_data_list), "local"
+
+
+def run_configuration(name, overrides, cases, adapter, k=10, warm=False):
+    """Replay every case under one configuration; returns the aggregated row"""
+    from .utils import fetch_movie_details_with_keywords
+    from .views import RecommendationView
+
+    # The anonymous rate limit would stop a replay after a handful of cases
+    view = RecommendationView.as_view(throttle_classes=[])
+    factory = APIRequestFactory()
+    overrides = dict(overrides)
+    filters = overrides.pop("FILTERS", "llm")
+    rows = []
+
+    with ExitStack() as stack:
+        stack.enter_context(override_settings(**BASE_OVERRIDES, **overrides))
+        if filters == "local":
+            stack.enter_context(mock.patch.object(recommendations, "get_filters", _local_filters))
+        cache.clear()
+
+        for case in cases:
+            # Held-out details are scoring data, not part of the measured request
+            held_out = case.get("held_out") or []
+            held_out_movies = fetch_movie_details_with_keywords(held_out) if held_out else []
+            if not warm:
+                cache.clear()
+            adapter.reset_counts()
+
+            request = factory.post(
+                "/api/recommendations/",
+                {"movie_ids": case["movie_ids"], "preferences": case["preferences"]},
+                format="json",
+            )
+            start = time.perf_counter()
+            response = view(request)
+            latency = time.perf_counter() - start
+
+            row = {
+                "status": response.status_code,
+                "latency_ms": latency * 1000,
+                "calls": dict(adapter.calls),
+                "misses": sum(adapter.misses.values()),
+            }
+            if response.status_code == 200:
+                row.update(score_case(case, response.data, held_out_movies, k))
+            rows.append(row)
+
+    ok = [r for r in rows if r["status"] == 200]
+    latencies = [r["latency_ms"] for r in rows]
+    calls = Counter()
+    for r in rows:
+        calls.update(r["calls"])
+    llm_host = urlsplit(settings.LLM_API_BASE_URL).hostname
+    llm_calls = calls.get(llm_host, 0)
+    return {
+        "configuration": name,
+        "cases": len(rows),
+        "errors": len(rows) - len(ok),
+        f"precision@{k}": _mean([r["precision"] for r in ok]),
+        f"recall@{k}": _mean([r["recall"] for r in ok]),
+        "genre_overlap": _mean([r["genre_overlap"] for r in ok]),
+        "keyword_overlap": _mean([r["keyword_overlap"] for r in ok]),
+        "latency_mean_ms": _mean(latencies),
+        "latency_p50_ms": _percentile(latencies, 50),
+        "latency_p95_ms": _percentile(latencies, 95),
+        "tmdb_calls_per_case": (sum(calls.values()) - llm_calls) / len(rows) if rows else None,
+        "llm_calls_per_case": llm_calls / len(rows) if rows else None,
+        "upstream_calls_per_case": {host: n / len(rows) for host, n in calls.items()} if rows else {},
+        "cassette_misses": sum(r["misses"] for r in rows),
+        "filter_sources": dict(Counter(r.get("source") for r in ok)),
+    }
+
+
+def evaluate(cases, configurations, cassette_path, k=10, record=False, simulate_latency=False, warm=False):
+    """
+    Run every configuration over the cases with the cassette mounted on the
+    upstream sessions; returns one report row per configuration
+    """
+    adapter = CassetteAdapter.load(cassette_path, record=record, simulate_latency=simulate_latency)
+    sessions = [get_session(name) for name in SESSIONS]
+    originals = [session.adapters.copy() for session in sessions]
+    for session in sessions:
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    try:
+        return [
+            run_configuration(name, overrides, cases, adapter, k=k, warm=warm)
+            for name, overrides in configurations.items()
+        ]
+    finally:
+        for session, adapters in zip(sessions, originals):
+            session.adapters = adapters
+        if record:
+            adapter.save(cassette_path)
+        adapter.close()
@@ -0,0 +1,55 @@
+"""
+Exceptions raised by upstream services and the DRF handler that maps them to responses
+"""
+import requests
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream (TMDB, LLM) is failing fast because its circuit is open"""
+
+    def __init__(self, upstream, retry_after=None):
+        self.upstream = upstream
+        self.retry_after = retry_after
+        super().__init__(f"{upstream} is temporarily unavailable")
+
+
+class UpstreamRateLimited(UpstreamUnavailable):
+    """Raised when no upstream call slot (see movies.governor) could be had in time"""
+
+
+class NoSeedMovies(Exception):
+    """Raised when none of the seed movies for a recommendation could be loaded"""
+
+
+def upstream_exception_handler(exc, context):
+    """
+    Translate upstream failures into gateway errors instead of bare 500s
+
+    Open circuits become 503 with Retry-After, upstream timeouts 504 and
+    other upstream HTTP errors 502. Everything else goes to DRF's handler.
+    """
+    if isinstance(exc, UpstreamUnavailable):
+        response = Response(
+            {"error": str(exc)},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        if exc.retry_after:
+            response["Retry-After"] = str(int(exc.retry_after))
+        return response
+
+    if isinstance(exc, requests.Timeout):
+        return Response(
+            {"error": "Upstream request timed out"},
+            status=status.HTTP_504_GATEWAY_TIMEOUT
+        )
+
+    if isinstance(exc, requests.RequestException):
+        return Response(
+            {"error": f"Upstream request failed: {exc}"},
+            status=status.HTTP_502_BAD_GATEWAY
+        )
+
+    return exception_handler(exc, context)
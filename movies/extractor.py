@@ -0,0 +1,140 @@
+"""
+Deterministic, LLM-free recommendation filter extraction
+
+Used as a fallback tier when the LLM is slow, rate-limited or its circuit
+is open. Builds the same shape _parse_llm_response returns from the seed
+movies alone: genre frequency, keyword TF-IDF across seeds and simple
+mood -> genre/keyword rules. Pure Python over a handful of seeds, so it
+answers in well under a few milliseconds.
+"""
+import math
+import re
+from collections import Counter
+
+# Mood words -> genres and keywords that usually go with them
+MOOD_RULES = {
+    "dark": {"genres": ["Thriller", "Crime", "Horror"], "keywords": ["neo-noir", "revenge"]},
+    "gritty": {"genres": ["Crime", "Drama"], "keywords": ["neo-noir", "gangster"]},
+    "intense": {"genres": ["Thriller", "Action"], "keywords": ["suspense"]},
+    "tense": {"genres": ["Thriller", "Mystery"], "keywords": ["suspense"]},
+    "scary": {"genres": ["Horror"], "keywords": ["supernatural"]},
+    "creepy": {"genres": ["Horror", "Mystery"], "keywords": ["supernatural"]},
+    "funny": {"genres": ["Comedy"], "keywords": []},
+    "light": {"genres": ["Comedy", "Family"], "keywords": []},
+    "lighthearted": {"genres": ["Comedy", "Family"], "keywords": []},
+    "feel good": {"genres": ["Comedy", "Romance", "Family"], "keywords": ["feel-good"]},
+    "romantic": {"genres": ["Romance"], "keywords": ["love"]},
+    "emotional": {"genres": ["Drama", "Romance"], "keywords": []},
+    "sad": {"genres": ["Drama"], "keywords": ["tragedy"]},
+    "uplifting": {"genres": ["Drama", "Family"], "keywords": ["inspirational"]},
+    "inspiring": {"genres": ["Drama", "History"], "keywords": ["inspirational", "based on true story"]},
+    "epic": {"genres": ["Adventure", "War", "Fantasy"], "keywords": ["epic"]},
+    "exciting": {"genres": ["Action", "Adventure"], "keywords": []},
+    "action packed": {"genres": ["Action"], "keywords": []},
+    "mind bending": {"genres": ["Science Fiction", "Mystery", "Thriller"], "keywords": ["twist ending"]},
+    "cerebral": {"genres": ["Science Fiction", "Drama", "Mystery"], "keywords": ["philosophy"]},
+    "smart": {"genres": ["Mystery", "Thriller", "Drama"], "keywords": ["twist ending"]},
+    "twist": {"genres": ["Mystery", "Thriller"], "keywords": ["twist ending"]},
+    "psychological": {"genres": ["Thriller", "Drama"], "keywords": ["psychological thriller"]},
+    "nostalgic": {"genres": ["Family", "Adventure"], "keywords": ["coming of age"]},
+    "whimsical": {"genres": ["Fantasy", "Family", "Animation"], "keywords": []},
+    "classic": {"genres": [], "keywords": [], "sort_by": "vote_average.desc"},
+    "acclaimed": {"genres": [], "keywords": [], "sort_by": "vote_average.desc"},
+}
+
+# TMDB keywords that describe production trivia rather than taste
+STOP_KEYWORDS = {
+    "duringcreditsstinger",
+    "aftercreditsstinger",
+    "woman director",
+    "based on novel or book",
+    "sequel",
+    "remake",
+    "independent film",
+    "3d",
+    "imax",
+}
+
+_WORDS = re.compile(r"[a-z]+")
+
+MAX_GENRES = 3
+MAX_KEYWORDS = 3
+
+
+def _mood_rules(preferences):
+    text = " ".join([
+        str(preferences.get("mood") or ""),
+        str(preferences.get("description") or ""),
+    ]).lower().replace("-", " ")
+    words = " ".join(_WORDS.findall(text))
+    padded = f" {words} "
+    return [(mood, rule) for mood, rule in MOOD_RULES.items() if f" {mood} " in padded]
+
+
+def extract_filters(preferences, movie_data_list):
+    """
+    Build recommendation filters without an LLM
+
+    Args:
+        preferences: dict with 'genres', 'mood', 'description'
+        movie_data_list: list of movie detail dictionaries (with keywords)
+
+    Returns:
+        dict with themes, genres, keywords, mood, and tmdbFilters
+    """
+    seeds = len(movie_data_list) or 1
+    matched = _mood_rules(preferences)
+    rules = [rule for _, rule in matched]
+
+    # Genres: share of seeds carrying the genre, boosted by stated
+    # preferences and mood rules
+    genre_scores = Counter()
+    for movie in movie_data_list:
+        for genre in {g["name"] for g in movie.get("genres", []) if g.get("name")}:
+            genre_scores[genre] += 1 / seeds
+    for genre in preferences.get("genres", []):
+        genre_scores[genre] += 1.0
+    for rule in rules:
+        for genre in rule["genres"]:
+            genre_scores[genre] += 0.5
+
+    # Keywords: TF-IDF with seeds as documents; df * log(1 + N / df) still
+    # favors recurring keywords but with diminishing returns
+    keyword_df = Counter()
+    for movie in movie_data_list:
+        names = {k["name"] for k in movie.get("keywords", {}).get("keywords", []) if k.get("name")}
+        keyword_df.update(name for name in names if name.lower() not in STOP_KEYWORDS)
+    keyword_scores = Counter({
+        name: df * math.log(1 + seeds / df) for name, df in keyword_df.items()
+    })
+    for rule in rules:
+        for keyword in rule["keywords"]:
+            if keyword in keyword_scores:
+                keyword_scores[keyword] *= 1.5
+
+    ranked_genres = [g for g, _ in genre_scores.most_common()]
+    top_score = genre_scores[ranked_genres[0]] if ranked_genres else 0
+    with_genres = [g for g in ranked_genres[:MAX_GENRES] if genre_scores[g] >= 0.4 * top_score]
+    ranked_keywords = [k for k, _ in keyword_scores.most_common()]
+    # Only keywords at least two seeds share are used as discover filters
+    with_keywords = [k for k in ranked_keywords if keyword_df[k] > 1][:MAX_KEYWORDS]
+
+    sort_by = "popularity.desc"
+    for rule in rules:
+        sort_by = rule.get("sort_by", sort_by)
+
+    mood = preferences.get("mood") or ""
+    if not mood or mood == "Not specified":
+        mood = ", ".join(m for m, _ in matched) or "Not specified"
+
+    return {
+        "tmdbFilters": {
+            "sort_by": sort_by,
+            "with_genres": with_genres,
+            "with_keywords": with_keywords,
+        },
+        "themes": ranked_keywords[:5],
+        "genres": with_genres,
+        "keywords": ranked_keywords[:10],
+        "mood": mood,
+    }
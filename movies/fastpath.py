@@ -0,0 +1,99 @@
+"""
+Fast path for the read-only movie endpoints
+
+The movie endpoints are stateless, AllowAny and JSON-only, yet every
+request used to run the full middleware stack (sessions, CSRF, auth,
+messages, clickjacking, whitenoise) and DRF's per-request content
+negotiation, authentication and throttle instantiation.
+
+- ReadOnlyJSONView is an APIView that always renders JSON, skips
+  authentication and reuses one throttle instance per class.
+- FastPathMiddleware sits right after CORS and security middleware and
+  dispatches GET/HEAD requests for ReadOnlyJSONView routes straight to the
+  view, skipping the rest of the stack.
+
+Both are switched off with FAST_PATH_ENABLED=False (manage.py
+benchmark_requests compares the two).
+"""
+import threading
+
+from django.conf import settings
+from django.urls import Resolver404, get_resolver
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
+
+_JSON_RENDERER = JSONRenderer()
+_FAST_METHODS = ("GET", "HEAD")
+
+
+class ReadOnlyJSONView(APIView):
+    """APIView for public, read-only JSON endpoints"""
+
+    authentication_classes = []
+    _throttles = None
+    _throttles_lock = threading.Lock()
+
+    def perform_content_negotiation(self, request, force=False):
+        if not settings.FAST_PATH_ENABLED:
+            return super().perform_content_negotiation(request, force)
+        return _JSON_RENDERER, _JSON_RENDERER.media_type
+
+    def perform_authentication(self, request):
+        # Nothing here reads request.user; leave it to be resolved lazily
+        if not settings.FAST_PATH_ENABLED:
+            super().perform_authentication(request)
+
+    def get_throttles(self):
+        if not settings.FAST_PATH_ENABLED:
+            return super().get_throttles()
+        # Throttle classes keep no per-request state, so one instance per
+        # view class is shared by every request
+        cls = type(self)
+        if cls.__dict__.get("_throttles") is None:
+            with cls._throttles_lock:
+                if cls.__dict__.get("_throttles") is None:
+                    cls._throttles = super().get_throttles()
+        return cls._throttles
+
+
+class FastPathMiddleware:
+    """Dispatch read-only API requests directly to their ReadOnlyJSONView"""
+
+    # Only paths of fast views without URL parameters are remembered, so
+    # the size is bounded by the number of such routes (a route like
+    # images/<size>/<filename> would add a key per distinct URL)
+    _matches = {}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.FAST_PATH_ENABLED or request.method not in _FAST_METHODS:
+            return self.get_response(request)
+
+        match = self._resolve(request.path_info)
+        if match is None:
+            return self.get_response(request)
+
+        # CommonMiddleware is skipped, so validate the Host header here
+        request.get_host()
+        request.resolver_match = match
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, "render") and callable(response.render):
+            response = response.render()
+        return response
+
+    def _resolve(self, path):
+        match = self._matches.get(path)
+        if match is not None:
+            return match
+        try:
+            match = get_resolver().resolve(path)
+        except Resolver404:
+            return None
+        view_class = getattr(match.func, "view_class", None)
+        if view_class is None or not issubclass(view_class, ReadOnlyJSONView):
+            return None
+        if not match.args and not match.kwargs:
+            self._matches[path] = match
+        return match
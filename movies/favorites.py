@@ -0,0 +1,92 @@
+"""
+Bulk persistence of user favorites
+"""
+import hashlib
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .images import poster_url
+from .models import Favorite, Movie
+from .profiles import apply_favorites_change
+from .services import TMDBService
+
+logger = logging.getLogger(__name__)
+
+
+def movie_from_tmdb(details):
+    """Build a Movie row from a TMDB movie details payload"""
+    release_date = details.get("release_date") or ""
+    keywords = details.get("keywords") or {}
+    return Movie(
+        id=str(details["id"]),
+        title=details.get("title") or details.get("original_title") or "Unknown",
+        year=int(release_date[:4]) if release_date[:4].isdigit() else None,
+        genres=[g["name"] for g in details.get("genres", [])],
+        language=details.get("original_language"),
+        runtime=details.get("runtime"),
+        overview=details.get("overview"),
+        poster_url=poster_url(details.get("poster_path")),
+        release_date=parse_date(release_date) if release_date else None,
+        genre_ids=[g["id"] for g in details.get("genres", [])],
+        keyword_ids=[k["id"] for k in keywords.get("keywords", [])],
+        vote_average=details.get("vote_average"),
+        vote_count=details.get("vote_count"),
+        popularity=details.get("popularity"),
+        poster_path=details.get("poster_path"),
+        backdrop_path=details.get("backdrop_path"),
+        adult=bool(details.get("adult")),
+        synced_at=timezone.now(),
+    )
+
+
+def favorite_id(user, movie_id):
+    # Deterministic primary key so re-adding a favorite is a no-op; hashed
+    # when user and movie IDs together would not fit the column
+    key = f"{user.id}:{movie_id}"
+    if len(key) > Favorite._meta.get_field("id").max_length:
+        return hashlib.sha1(key.encode()).hexdigest()
+    return key
+
+
+def add_favorites(user, movie_ids):
+    """
+    Add movies to a user's favorites in one transaction
+
+    Movies we have not stored yet are fetched from TMDB (cached, in one
+    batch) before the transaction starts. Returns the list of movie IDs
+    that were favorited.
+    """
+    movie_ids = list(dict.fromkeys(str(m) for m in movie_ids))
+    existing = set(Movie.objects.filter(id__in=movie_ids).values_list("id", flat=True))
+
+    new_movies = []
+    missing = [m for m in movie_ids if m not in existing]
+    if missing:
+        details, errors = TMDBService().get_movies_with_keywords(missing)
+        for movie_id, e in errors.items():
+            logger.warning("Error fetching movie %s: %s", movie_id, e)
+        new_movies = [movie_from_tmdb(movie) for movie in details]
+
+    known = existing | {movie.id for movie in new_movies}
+    valid_ids = [m for m in movie_ids if m in known]
+    with transaction.atomic():
+        Movie.objects.bulk_create(new_movies, ignore_conflicts=True)
+        Favorite.objects.bulk_create(
+            [Favorite(id=favorite_id(user, m), user=user, movie_id=m) for m in valid_ids],
+            ignore_conflicts=True,
+        )
+    # Counts only favorites no other request has counted yet
+    apply_favorites_change(user, valid_ids, 1)
+    return valid_ids
+
+
+def remove_favorites(user, movie_ids):
+    """Remove movies from a user's favorites; returns the number removed"""
+    movie_ids = [str(m) for m in movie_ids]
+    removed_ids = list(
+        Favorite.objects.filter(user=user, movie_id__in=movie_ids).values_list("movie_id", flat=True)
+    )
+    return apply_favorites_change(user, removed_ids, -1)
@@ -0,0 +1,289 @@
+"""
+Cluster-wide pacing of outgoing TMDB calls
+
+Every worker on every node shares one TMDB token, so calls are paced by a
+token bucket kept in Redis and updated atomically by a Lua script. A call
+that finds the bucket empty sleeps until a token is due instead of
+failing; only if that would take longer than its priority allows does it
+give up with UpstreamRateLimited (a 503 with Retry-After, or stale data).
+
+- Priorities: interactive calls (user requests, the default) may drain the
+  bucket, background calls (materialize_trending, ...) leave
+  TMDB_GOVERNOR_BACKGROUND_RESERVE of it for them. Set with
+  `with priority(BACKGROUND):`.
+- Adaptation: a 429 (or X-RateLimit-Remaining: 0) pauses every worker
+  until Retry-After/X-RateLimit-Reset and halves the refill rate, which
+  then recovers linearly towards TMDB_GOVERNOR_RATE.
+- Metrics: calls, queued calls and wait times per priority and minute are
+  counted by the same script; see metrics().
+"""
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .exceptions import UpstreamRateLimited
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = [INTERACTIVE, BACKGROUND]
+
+BUCKET_KEY = "tmdb:governor:bucket"
+METRICS_TTL = 3600 * 6
+
+_priority = contextvars.ContextVar("tmdb_priority", default=INTERACTIVE)
+
+# Refill, take one token (keeping `floor` tokens for higher priorities) and
+# return the seconds to wait, "0" when a token was taken. Successful
+# acquisitions are counted in the per-minute metrics hash.
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local max_rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local floor = tonumber(ARGV[3])
+local recovery = tonumber(ARGV[6])
+
+local s = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate', 'paused_until')
+local ts = tonumber(s[2]) or now
+local elapsed = math.max(0, now - ts)
+local rate = math.min(max_rate, (tonumber(s[3]) or max_rate) + recovery * elapsed)
+local tokens = math.min(burst, (tonumber(s[1]) or burst) + rate * elapsed)
+local paused_until = tonumber(s[4]) or 0
+
+local wait = 0
+if now < paused_until then
+  wait = paused_until - now
+elseif tokens - 1 >= floor then
+  tokens = tokens - 1
+else
+  wait = (floor + 1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now), 'rate', tostring(rate))
+redis.call('EXPIRE', KEYS[1], 3600)
+
+if wait == 0 then
+  local waited = tonumber(ARGV[5])
+  redis.call('HINCRBY', KEYS[2], 'calls:' .. ARGV[4], 1)
+  if waited > 0 then
+    redis.call('HINCRBY', KEYS[2], 'queued:' .. ARGV[4], 1)
+    redis.call('HINCRBY', KEYS[2], 'wait_ms:' .. ARGV[4], waited)
+    if waited > (tonumber(redis.call('HGET', KEYS[2], 'wait_ms_max:' .. ARGV[4])) or 0) then
+      redis.call('HSET', KEYS[2], 'wait_ms_max:' .. ARGV[4], waited)
+    end
+  end
+  redis.call('EXPIRE', KEYS[2], tonumber(ARGV[7]))
+end
+return tostring(wait)
+"""
+
+# Empty the bucket, pause everyone for ARGV[1] seconds and cut the rate
+PENALIZE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local s = redis.call('HMGET', KEYS[1], 'rate', 'paused_until')
+local rate = math.max(tonumber(ARGV[3]), (tonumber(s[1]) or tonumber(ARGV[2])) * tonumber(ARGV[4]))
+local paused_until = math.max(tonumber(s[2]) or 0, now + tonumber(ARGV[1]))
+redis.call('HSET', KEYS[1], 'tokens', '0', 'ts', tostring(now), 'rate', tostring(rate),
+  'paused_until', tostring(paused_until))
+redis.call('EXPIRE', KEYS[1], 3600)
+redis.call('HINCRBY', KEYS[2], 'rate_limited', 1)
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[5]))
+return tostring(rate)
+"""
+
+_scripts = {}
+
+
+def _script(source):
+    # Script objects run EVALSHA and reload the script after a Redis restart
+    if source not in _scripts:
+        _scripts[source] = get_redis_connection("default").register_script(source)
+    return _scripts[source]
+
+
+def metrics_key(minute=None):
+    if minute is None:
+        minute = int(time.time() // 60)
+    return f"tmdb:governor:metrics:{minute}"
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextmanager
+def priority(level):
+    """Run TMDB calls made inside the block (in this thread) at `level`"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def bind(fn):
+    """
+    Wrap fn so it runs in the caller's context (priority, profiling
+    recorder), e.g. in a pool thread
+    """
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def _limits(level):
+    if level == BACKGROUND:
+        floor = settings.TMDB_GOVERNOR_BURST * settings.TMDB_GOVERNOR_BACKGROUND_RESERVE
+        return floor, settings.TMDB_GOVERNOR_BACKGROUND_MAX_WAIT
+    return 0, settings.TMDB_GOVERNOR_MAX_WAIT
+
+
+def acquire(level=None):
+    """
+    Wait for a TMDB call slot; returns the seconds spent waiting
+
+    Raises UpstreamRateLimited when the slot would take longer than the
+    priority's max wait. Fails open if Redis is unreachable.
+    """
+    if not settings.TMDB_GOVERNOR_ENABLED:
+        return 0.0
+    level = level or _priority.get()
+    floor, max_wait = _limits(level)
+    start = time.monotonic()
+    while True:
+        waited = time.monotonic() - start
+        try:
+            wait = float(_script(ACQUIRE_SCRIPT)(
+                keys=[BUCKET_KEY, metrics_key()],
+                args=[
+                    settings.TMDB_GOVERNOR_RATE,
+                    settings.TMDB_GOVERNOR_BURST,
+                    floor,
+                    level,
+                    int(waited * 1000),
+                    settings.TMDB_GOVERNOR_RECOVERY,
+                    METRICS_TTL,
+                ],
+            ))
+        except Exception as e:
+            logger.warning("TMDB governor unavailable, not pacing: %s", e)
+            return waited
+        if wait <= 0:
+            return waited
+        if waited + wait > max_wait:
+            _count(f"rejected:{level}")
+            raise UpstreamRateLimited("tmdb", retry_after=max(1, round(wait)))
+        # A little jitter so queued workers do not all retry at once
+        time.sleep(wait + random.uniform(0, 0.01))
+
+
+def _count(field):
+    try:
+        r = get_redis_connection("default")
+        pipe = r.pipeline(transaction=False)
+        pipe.hincrby(metrics_key(), field, 1)
+        pipe.expire(metrics_key(), METRICS_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("TMDB governor metrics unavailable: %s", e)
+
+
+def _pause_for(response):
+    """Seconds TMDB asks us to back off for, or None"""
+    headers = response.headers
+    if response.status_code == 429:
+        try:
+            return max(1.0, float(headers.get("Retry-After", 1)))
+        except ValueError:
+            return 1.0
+    if headers.get("X-RateLimit-Remaining") == "0" and headers.get("X-RateLimit-Reset"):
+        try:
+            return max(0.0, float(headers["X-RateLimit-Reset"]) - time.time())
+        except ValueError:
+            return None
+    return None
+
+
+def observe(response):
+    """Adapt to TMDB's rate-limit signals on a response; returns the pause applied"""
+    if not settings.TMDB_GOVERNOR_ENABLED:
+        return None
+    pause = _pause_for(response)
+    if pause is None:
+        return None
+    try:
+        rate = float(_script(PENALIZE_SCRIPT)(
+            keys=[BUCKET_KEY, metrics_key()],
+            args=[
+                pause,
+                settings.TMDB_GOVERNOR_RATE,
+                settings.TMDB_GOVERNOR_MIN_RATE,
+                0.5,
+                METRICS_TTL,
+            ],
+        ))
+    except Exception as e:
+        logger.warning("TMDB governor unavailable, cannot back off: %s", e)
+        return pause
+    logger.warning("TMDB rate limit hit: pausing %.1fs, rate now %.1f/s", pause, rate)
+    return pause
+
+
+def _number(value, default=0):
+    try:
+        return float(value.decode() if isinstance(value, bytes) else value)
+    except (TypeError, ValueError, AttributeError):
+        return default
+
+
+def metrics(minutes=15):
+    """Bucket state plus per-minute call, queue and wait counts, newest first"""
+    r = get_redis_connection("default")
+    now_minute = int(time.time() // 60)
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(BUCKET_KEY)
+    for minute in range(now_minute, now_minute - minutes, -1):
+        pipe.hgetall(metrics_key(minute))
+    bucket, *rows = pipe.execute()
+    bucket = {k.decode(): _number(v) for k, v in bucket.items()}
+
+    history = []
+    for offset, row in enumerate(rows):
+        row = {k.decode(): _number(v) for k, v in row.items()}
+        entry = {
+            "minute": datetime.fromtimestamp((now_minute - offset) * 60, tz=timezone.utc).isoformat(),
+            "rate_limited": int(row.get("rate_limited", 0)),
+        }
+        for level in PRIORITIES:
+            calls = row.get(f"calls:{level}", 0)
+            queued = row.get(f"queued:{level}", 0)
+            entry[level] = {
+                "calls": int(calls),
+                "calls_per_second": round(calls / 60, 2),
+                "queued": int(queued),
+                "rejected": int(row.get(f"rejected:{level}", 0)),
+                "avg_wait_ms": round(row.get(f"wait_ms:{level}", 0) / queued, 1) if queued else 0,
+                "max_wait_ms": int(row.get(f"wait_ms_max:{level}", 0)),
+            }
+        history.append(entry)
+
+    return {
+        "enabled": settings.TMDB_GOVERNOR_ENABLED,
+        "max_rate": settings.TMDB_GOVERNOR_RATE,
+        "burst": settings.TMDB_GOVERNOR_BURST,
+        "rate": round(bucket.get("rate", settings.TMDB_GOVERNOR_RATE), 2),
+        "tokens": round(bucket.get("tokens", settings.TMDB_GOVERNOR_BURST), 2),
+        "paused_for": round(max(0.0, bucket.get("paused_until", 0) - time.time()), 2),
+        "minutes": history,
+    }
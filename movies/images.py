@@ -0,0 +1,253 @@
+"""
+TMDB image URL resolution and an optional local poster proxy
+
+TMDB payloads only carry image paths ("/abc.jpg"); clients had to know the
+image base URL and sizes. The base URL and available sizes come from TMDB's
+/configuration endpoint (cached, and memoized per process), and every
+movie in an API response gets ready-made URLs for the configured sizes
+plus a srcset, so a client on a phone can pick the smallest fitting one.
+
+With IMAGE_PROXY_ENABLED, thumbnail sizes point at /api/images/ instead:
+the first request for a poster downloads it into IMAGE_PROXY_ROOT (paced
+by the TMDB governor, and throttled per client), later ones are served
+from disk (sendfile) with a one-year Cache-Control. The directory is kept
+under IMAGE_PROXY_MAX_BYTES by evicting the least recently used files
+(mtime is bumped on use).
+"""
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from . import governor
+from .resilience import get_breaker, get_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    "secure_base_url": "https://image.tmdb.org/t/p/",
+    "poster_sizes": ["w92", "w154", "w185", "w342", "w500", "w780", "original"],
+    "backdrop_sizes": ["w300", "w780", "w1280", "original"],
+}
+# Retry a failed /configuration fetch after this many seconds
+CONFIG_RETRY = 300
+# Bump a cached file's mtime on use at most this often
+TOUCH_INTERVAL = 3600
+
+FILENAME = re.compile(r"^[A-Za-z0-9_-]+\.(jpg|jpeg|png|webp|svg)$")
+
+_config = None
+_config_expires = 0.0
+_lock = threading.Lock()
+
+_cache_bytes = None
+_evict_lock = threading.Lock()
+
+
+def get_image_config():
+    """secure_base_url and poster/backdrop sizes from TMDB /configuration"""
+    global _config, _config_expires
+    if _config is not None and time.monotonic() < _config_expires:
+        return _config
+
+    from .services import TMDBService
+
+    with _lock:
+        if _config is not None and time.monotonic() < _config_expires:
+            return _config
+        try:
+            images = TMDBService().get_configuration().get("images", {})
+            _config = {key: images.get(key) or default for key, default in DEFAULT_CONFIG.items()}
+            _config_expires = time.monotonic() + settings.IMAGE_CONFIG_REFRESH
+        except Exception as e:
+            logger.warning("Could not load TMDB image configuration, using defaults: %s", e)
+            _config = _config or DEFAULT_CONFIG
+            _config_expires = time.monotonic() + CONFIG_RETRY
+    return _config
+
+
+def _sizes(wanted, available):
+    return [size for size in wanted if size in available]
+
+
+def image_url(path, size, config=None):
+    """URL of a TMDB image path at one size (proxied when enabled for that size)"""
+    if not path:
+        return None
+    if settings.IMAGE_PROXY_ENABLED and size in settings.IMAGE_PROXY_SIZES:
+        return f"{settings.IMAGE_PROXY_BASE_URL}{size}{path}"
+    config = config or get_image_config()
+    return f"{config['secure_base_url']}{size}{path}"
+
+
+def image_urls(path, kind="poster"):
+    """dict of size -> URL for the configured sizes of an image kind"""
+    if not path:
+        return {}
+    config = get_image_config()
+    wanted = settings.IMAGE_POSTER_SIZES if kind == "poster" else settings.IMAGE_BACKDROP_SIZES
+    return {size: image_url(path, size, config) for size in _sizes(wanted, config[f"{kind}_sizes"])}
+
+
+def srcset(urls):
+    """HTML srcset for width-based sizes ("w342" -> "342w")"""
+    return ", ".join(f"{url} {size[1:]}w" for size, url in urls.items() if size.startswith("w"))
+
+
+def attach_image_urls(data):
+    """
+    Copy of a TMDB payload with poster_urls/poster_srcset/backdrop_urls
+    added to every movie (top level, "results" and "recommendations")
+
+    The payload itself is not modified; it may be a cached object.
+    """
+    if isinstance(data, list):
+        return [attach_image_urls(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+
+    data = dict(data)
+    for key in ("results", "recommendations"):
+        if key in data:
+            data[key] = attach_image_urls(data[key])
+    if data.get("poster_path"):
+        data["poster_urls"] = image_urls(data["poster_path"], "poster")
+        data["poster_srcset"] = srcset(data["poster_urls"])
+    if data.get("backdrop_path"):
+        data["backdrop_urls"] = image_urls(data["backdrop_path"], "backdrop")
+    return data
+
+
+def poster_url(path):
+    """Single poster URL at IMAGE_DEFAULT_POSTER_SIZE (stored on Movie rows)"""
+    return image_url(path, settings.IMAGE_DEFAULT_POSTER_SIZE)
+
+
+def _root():
+    return Path(settings.IMAGE_PROXY_ROOT)
+
+
+def image_path(size, filename):
+    """Where a proxied image lives on disk, or None for sizes/filenames the proxy does not serve"""
+    if size not in settings.IMAGE_PROXY_SIZES or not FILENAME.match(filename):
+        return None
+    return _root() / size / filename
+
+
+def cached_image(size, filename):
+    """Path of a proxied image already on disk, or None (its use is recorded for eviction)"""
+    path = image_path(size, filename)
+    if path is None:
+        return None
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+
+    if time.time() - stat.st_mtime > TOUCH_INTERVAL:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    return path
+
+
+def download_image(size, filename):
+    """
+    Download a proxied image into the cache; returns its path, or None when
+    TMDB has no such image
+
+    The call is paced by the governor and goes through the "tmdb_images"
+    circuit breaker, so raises UpstreamUnavailable as well as requests
+    exceptions.
+    """
+    path = image_path(size, filename)
+    if path is None:
+        return None
+    config = get_image_config()
+    url = f"{config['secure_base_url']}{size}/{filename}"
+
+    def fetch():
+        governor.acquire()
+        response = get_session("tmdb_images").get(
+            url, timeout=(settings.TMDB_CONNECT_TIMEOUT, settings.TMDB_TIMEOUTS["default"])
+        )
+        governor.observe(response)
+        # A missing image is the client's problem, not a sign of TMDB failing
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response
+
+    response = get_breaker("tmdb_images").call(fetch)
+    if response is None:
+        return None
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so concurrent readers never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(response.content)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    _account(len(response.content))
+    return path
+
+
+def _scan():
+    """(total bytes, [(mtime, size, path)]) of the cache directory"""
+    files = []
+    for entry in _root().glob("*/*"):
+        if entry.name.startswith(".tmp-"):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, entry))
+    return sum(size for _, size, _ in files), files
+
+
+def _account(added):
+    """Track the cache size and evict once it goes over the limit"""
+    global _cache_bytes
+    with _evict_lock:
+        if _cache_bytes is None:
+            _cache_bytes = _scan()[0]
+        else:
+            _cache_bytes += added
+        if _cache_bytes > settings.IMAGE_PROXY_MAX_BYTES:
+            _cache_bytes = evict()
+
+
+def evict(target=None):
+    """
+    Delete least recently used files until the cache is under target bytes
+    (90% of IMAGE_PROXY_MAX_BYTES by default); returns the bytes left
+
+    Other processes may be evicting too, so files already gone are skipped.
+    """
+    if target is None:
+        target = settings.IMAGE_PROXY_MAX_BYTES * 0.9
+    total, files = _scan()
+    removed = 0
+    for _, size, path in sorted(files, key=lambda f: f[0]):
+        if total <= target:
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    if removed:
+        logger.info("Evicted %d cached images, %d bytes left", removed, total)
+    return total
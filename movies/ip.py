@@ -1,18 +1,54 @@
 """
 Utility to get client IP address from request
 """
+import ipaddress
+from functools import lru_cache
+
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def _trusted_networks(proxies):
+    return tuple(ipaddress.ip_network(p.strip(), strict=False) for p in proxies if p.strip())
+
+
+def _parse(value):
+    try:
+        address = ipaddress.ip_address(value.strip().strip("[]"))
+    except ValueError:
+        return None
+    # Dual-stack sockets report IPv4 clients as ::ffff:a.b.c.d
+    return getattr(address, "ipv4_mapped", None) or address
+
+
+def is_trusted_proxy(address):
+    return any(address in network for network in _trusted_networks(tuple(settings.TRUSTED_PROXIES)))
+
 
 def get_client_ip(request):
     """
     Get the client IP address from the request
-    
-    Handles proxy headers like X-Forwarded-For
+
+    X-Forwarded-For is only honored when the request came from a trusted
+    proxy (TRUSTED_PROXIES). The header is then walked right to left,
+    skipping trusted hops, so the first untrusted address is the client;
+    anything further left was supplied by the client and can be forged.
     """
+    remote = _parse(request.META.get('REMOTE_ADDR') or '')
+    if remote is None:
+        return request.META.get('REMOTE_ADDR')
+
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        # X-Forwarded-For can contain multiple IPs, get the first one
-        ip = x_forwarded_for.split(',')[0].strip()
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+    if not x_forwarded_for or not is_trusted_proxy(remote):
+        return str(remote)
 
+    client = remote
+    for hop in reversed(x_forwarded_for.split(',')):
+        address = _parse(hop)
+        if address is None:
+            # Garbage in the chain; the last good hop is as far as we can trust
+            break
+        client = address
+        if not is_trusted_proxy(address):
+            break
+    return str(client)
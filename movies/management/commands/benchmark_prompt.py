@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.prompting import count_tokens, get_token_usage, record_token_usage
+from movies.services import LLMService
+from movies.utils import fetch_movie_details_with_keywords
+
+
+def _uncompacted_movie_text(movie_data_list):
+    """The movie section as it was built before token budgeting, for comparison"""
+    return "\n".join([
+        f"Movie: {movie.get('title', 'Unknown')} ({(movie.get('release_date') or 'Unknown')[:4]})\n"
+        f"Genres: {', '.join([g['name'] for g in movie.get('genres', [])])}\n"
+        f"Overview: {movie.get('overview', 'N/A')}\n"
+        f"Keywords: {', '.join([k['name'] for k in movie.get('keywords', {}).get('keywords', [])[:10]])}\n"
+        for movie in movie_data_list
+    ])
+
+
+class Command(BaseCommand):
+    help = "Benchmark LLM prompt size (and optionally LLM latency) against the number of seed movies"
+
+    def add_arguments(self, parser):
+        parser.add_argument("movie_ids", nargs="+", type=int, help="TMDB movie IDs to use as seeds")
+        parser.add_argument("--sizes", default="1,2,4,8,16", help="Comma-separated seed counts to try")
+        parser.add_argument("--call-llm", action="store_true", help="Also call the LLM and time it")
+        parser.add_argument("--repeat", type=int, default=1, help="LLM calls per size (median is reported)")
+
+    def handle(self, *args, **options):
+        movies = fetch_movie_details_with_keywords(options["movie_ids"])
+        if not movies:
+            raise CommandError("No movie data could be fetched")
+
+        sizes = sorted({min(int(n), len(movies)) for n in options["sizes"].split(",") if n.strip()})
+        preferences = {
+            "genres": [],
+            "mood": "Not specified",
+            "description": "Benchmark run",
+        }
+        llm_service = LLMService()
+
+        header = f"{'seeds':>5} {'raw tok':>8} {'prompt tok':>10} {'build ms':>9}"
+        if options["call_llm"]:
+            # Provider-reported prompt/completion tokens, averaged per call
+            header += f" {'llm ms':>8} {'usage in':>9} {'usage out':>9}"
+        self.stdout.write(header)
+
+        for size in sizes:
+            seeds = movies[:size]
+            raw_tokens = count_tokens(_uncompacted_movie_text(seeds))
+
+            start = time.perf_counter()
+            prompt = llm_service._build_prompt(preferences, seeds)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            line = f"{size:>5} {raw_tokens:>8} {count_tokens(prompt):>10} {build_ms:>9.2f}"
+            if options["call_llm"]:
+                timings = []
+                before = get_token_usage()
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    response = llm_service._call_llm(prompt)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    record_token_usage(response, 1)
+                after = get_token_usage()
+                calls = max(1, after["calls"] - before["calls"])
+                line += (
+                    f" {sorted(timings)[len(timings) // 2]:>8.0f}"
+                    f" {(after['prompt_tokens'] - before['prompt_tokens']) / calls:>9.0f}"
+                    f" {(after['completion_tokens'] - before['completion_tokens']) / calls:>9.0f}"
+                )
+            self.stdout.write(line)
+
+        if options["call_llm"]:
+            usage = get_token_usage()
+            self.stdout.write(
+                f"LLM usage: {usage['calls']} calls, {usage['prompt_tokens']} prompt + "
+                f"{usage['completion_tokens']} completion tokens, "
+                f"{usage['tokens_per_recommendation']:.0f} per recommendation"
+            )
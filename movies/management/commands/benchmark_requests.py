@@ -0,0 +1,59 @@
+import statistics
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from movies.services import TMDBService
+from movies.throttling import AnonymousRateThrottle
+
+CANNED_PAGE = {
+    "page": 1,
+    "results": [{"id": i, "title": f"Movie {i}", "genre_ids": [18], "vote_average": 7.5} for i in range(20)],
+    "total_pages": 1,
+    "total_results": 20,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-request framework overhead on a cache hit for the read-only "
+        "endpoints, with and without the fast path"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/api/top-rated/?page=1", help="Endpoint to request")
+        parser.add_argument("--requests", type=int, default=2000, help="Requests per mode")
+
+    def _run(self, path, count):
+        client = Client(HTTP_HOST=(settings.ALLOWED_HOSTS or ["localhost"])[0])
+        for _ in range(min(100, count)):  # Warm up
+            client.get(path)
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.get(path)
+            timings.append((time.perf_counter() - start) * 1e6)
+        assert response.status_code == 200, response.content
+        timings.sort()
+        return statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+
+    def handle(self, *args, **options):
+        # A cache hit with the upstream and Redis taken out of the picture, so
+        # only framework work (middleware, DRF, rendering) is measured
+        local_cache = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with mock.patch.object(TMDBService, "_make_request", return_value=CANNED_PAGE), \
+                mock.patch.object(AnonymousRateThrottle, "allow_request", return_value=True), \
+                override_settings(CACHES=local_cache):
+            results = {}
+            for label, enabled in (("full stack", False), ("fast path", True)):
+                with override_settings(FAST_PATH_ENABLED=enabled):
+                    results[label] = self._run(options["path"], options["requests"])
+
+        self.stdout.write(f"{'mode':<12} {'mean us':>9} {'p50 us':>9} {'p99 us':>9}")
+        for label, (mean, p50, p99) in results.items():
+            self.stdout.write(f"{label:<12} {mean:>9.1f} {p50:>9.1f} {p99:>9.1f}")
+        ratio = results["fast path"][0] / results["full stack"][0]
+        self.stdout.write(self.style.SUCCESS(f"Fast path costs {ratio:.0%} of the full stack per request"))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.catalog import Catalog, build_from_movies
+
+
+class Command(BaseCommand):
+    help = "Build the memory-mapped movie catalog from the Movie table and publish it to every worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--root", default=None, help="Catalog directory (default: CATALOG_ROOT)")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        path = build_from_movies(root=options["root"])
+        catalog = Catalog.open(path)
+        size = sum(f.stat().st_size for f in path.iterdir())
+        self.stdout.write(self.style.SUCCESS(
+            f"Built catalog {catalog.version}: {len(catalog)} movies, {catalog.meta['keywords']} keywords, "
+            f"{size / 1024 / 1024:.1f} MB in {time.monotonic() - start:.1f}s"
+        ))
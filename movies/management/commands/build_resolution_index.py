@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from movies.models import Genre, Keyword
+from movies.resolution import bump_version, get_index, sync_genres
+from movies.utils import fetch_movie_details_with_keywords
+
+
+class Command(BaseCommand):
+    help = "Sync TMDB genres and ingest keywords into the local genre/keyword resolution index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--movies", nargs="*", type=int, default=[],
+            help="TMDB movie IDs whose keywords should be ingested"
+        )
+
+    def handle(self, *args, **options):
+        sync_genres()
+        if options["movies"]:
+            # Fetching keywords ingests them as a side effect
+            fetch_movie_details_with_keywords(options["movies"])
+        bump_version()
+        index = get_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Resolution index: {Genre.objects.count()} genres ({len(index.genres)} names), "
+            f"{Keyword.objects.count()} keywords"
+        ))
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.evaluation import CONFIGURATIONS, evaluate, load_cases
+
+DEFAULT_CASES = "movies/fixtures/evaluation_cases.jsonl"
+DEFAULT_CASSETTE = "movies/fixtures/evaluation_cassette.json"
+
+
+def _fmt(value, spec=".3f"):
+    return "-" if value is None else format(value, spec)
+
+
+class Command(BaseCommand):
+    help = "Replay recommendation requests from recorded TMDB/LLM responses and compare configurations"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cases", default=DEFAULT_CASES, help="JSONL file of evaluation cases")
+        parser.add_argument("--cassette", default=DEFAULT_CASSETTE, help="JSON file of recorded upstream responses")
+        parser.add_argument(
+            "--configs",
+            default=",".join(CONFIGURATIONS),
+            help=f"Comma-separated configurations to compare ({', '.join(CONFIGURATIONS)})",
+        )
+        parser.add_argument("--k", type=int, default=10, help="Cutoff for precision/recall")
+        parser.add_argument(
+            "--record", action="store_true",
+            help="Call the real APIs for unrecorded requests and save them"
+        )
+        parser.add_argument(
+            "--simulate-latency", action="store_true",
+            help="Replay responses as slowly as they were recorded"
+        )
+        parser.add_argument("--warm", action="store_true", help="Keep the cache between cases instead of starting cold")
+        parser.add_argument("--output", help="Also write the full report as JSON to this file")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options["configs"].split(",") if name.strip()]
+        unknown = [name for name in names if name not in CONFIGURATIONS]
+        if unknown:
+            raise CommandError(f"Unknown configuration(s): {', '.join(unknown)}")
+        try:
+            cases = load_cases(options["cases"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read cases: {e}")
+        if not cases:
+            raise CommandError("No evaluation cases")
+
+        k = options["k"]
+        report = evaluate(
+            cases,
+            {name: CONFIGURATIONS[name] for name in names},
+            options["cassette"],
+            k=k,
+            record=options["record"],
+            simulate_latency=options["simulate_latency"],
+            warm=options["warm"],
+        )
+
+        self.stdout.write(
+            f"{'configuration':<14} {'errors':>6} {f'p@{k}':>6} {f'r@{k}':>6} {'genre':>6} {'kw':>6} "
+            f"{'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'tmdb/req':>8} {'llm/req':>7} {'misses':>6}"
+        )
+        for row in report:
+            self.stdout.write(
+                f"{row['configuration']:<14} {row['errors']:>6} {_fmt(row[f'precision@{k}']):>6} "
+                f"{_fmt(row[f'recall@{k}']):>6} {_fmt(row['genre_overlap']):>6} {_fmt(row['keyword_overlap']):>6} "
+                f"{_fmt(row['latency_mean_ms'], '.1f'):>8} {_fmt(row['latency_p50_ms'], '.1f'):>8} "
+                f"{_fmt(row['latency_p95_ms'], '.1f'):>8} {_fmt(row['tmdb_calls_per_case'], '.1f'):>8} "
+                f"{_fmt(row['llm_calls_per_case'], '.1f'):>7} {row['cassette_misses']:>6}"
+            )
+
+        if any(row["cassette_misses"] for row in report):
+            self.stderr.write("Some requests had no recorded response; run with --record to add them")
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import banlist
+
+
+class Command(BaseCommand):
+    help = "Manage the IP ban and allow lists shared by every worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ban", nargs="*", default=[], help="IPs or CIDR blocks to ban")
+        parser.add_argument(
+            "--duration", type=int, default=None,
+            help="Ban length in seconds (default: until unbanned)"
+        )
+        parser.add_argument("--unban", nargs="*", default=[], help="IPs or CIDR blocks to unban")
+        parser.add_argument(
+            "--allow", nargs="*", default=[],
+            help="IPs or CIDR blocks exempt from bans and rate limits"
+        )
+        parser.add_argument("--disallow", nargs="*", default=[], help="Remove from the allow list")
+        parser.add_argument("--list", action="store_true", help="Show both lists")
+
+    def handle(self, *args, **options):
+        actions = [
+            ("ban", lambda entry: banlist.ban(entry, options["duration"]), "Banned"),
+            ("unban", banlist.unban, "Unbanned"),
+            ("allow", banlist.allow, "Allowed"),
+            ("disallow", banlist.disallow, "Removed from allow list"),
+        ]
+        if not options["list"] and not any(options[name] for name, _, _ in actions):
+            raise CommandError("Nothing to do: pass --ban, --unban, --allow, --disallow and/or --list")
+
+        for name, action, verb in actions:
+            for entry in options[name]:
+                try:
+                    self.stdout.write(self.style.SUCCESS(f"{verb} {action(entry)}"))
+                except ValueError as e:
+                    raise CommandError(str(e))
+
+        if options["list"]:
+            denied, allowed = banlist.entries()
+            self.stdout.write(f"Banned ({len(denied)}):")
+            for entry, expires in denied:
+                until = datetime.fromtimestamp(expires).isoformat(timespec="seconds") if expires else "forever"
+                self.stdout.write(f"  {entry} until {until}")
+            self.stdout.write(f"Allowed ({len(allowed)}):")
+            for entry in allowed:
+                self.stdout.write(f"  {entry}")
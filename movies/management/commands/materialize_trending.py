@@ -0,0 +1,42 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies import governor
+from movies.trending import materialize
+
+
+class Command(BaseCommand):
+    help = "Materialize trending-by-genre-and-year listings from TMDB into the TrendingMovie table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--genres", nargs="*", type=int, default=None, help="TMDB genre IDs (default: all)")
+        parser.add_argument(
+            "--years", nargs="*", type=int, default=None,
+            help="Release years (default: the last TRENDING_YEARS_BACK years)"
+        )
+        parser.add_argument("--pages", type=int, default=None, help="Discover pages per sort order")
+        parser.add_argument("--workers", type=int, default=4, help="Slices fetched in parallel")
+        parser.add_argument(
+            "--loop", type=int, default=None,
+            help="Keep running, refreshing every this many seconds"
+        )
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        while True:
+            # Leaves part of the shared TMDB rate limit to user requests
+            with governor.priority(governor.BACKGROUND):
+                refreshed, failed, rows = materialize(
+                    genre_ids=options["genres"],
+                    years=options["years"],
+                    pages=options["pages"],
+                    workers=options["workers"],
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f"Refreshed {refreshed} slices ({rows} movies), {failed} failed"
+            ))
+            if not options["loop"]:
+                return
+            time.sleep(options["loop"])
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import store
+from movies.caching import FAMILIES, cleanup_orphans, purge_all, purge_family, purge_movie
+
+
+class Command(BaseCommand):
+    help = "Invalidate cached TMDB responses by key family or movie ID, and clean up orphaned keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--family", nargs="*", choices=FAMILIES, default=[],
+            help="Key families to invalidate"
+        )
+        parser.add_argument("--all", action="store_true", help="Invalidate every family")
+        parser.add_argument(
+            "--movie", nargs="*", type=int, default=[],
+            help="TMDB movie IDs whose cached details/keywords should be invalidated"
+        )
+        parser.add_argument(
+            "--orphans", action="store_true",
+            help="Delete keys of old generations (SCAN-based, non-blocking)"
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Only count orphaned keys")
+
+    def handle(self, *args, **options):
+        if not (options["family"] or options["all"] or options["movie"] or options["orphans"]):
+            raise CommandError("Nothing to do: pass --family, --all, --movie and/or --orphans")
+
+        if options["all"]:
+            for family, generation in purge_all().items():
+                self.stdout.write(f"{family}: generation {generation}")
+        for family in options["family"]:
+            self.stdout.write(f"{family}: generation {purge_family(family)}")
+        for movie_id in options["movie"]:
+            self.stdout.write(f"movie {movie_id}: generation {purge_movie(movie_id)}")
+
+        if options["orphans"]:
+            # 0 (and a logged warning) when the cache backend cannot be scanned
+            removed = cleanup_orphans(batch_size=options["batch_size"], dry_run=options["dry_run"])
+            verb = "Found" if options["dry_run"] else "Removed"
+            self.stdout.write(self.style.SUCCESS(f"{verb} {removed} orphaned keys"))
+            if not options["dry_run"]:
+                pruned = store.prune_orphans(batch_size=options["batch_size"])
+                self.stdout.write(self.style.SUCCESS(f"Removed {pruned} orphaned stored responses"))
@@ -0,0 +1,26 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from movies.tasks import run_worker
+
+
+class Command(BaseCommand):
+    help = "Run a worker that processes queued recommendation jobs from Redis"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-jobs", type=int, default=None, help="Exit after this many jobs")
+        parser.add_argument("--concurrency", type=int, default=1, help="Jobs to run in parallel threads")
+        parser.add_argument("--poll-timeout", type=int, default=5, help="Seconds to block waiting for a job")
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        self.stdout.write("Waiting for recommendation jobs...")
+        try:
+            run_worker(
+                poll_timeout=options["poll_timeout"],
+                max_jobs=options["max_jobs"],
+                concurrency=options["concurrency"],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("Worker stopped")
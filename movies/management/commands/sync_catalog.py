@@ -0,0 +1,62 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from movies.discover import sync
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Refresh the Movie table from TMDB (changes, new releases, stale rows) and rebuild the catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--changed-days", type=int, default=1,
+            help="Refresh stored movies TMDB reports as changed in this many days (max 14, 0 = skip)"
+        )
+        parser.add_argument(
+            "--years", nargs="*", type=int, default=[],
+            help="Discover new movies released in these years"
+        )
+        parser.add_argument("--pages", type=int, default=5, help="Discover pages per year")
+        parser.add_argument("--min-votes", type=int, default=10, help="vote_count.gte for discovered movies")
+        parser.add_argument(
+            "--stale-days", type=int, default=None,
+            help="Also refresh rows not synced for this many days"
+        )
+        parser.add_argument("--ids", nargs="*", type=int, default=[], help="TMDB movie IDs to refresh")
+        parser.add_argument("--workers", type=int, default=4, help="Movies fetched in parallel")
+        parser.add_argument("--no-build", action="store_true", help="Only update the Movie table")
+        parser.add_argument(
+            "--loop", type=int, default=None,
+            help="Keep running, syncing every this many seconds"
+        )
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        while True:
+            try:
+                updated, failed = sync(
+                    changed_days=options["changed_days"],
+                    years=options["years"],
+                    pages=options["pages"],
+                    min_votes=options["min_votes"],
+                    stale_days=options["stale_days"],
+                    movie_ids=options["ids"],
+                    workers=options["workers"],
+                    build=not options["no_build"],
+                )
+            except Exception:
+                if not options["loop"]:
+                    raise
+                # TMDB or the database being down must not end the loop
+                logger.exception("Catalog sync failed; retrying in %ss", options["loop"])
+                close_old_connections()
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Synced {updated} movies, {failed} failed"))
+            if not options["loop"]:
+                return
+            time.sleep(options["loop"])
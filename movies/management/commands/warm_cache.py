@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from movies import store
+from movies.caching import orphaned_keys
+
+
+class Command(BaseCommand):
+    help = "Bulk-load the most requested TMDB responses from the durable store back into Redis"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit", type=int, default=None,
+            help="Number of entries to load (default TMDB_STORE_WARM_LIMIT)"
+        )
+        parser.add_argument("--families", nargs="*", default=None, help="Only these key families")
+        parser.add_argument("--timeout", type=int, default=86400, help="Redis TTL for loaded entries")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        limit = options["limit"] or settings.TMDB_STORE_WARM_LIMIT
+        batch_size = options["batch_size"]
+        start = time.monotonic()
+        loaded = 0
+
+        def load(batch):
+            nonlocal loaded
+            # Entries of purged generations are never requested again
+            for key in orphaned_keys(list(batch)):
+                del batch[key]
+            # set_many is a single pipelined round trip on django-redis
+            cache.set_many(batch, options["timeout"])
+            loaded += len(batch)
+
+        batch = {}
+        for key, data in store.hottest(limit, options["families"]):
+            batch[key] = data
+            if len(batch) >= batch_size:
+                load(batch)
+                batch = {}
+        if batch:
+            load(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {loaded} TMDB responses into the cache in {time.monotonic() - start:.2f}s"
+        ))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_genre_keyword'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', 'created_at'], name='favorite_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_tasteprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TMDBResponse',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('family', models.CharField(max_length=50)),
+                ('data', models.JSONField()),
+                ('hits', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-hits'], name='tmdbresponse_hits_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_tmdbresponse'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingMovie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genre_id', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('movie_id', models.IntegerField()),
+                ('title', models.CharField(max_length=300)),
+                ('popularity', models.FloatField(default=0)),
+                ('vote_average', models.FloatField(default=0)),
+                ('vote_count', models.IntegerField(default=0)),
+                ('release_date', models.DateField(blank=True, null=True)),
+                ('data', models.JSONField()),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('genre_id', 'year', 'movie_id'), name='trendingmovie_slice_movie_uniq')],
+            },
+        ),
+    ]
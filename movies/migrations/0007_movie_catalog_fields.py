@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_trendingmovie'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='adult',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='backdrop_path',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='genre_ids',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='keyword_ids',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='popularity',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='poster_path',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='release_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='vote_average',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='vote_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
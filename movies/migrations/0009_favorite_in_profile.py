@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:50
+
+from django.db import migrations, models
+
+
+def reset_profiles(apps, schema_editor):
+    # Whether a profile counted its user's earlier favorites is unknown (one
+    # created by a preferences change did not), so start every profile over;
+    # all favorites are counted on the user's next personalized recommendations
+    TasteProfile = apps.get_model('movies', 'TasteProfile')
+    TasteProfile.objects.update(genre_weights={}, keyword_weights={}, version=models.F('version') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_cachegeneration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='in_profile',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(reset_profiles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_favorite_in_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trendingmovie',
+            name='slice_total',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -9,6 +9,9 @@ class User(models.Model):
     max_age_rating = models.CharField(max_length=50, null=True, blank=True)
     preferred_langs = models.JSONField(default=list)  # ["en","es"]
 
+    # Lets DRF permission classes treat a resolved User as logged in
+    is_authenticated = True
+
     def __str__(self):
         return self.email
 
@@ -36,6 +39,17 @@ class Movie(models.Model):
     runtime = models.IntegerField(null=True, blank=True)
     overview = models.TextField(null=True, blank=True)
     poster_url = models.CharField(max_length=300, null=True, blank=True)
+    # TMDB fields the in-process catalog filters and sorts on (see catalog.py)
+    release_date = models.DateField(null=True, blank=True)
+    genre_ids = models.JSONField(default=list)    # [18, 80]
+    keyword_ids = models.JSONField(default=list)  # [9748, 10183]
+    vote_average = models.FloatField(null=True, blank=True)
+    vote_count = models.IntegerField(null=True, blank=True)
+    popularity = models.FloatField(null=True, blank=True)
+    poster_path = models.CharField(max_length=100, null=True, blank=True)
+    backdrop_path = models.CharField(max_length=100, null=True, blank=True)
+    adult = models.BooleanField(default=False)
+    synced_at = models.DateTimeField(null=True, blank=True)  # Last refresh from TMDB
 
     def __str__(self):
         return self.title
@@ -46,6 +60,90 @@ class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="favorites")
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="favorited_by")
     created_at = models.DateTimeField(auto_now_add=True)
+    in_profile = models.BooleanField(default=False)  # Counted in the user's TasteProfile weights
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at"], name="favorite_user_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.movie.title}"
+
+
+class Genre(models.Model):
+    id = models.IntegerField(primary_key=True)  # TMDB genre ID
+    name = models.CharField(max_length=100)
+    aliases = models.JSONField(default=list)  # ["sci-fi","scifi"]
+
+    def __str__(self):
+        return self.name
+
+
+class Keyword(models.Model):
+    id = models.IntegerField(primary_key=True)  # TMDB keyword ID
+    name = models.CharField(max_length=200)
+    normalized = models.CharField(max_length=200, db_index=True)
+
+    def __str__(self):
+        return self.name
+
+
+class TasteProfile(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="taste_profile")
+    genre_weights = models.JSONField(default=dict)    # {"Drama": 3.0}
+    keyword_weights = models.JSONField(default=dict)  # {"revenge": 2.0}
+    version = models.IntegerField(default=0)          # Bumped on every favorites/preferences change
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.email} taste profile"
+
+
+class TMDBResponse(models.Model):
+    """Durable copy of cached TMDB payloads, read when Redis misses"""
+    key = models.CharField(max_length=200, primary_key=True)  # Versioned cache key (see caching.py)
+    family = models.CharField(max_length=50)
+    data = models.JSONField()
+    hits = models.IntegerField(default=0)  # Requests served, used to pick entries for warm_cache
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-hits"], name="tmdbresponse_hits_idx"),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class CacheGeneration(models.Model):
+    """Durable copy of a cache family/movie generation counter (see caching.py)"""
+    key = models.CharField(max_length=200, primary_key=True)  # cache:gen:{family} or cache:gen:movie:{id}
+    value = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key}={self.value}"
+
+
+class TrendingMovie(models.Model):
+    """Materialized discover results per (genre, release year), see trending.py"""
+    genre_id = models.IntegerField()
+    year = models.IntegerField()
+    movie_id = models.IntegerField()
+    title = models.CharField(max_length=300)
+    popularity = models.FloatField(default=0)
+    vote_average = models.FloatField(default=0)
+    vote_count = models.IntegerField(default=0)
+    release_date = models.DateField(null=True, blank=True)
+    data = models.JSONField()  # The discover result as TMDB returned it
+    slice_total = models.IntegerField(default=0)  # TMDB's total_results for the whole (genre, year)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["genre_id", "year", "movie_id"], name="trendingmovie_slice_movie_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.genre_id}/{self.year})"
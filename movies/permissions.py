@@ -0,0 +1,20 @@
+"""
+Permissions for operator-only endpoints
+"""
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+class HasAdminToken(BasePermission):
+    """
+    Allow requests carrying the shared ADMIN_API_TOKEN in X-Admin-Token
+
+    Everything is denied while ADMIN_API_TOKEN is unset.
+    """
+
+    def has_permission(self, request, view):
+        expected = settings.ADMIN_API_TOKEN
+        token = request.META.get("HTTP_X_ADMIN_TOKEN", "")
+        return bool(expected) and hmac.compare_digest(token.encode(), expected.encode())
@@ -0,0 +1,184 @@
+"""
+Per-user taste profiles and personalized recommendations
+
+A taste profile is a weighted genre/keyword vector over the user's
+favorites. It is updated incrementally as favorites are added or removed,
+so personalized recommendations never have to re-read every favorite.
+Its version number keys the per-user recommendation cache.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Favorite, TasteProfile
+from .recommendations import generate_recommendations
+from .services import TMDBService
+
+logger = logging.getLogger(__name__)
+
+
+def _movie_keywords(movie_ids):
+    """Keyword names per movie ID, in one batched cache round trip"""
+    movies, errors = TMDBService().get_movies_with_keywords(movie_ids)
+    for movie_id, e in errors.items():
+        logger.warning("Error fetching keywords for movie %s: %s", movie_id, e)
+    return {
+        str(movie["id"]): [k["name"] for k in movie.get("keywords", {}).get("keywords", []) if k.get("name")]
+        for movie in movies
+    }
+
+
+def _add_weights(weights, names, sign):
+    for name in names:
+        value = weights.get(name, 0) + sign
+        if value > 0:
+            weights[name] = value
+        else:
+            weights.pop(name, None)
+
+
+def apply_favorites_change(user, movie_ids, sign):
+    """
+    Add (sign=1) or subtract (sign=-1) favorites from the user's taste profile
+
+    Keyword lookups hit the TMDB cache and happen before the row lock is
+    taken. Favorite.in_profile says whether a favorite is counted in the
+    weights; it is checked and flipped under the profile lock, so concurrent
+    requests for the same movie never count it twice. Subtracting also
+    deletes the favorites, in the same transaction; returns the number of
+    favorites added to or removed from the profile (deleted, for sign=-1).
+    """
+    movie_ids = [str(m) for m in movie_ids]
+    if not movie_ids:
+        return 0
+    keywords = _movie_keywords(movie_ids)
+
+    with transaction.atomic():
+        profile, _ = TasteProfile.objects.select_for_update().get_or_create(user=user)
+        favorites = Favorite.objects.filter(user=user, movie_id__in=movie_ids)
+        changed = list(favorites.filter(in_profile=sign < 0).select_related("movie"))
+        for favorite in changed:
+            _add_weights(profile.genre_weights, favorite.movie.genres, sign)
+            _add_weights(profile.keyword_weights, keywords.get(favorite.movie_id, []), sign)
+        if sign > 0:
+            Favorite.objects.filter(pk__in=[f.pk for f in changed]).update(in_profile=True)
+            count = len(changed)
+        else:
+            count, _ = favorites.delete()
+        profile.version += 1
+        profile.save()
+    return count
+
+
+def rebuild_taste_profile(user):
+    """Recompute a taste profile from scratch (repairs)"""
+    with transaction.atomic():
+        profile, _ = TasteProfile.objects.select_for_update().get_or_create(user=user)
+        profile.genre_weights = {}
+        profile.keyword_weights = {}
+        profile.save()
+        Favorite.objects.filter(user=user).update(in_profile=False)
+    movie_ids = list(Favorite.objects.filter(user=user).values_list("movie_id", flat=True))
+    apply_favorites_change(user, movie_ids, 1)
+    return TasteProfile.objects.get(user=user)
+
+
+def bump_profile_version(user):
+    """Invalidate cached recommendations after a preferences change"""
+    with transaction.atomic():
+        profile, _ = TasteProfile.objects.select_for_update().get_or_create(user=user)
+        profile.version += 1
+        profile.save(update_fields=["version", "updated_at"])
+
+
+def _top(weights, n):
+    return [name for name, _ in sorted(weights.items(), key=lambda item: -item[1])[:n]]
+
+
+def build_user_preferences(user, profile):
+    """Turn the stored Preference and taste profile into LLM preferences"""
+    preference = getattr(user, "preferences", None)
+    genres = list(preference.genres) if preference else []
+    mood = ", ".join(preference.mood_tags) if preference and preference.mood_tags else "Not specified"
+
+    details = []
+    if preference:
+        for label, value in (
+            ("pace", preference.pace),
+            ("violence level", preference.violence_level),
+            ("runtime", preference.runtime_pref),
+        ):
+            if value:
+                details.append(f"Preferred {label}: {value}.")
+    top_genres = _top(profile.genre_weights, 5)
+    if top_genres:
+        details.append(f"Most favorited genres: {', '.join(top_genres)}.")
+    top_keywords = _top(profile.keyword_weights, settings.LLM_MAX_KEYWORDS)
+    if top_keywords:
+        details.append(f"Recurring themes in their favorites: {', '.join(top_keywords)}.")
+
+    return {
+        "genres": genres or top_genres[:3],
+        "mood": mood,
+        "description": " ".join(details) or "Not provided",
+    }
+
+
+def build_seed_movies(user):
+    """
+    Build LLM seed data from stored favorites, without the TMDB details fan-out
+
+    Stored Movie rows supply title, year, genres and overview; the taste
+    profile's keywords go into the preferences instead.
+    """
+    favorites = (
+        Favorite.objects.filter(user=user)
+        .select_related("movie")
+        .order_by("-created_at")[:settings.LLM_MAX_SEED_MOVIES]
+    )
+    return [
+        {
+            "id": favorite.movie.id,
+            "title": favorite.movie.title,
+            "release_date": f"{favorite.movie.year}-01-01" if favorite.movie.year else "",
+            "genres": [{"name": g} for g in favorite.movie.genres],
+            "overview": favorite.movie.overview or "",
+            "keywords": {"keywords": []},
+        }
+        for favorite in favorites
+    ]
+
+
+def recommendation_cache_key(user, profile):
+    return f"recommendations:user:{user.pk}:v{profile.version}"
+
+
+def get_personalized_recommendations(user):
+    """
+    Recommendations for a user from their stored favorites and preferences
+
+    Cached per user and profile version: any favorites or preferences
+    change bumps the version, so stale entries are never read again and
+    simply expire.
+    """
+    profile, _ = TasteProfile.objects.get_or_create(user=user)
+    # Favorites saved before taste profiles existed (whatever created the
+    # profile since) or left over from an interrupted add
+    uncounted = list(Favorite.objects.filter(user=user, in_profile=False).values_list("movie_id", flat=True))
+    if uncounted:
+        apply_favorites_change(user, uncounted, 1)
+        profile.refresh_from_db()
+    cache_key = recommendation_cache_key(user, profile)
+    cached = cache.get(cache_key)
+    if cached:
+        return cached
+
+    result = generate_recommendations(
+        build_user_preferences(user, profile),
+        movie_data_list=build_seed_movies(user),
+        exclude_ids=list(Favorite.objects.filter(user=user).values_list("movie_id", flat=True)),
+    )
+    cache.set(cache_key, result, settings.PERSONALIZED_RECOMMENDATIONS_TTL)
+    return result
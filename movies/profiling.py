@@ -0,0 +1,225 @@
+"""
+On-demand per-request profiling
+
+ProfilingMiddleware profiles a request when it carries X-Profile (with a
+valid X-Admin-Token) or is picked by PROFILING_SAMPLE_RATE. While a request
+is profiled, every cache call and upstream HTTP call it makes (including
+from pool threads started through governor.bind) is recorded with its
+timing. The profile, the recorded calls and a text summary go into a
+Redis ring buffer of the last PROFILING_BUFFER_SIZE profiles, browsable at
+/api/internal/profiles/.
+
+Engines: cProfile (always available; download as .pstats for snakeviz or
+flameprof) and pyinstrument when installed (speedscope JSON or HTML).
+
+With PROFILING_ENABLED=False the middleware removes itself at startup and
+nothing is instrumented.
+"""
+import base64
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import logging
+import marshal
+import pstats
+import random
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django_redis import get_redis_connection
+
+from .permissions import HasAdminToken
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ["cprofile", "pyinstrument"]
+INDEX_KEY = "profiling:profiles"
+CACHE_METHODS = ["get", "set", "add", "delete", "get_many", "set_many", "delete_many", "incr", "has_key"]
+
+# Calls recorded for the request being profiled; None when not profiling
+_events = contextvars.ContextVar("profiling_events", default=None)
+# Set inside an instrumented cache call, so nested calls are not counted twice
+_in_cache_call = contextvars.ContextVar("profiling_in_cache_call", default=False)
+
+
+def record(kind, name, seconds, **detail):
+    """Record a call for the request being profiled (no-op otherwise)"""
+    events = _events.get()
+    if events is not None:
+        events.append(dict(detail, kind=kind, name=name, ms=round(seconds * 1000, 3)))
+
+
+def record_response(response, *args, **kwargs):
+    """requests response hook recording upstream calls"""
+    if _events.get() is not None:
+        record(
+            "upstream",
+            f"{response.request.method} {response.url}",
+            response.elapsed.total_seconds(),
+            status=response.status_code,
+        )
+
+
+def _describe_keys(args):
+    if not args:
+        return ""
+    keys = args[0]
+    if isinstance(keys, dict):
+        keys = list(keys)
+    if isinstance(keys, (list, tuple)):
+        return f"{len(keys)} keys"
+    return str(keys)
+
+
+def _instrumented(method, fn):
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        if _events.get() is None or _in_cache_call.get():
+            return fn(self, *args, **kwargs)
+        token = _in_cache_call.set(True)
+        start = time.perf_counter()
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            _in_cache_call.reset(token)
+            record("cache", method, time.perf_counter() - start, key=_describe_keys(args))
+    wrapper.profiled = True
+    return wrapper
+
+
+def instrument_cache(alias="default"):
+    """Wrap the cache backend's methods so profiled requests record their calls"""
+    backend = type(caches[alias])
+    for method in CACHE_METHODS:
+        fn = getattr(backend, method, None)
+        if fn is not None and not getattr(fn, "profiled", False):
+            setattr(backend, method, _instrumented(method, fn))
+
+
+def _start(engine):
+    if engine == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            engine = "cprofile"
+        else:
+            profiler = Profiler(interval=0.001)
+            profiler.start()
+            return engine, profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return "cprofile", profiler
+
+
+def _stop(engine, profiler):
+    """(text summary, flamegraph format, flamegraph data) for a finished profiler"""
+    if engine == "pyinstrument":
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        profiler.stop()
+        return profiler.output_text(unicode=False, color=False), "speedscope", profiler.output(SpeedscopeRenderer())
+
+    profiler.disable()
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(40)
+    # Same bytes as Stats.dump_stats(), loadable by pstats/snakeviz/flameprof
+    return out.getvalue(), "pstats", base64.b64encode(marshal.dumps(stats.stats)).decode()
+
+
+def _summarize(events):
+    summary = {}
+    for kind in ("cache", "upstream"):
+        calls = [e["ms"] for e in events if e["kind"] == kind]
+        summary[f"{kind}_calls"] = len(calls)
+        summary[f"{kind}_ms"] = round(sum(calls), 3)
+    return summary
+
+
+def _save(meta, payload):
+    try:
+        blob = zlib.compress(json.dumps(payload).encode())
+        r = get_redis_connection("default")
+        pipe = r.pipeline(transaction=False)
+        pipe.setex(f"profiling:profile:{meta['id']}", settings.PROFILING_TTL, blob)
+        pipe.lpush(INDEX_KEY, json.dumps(meta))
+        pipe.ltrim(INDEX_KEY, 0, settings.PROFILING_BUFFER_SIZE - 1)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Could not store profile %s: %s", meta["id"], e)
+
+
+def recent_profiles():
+    """Metadata of the buffered profiles, newest first"""
+    r = get_redis_connection("default")
+    return [json.loads(item) for item in r.lrange(INDEX_KEY, 0, -1)]
+
+
+def get_profile(profile_id):
+    data = get_redis_connection("default").get(f"profiling:profile:{profile_id}")
+    return json.loads(zlib.decompress(data)) if data else None
+
+
+class ProfilingMiddleware:
+    """Profile requests on demand (X-Profile + X-Admin-Token) or by sampling"""
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrument_cache()
+
+    def _engine(self, request):
+        """Profiling engine for this request, or None to not profile it"""
+        requested = request.META.get("HTTP_X_PROFILE")
+        if requested and HasAdminToken().has_permission(request, None):
+            return (requested if requested in ENGINES else settings.PROFILING_ENGINE), "header"
+        if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return settings.PROFILING_ENGINE, "sample"
+        return None, None
+
+    def __call__(self, request):
+        engine, trigger = self._engine(request)
+        if engine is None:
+            return self.get_response(request)
+
+        events = []
+        token = _events.set(events)
+        started_at = datetime.now(timezone.utc)
+        try:
+            engine, profiler = _start(engine)
+        except ValueError as e:
+            # Another profiler is already active in this thread
+            logger.warning("Not profiling %s: %s", request.path, e)
+            _events.reset(token)
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            summary, flame_format, flame = _stop(engine, profiler)
+            _events.reset(token)
+
+        meta = {
+            "id": uuid.uuid4().hex[:16],
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "engine": engine,
+            "trigger": trigger,
+            "started_at": started_at.isoformat(),
+            **_summarize(events),
+        }
+        _save(meta, dict(meta, summary=summary, events=events, flame_format=flame_format, flame=flame))
+        response["X-Profile-Id"] = meta["id"]
+        return response
@@ -0,0 +1,221 @@
+"""
+Token-budgeted prompt building for the LLM recommendation call
+
+Movie data is the only unbounded part of the prompt, so it is compacted:
+genres and keywords are de-duplicated across seed movies, overviews are
+cut at sentence boundaries and the least relevant seeds are dropped until
+the movie section fits the configured token budget.
+"""
+import logging
+import math
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+_encoding = None
+
+logger = logging.getLogger(__name__)
+
+# Per-process LLM token usage, to compare single and batched calls
+_token_usage = {"calls": 0, "recommendations": 0, "prompt_tokens": 0, "completion_tokens": 0}
+_token_usage_lock = threading.Lock()
+
+
+def _get_encoding():
+    """The tiktoken encoding for LLM_MODEL, loaded on first use (False if unavailable)"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+        except ImportError:  # Optional: falls back to the heuristic counter
+            _encoding = False
+        else:
+            try:
+                _encoding = tiktoken.encoding_for_model(settings.LLM_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding or None
+
+
+def count_tokens(text):
+    """
+    Count prompt tokens locally
+
+    Uses tiktoken when it is installed, otherwise a BPE-like estimate:
+    short words are one token, longer words roughly one token per four
+    characters, punctuation one token each.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _TOKEN_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Truncate text to whole sentences within max_tokens (falls back to words)"""
+    if not text or count_tokens(text) <= max_tokens:
+        return text or ""
+
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_PATTERN.split(text.strip()):
+        cost = count_tokens(sentence)
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+    if kept:
+        return " ".join(kept)
+
+    # First sentence alone is too long: cut it at a word boundary
+    words = []
+    used = 0
+    for word in text.split():
+        cost = count_tokens(word)
+        if used + cost > max_tokens - 1:
+            break
+        words.append(word)
+        used += cost
+    return " ".join(words) + "..."
+
+
+def _genre_names(movie):
+    return [g["name"] for g in movie.get("genres", []) if g.get("name")]
+
+
+def _keyword_names(movie):
+    return [k["name"] for k in movie.get("keywords", {}).get("keywords", []) if k.get("name")]
+
+
+def rank_seed_movies(preferences, movie_data_list):
+    """
+    Order seed movies by how much they tell the LLM about the user's taste
+
+    A movie scores for matching the preferred genres, for sharing keywords
+    with the other seeds (a recurring signal rather than noise) and, lightly,
+    for being well known. Ties keep the order the client sent.
+    """
+    preferred = {g.lower() for g in preferences.get("genres", [])}
+    keyword_counts = Counter(k.lower() for movie in movie_data_list for k in set(_keyword_names(movie)))
+
+    def score(item):
+        index, movie = item
+        genres = {g.lower() for g in _genre_names(movie)}
+        keywords = {k.lower() for k in _keyword_names(movie)}
+        genre_score = len(genres & preferred)
+        shared_keywords = sum(1 for k in keywords if keyword_counts[k] > 1)
+        popularity = math.log1p(movie.get("vote_count") or 0) / 10
+        return (-(2 * genre_score + shared_keywords + popularity), index)
+
+    return [movie for _, movie in sorted(enumerate(movie_data_list), key=score)]
+
+
+def _movie_line(movie, overview_tokens, genres, keywords):
+    release_date = movie.get("release_date") or ""
+    year = release_date[:4] if release_date else "Unknown"
+    lines = [f"Movie: {movie.get('title', 'Unknown')} ({year})"]
+    if genres:
+        lines.append(f"Genres: {', '.join(genres)}")
+    overview = truncate_to_tokens(movie.get("overview") or "", overview_tokens)
+    if overview:
+        lines.append(f"Overview: {overview}")
+    if keywords:
+        lines.append(f"Keywords: {', '.join(keywords)}")
+    return "\n".join(lines) + "\n"
+
+
+def build_movie_section(preferences, movie_data_list, token_budget=None, max_seeds=None):
+    """
+    Build the "Movie Data" part of the prompt within a token budget
+
+    Returns (text, stats) where stats has the token count and how many
+    seed movies were kept.
+    """
+    token_budget = token_budget or settings.LLM_PROMPT_TOKEN_BUDGET
+    max_seeds = max_seeds or settings.LLM_MAX_SEED_MOVIES
+    max_overview_tokens = settings.LLM_OVERVIEW_MAX_TOKENS
+    max_keywords = settings.LLM_MAX_KEYWORDS
+
+    ranked = rank_seed_movies(preferences, movie_data_list)[:max_seeds]
+
+    def render(movies):
+        genre_counts = Counter(g for movie in movies for g in dict.fromkeys(_genre_names(movie)))
+        keyword_counts = Counter(k for movie in movies for k in dict.fromkeys(_keyword_names(movie)))
+        # Genres and keywords that recur across seeds are listed once with
+        # their count; each movie then only carries what is specific to it.
+        shared_genres = {g for g, n in genre_counts.items() if n > 1}
+        shared = [k for k, n in keyword_counts.most_common(max_keywords) if n > 1]
+        shared_set = set(shared)
+        per_movie_keywords = max(2, (max_keywords - len(shared)) // max(1, len(movies)))
+
+        header = ""
+        if shared_genres:
+            header += "Recurring genres: " + ", ".join(
+                f"{g} (x{n})" for g, n in genre_counts.most_common() if g in shared_genres
+            ) + "\n"
+        if shared:
+            header += "Recurring keywords: " + ", ".join(f"{k} (x{keyword_counts[k]})" for k in shared) + "\n"
+        if header:
+            header += "\n"
+
+        overview_tokens = max_overview_tokens
+        while True:
+            body = "\n".join(
+                _movie_line(
+                    movie,
+                    overview_tokens,
+                    [g for g in dict.fromkeys(_genre_names(movie)) if g not in shared_genres],
+                    [k for k in dict.fromkeys(_keyword_names(movie)) if k not in shared_set][:per_movie_keywords],
+                )
+                for movie in movies
+            )
+            text = header + body
+            tokens = count_tokens(text)
+            if tokens <= token_budget or overview_tokens <= 15:
+                return text, tokens
+            overview_tokens = max(15, overview_tokens * 2 // 3)
+
+    text, tokens = render(ranked)
+    # Still over budget with short overviews: drop the least relevant seeds
+    while tokens > token_budget and len(ranked) > 1:
+        ranked = ranked[:-1]
+        text, tokens = render(ranked)
+
+    return text, {
+        "tokens": tokens,
+        "seeds_used": len(ranked),
+        "seeds_total": len(movie_data_list),
+    }
+
+
+def record_token_usage(llm_response, recommendations):
+    """Record the provider-reported token usage of one LLM call serving N recommendations"""
+    usage = llm_response.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    with _token_usage_lock:
+        _token_usage["calls"] += 1
+        _token_usage["recommendations"] += recommendations
+        _token_usage["prompt_tokens"] += prompt_tokens
+        _token_usage["completion_tokens"] += completion_tokens
+    logger.info(
+        "LLM usage: %d prompt + %d completion tokens for %d recommendation(s), %.0f per recommendation",
+        prompt_tokens, completion_tokens, recommendations,
+        (prompt_tokens + completion_tokens) / max(1, recommendations)
+    )
+
+
+def get_token_usage():
+    """Totals since process start, plus average tokens per recommendation"""
+    with _token_usage_lock:
+        usage = dict(_token_usage)
+    total = usage["prompt_tokens"] + usage["completion_tokens"]
+    usage["tokens_per_recommendation"] = total / usage["recommendations"] if usage["recommendations"] else 0
+    return usage
@@ -0,0 +1,200 @@
+"""
+Local reranking and diversification of discover candidates
+
+Several discover pages are pulled concurrently, scored in one vectorized
+pass against the seed movies (genre similarity, keyword match, quality,
+popularity, recency) and then diversified with maximal marginal relevance
+so the top-k is not ten near-identical movies.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.conf import settings
+
+from . import governor
+from .resolution import resolve_genres
+from .services import TMDBService
+
+logger = logging.getLogger(__name__)
+
+# Feature weights for the relevance score
+WEIGHTS = {
+    "genre": 0.45,
+    "keyword": 0.20,
+    "quality": 0.15,
+    "popularity": 0.10,
+    "recency": 0.10,
+}
+RECENCY_HALF_LIFE_YEARS = 15
+# Prior vote count for the Bayesian-averaged rating
+QUALITY_PRIOR_VOTES = 200
+
+
+def fetch_candidates(with_genres, with_keywords, sort_by, pages):
+    """
+    Pull several discover pages concurrently
+
+    When keywords are given, a genres-only query widens the pool; candidates
+    found by the keyword query are flagged as keyword matches. Keywords keep
+    the LLM's AND semantics (TMDB ","); only when fewer than RERANK_TOP_K
+    movies have all of several keywords does an OR query ("|") backfill
+    the pool, so one rare keyword does not empty it.
+
+    Failed pages are skipped as long as one page succeeds; when every page
+    fails the first error is raised (an open circuit, an upstream error),
+    rather than recommending from an empty pool.
+
+    Returns:
+        dict of movie ID -> (result dict, keyword_match), where keyword_match
+        is 1.0 for all keywords, 0.5 for some (backfill) and 0.0 for none
+    """
+    tmdb_service = TMDBService()
+    candidates = {}
+    errors = []
+    attempts = 0
+
+    def fetch(job):
+        keywords, match, page = job
+        try:
+            return match, tmdb_service.discover_movies(
+                with_genres=with_genres,
+                with_keywords=keywords,
+                sort_by=sort_by,
+                page=page
+            )
+        except Exception as e:
+            logger.warning("Discover page %s failed: %s", page, e)
+            return match, e
+
+    def collect(queries):
+        # `pages` pages of each (keywords, keyword_match) query
+        nonlocal attempts
+        jobs = [(keywords, match, page) for keywords, match in queries for page in range(1, pages + 1)]
+        attempts += len(jobs)
+        with ThreadPoolExecutor(max_workers=min(len(jobs), 8)) as pool:
+            for match, data in pool.map(governor.bind(fetch), jobs):
+                if isinstance(data, Exception):
+                    errors.append(data)
+                    continue
+                for result in data.get("results", []):
+                    _, best = candidates.get(result["id"], (result, 0.0))
+                    candidates[result["id"]] = (result, max(best, match))
+
+    queries = [(None, 0.0)]
+    if with_keywords:
+        queries.insert(0, (",".join(map(str, with_keywords)), 1.0))
+    collect(queries)
+    if with_keywords and len(with_keywords) > 1:
+        if sum(1 for _, match in candidates.values() if match == 1.0) < settings.RERANK_TOP_K:
+            collect([("|".join(map(str, with_keywords)), 0.5)])
+    if errors and len(errors) == attempts:
+        raise errors[0]
+    return candidates
+
+
+def _seed_genre_ids(movie):
+    ids = [g["id"] for g in movie.get("genres", []) if g.get("id")]
+    if not ids:
+        # Seeds built from stored Movie rows only carry genre names
+        ids = resolve_genres([g["name"] for g in movie.get("genres", []) if g.get("name")])
+    return ids
+
+
+def _release_year(result):
+    release_date = result.get("release_date") or ""
+    return int(release_date[:4]) if release_date[:4].isdigit() else None
+
+
+def rerank(candidates, seed_movies, exclude_ids=(), k=None, diversity=None):
+    """
+    Score and diversify candidates
+
+    Args:
+        candidates: dict of movie ID -> (result dict, keyword_match)
+        seed_movies: seed movie dicts (TMDB details or stored-movie shape)
+        exclude_ids: movie IDs never to return (seeds, favorites)
+        k: number of results
+        diversity: MMR trade-off, 0 = pure relevance, 1 = pure novelty
+
+    Returns:
+        list of result dicts with an added "score", best first
+    """
+    # Imported here so workers that never rerank do not pay for NumPy at
+    # boot; gunicorn's preload warm-up imports it once before forking
+    import numpy as np
+
+    k = k or settings.RERANK_TOP_K
+    diversity = settings.RERANK_DIVERSITY if diversity is None else diversity
+    excluded = {str(m) for m in exclude_ids} | {str(m.get("id")) for m in seed_movies}
+
+    items = [(r, matched) for movie_id, (r, matched) in candidates.items() if str(movie_id) not in excluded]
+    if not items:
+        return []
+    results = [r for r, _ in items]
+
+    seed_genres = [_seed_genre_ids(m) for m in seed_movies]
+    vocabulary = {g: i for i, g in enumerate(sorted(
+        {g for r in results for g in r.get("genre_ids", [])} | {g for ids in seed_genres for g in ids}
+    ))}
+
+    # Candidate x genre matrix, L2-normalized rows
+    genres = np.zeros((len(results), max(1, len(vocabulary))), dtype=np.float32)
+    for row, result in enumerate(results):
+        for g in result.get("genre_ids", []):
+            genres[row, vocabulary[g]] = 1.0
+    norms = np.linalg.norm(genres, axis=1, keepdims=True)
+    genres = np.divide(genres, norms, out=np.zeros_like(genres), where=norms > 0)
+
+    profile = np.zeros(genres.shape[1], dtype=np.float32)
+    for ids in seed_genres:
+        for g in ids:
+            profile[vocabulary[g]] += 1.0
+    profile_norm = np.linalg.norm(profile)
+    genre_sim = genres @ (profile / profile_norm) if profile_norm else np.zeros(len(results), dtype=np.float32)
+
+    keyword = np.array([matched for _, matched in items], dtype=np.float32)
+    vote_average = np.array([r.get("vote_average") or 0.0 for r in results], dtype=np.float32)
+    vote_count = np.array([r.get("vote_count") or 0 for r in results], dtype=np.float32)
+    mean_rating = float(np.average(vote_average, weights=vote_count)) if vote_count.sum() else 6.0
+    quality = (vote_count * vote_average + QUALITY_PRIOR_VOTES * mean_rating) / (vote_count + QUALITY_PRIOR_VOTES) / 10
+    popularity = np.log1p(np.array([r.get("popularity") or 0.0 for r in results], dtype=np.float32))
+    popularity = popularity / popularity.max() if popularity.max() > 0 else popularity
+    this_year = date.today().year
+    ages = np.array([this_year - (_release_year(r) or this_year - 30) for r in results], dtype=np.float32)
+    recency = np.exp2(-np.clip(ages, 0, None) / RECENCY_HALF_LIFE_YEARS)
+
+    relevance = (
+        WEIGHTS["genre"] * genre_sim
+        + WEIGHTS["keyword"] * keyword
+        + WEIGHTS["quality"] * quality
+        + WEIGHTS["popularity"] * popularity
+        + WEIGHTS["recency"] * recency
+    )
+
+    # Maximal marginal relevance over genre vectors
+    selected = []
+    max_similarity = np.zeros(len(results), dtype=np.float32)
+    available = np.ones(len(results), dtype=bool)
+    for _ in range(min(k, len(results))):
+        mmr = (1 - diversity) * relevance - diversity * max_similarity
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, genres @ genres[best])
+
+    return [dict(results[i], score=round(float(relevance[i]), 4)) for i in selected]
+
+
+def ranked_discover(with_genres, with_keywords, sort_by, seed_movies, exclude_ids=()):
+    """Discover + rerank, returned in the shape of a TMDB discover page"""
+    candidates = fetch_candidates(with_genres, with_keywords, sort_by, settings.RERANK_PAGES)
+    results = rerank(candidates, seed_movies, exclude_ids=exclude_ids)
+    return {
+        "page": 1,
+        "results": results,
+        "total_pages": 1,
+        "total_results": len(results),
+        "candidates_considered": len(candidates),
+    }
@@ -0,0 +1,210 @@
+"""
+The recommendation pipeline: seed movies -> LLM filters -> TMDB discover
+"""
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+from . import governor
+from .exceptions import NoSeedMovies, UpstreamUnavailable
+from .extractor import extract_filters
+from .ranking import ranked_discover
+from .resilience import get_breaker
+from .resolution import resolve_genres, resolve_keywords
+from .services import TMDBService, LLMService
+from .utils import fetch_movie_details_with_keywords
+
+logger = logging.getLogger(__name__)
+
+# Failures that make the pipeline fall back to local filter extraction
+LLM_FALLBACK_ERRORS = (UpstreamUnavailable, requests.RequestException, ValueError, TimeoutError)
+
+# Concurrent requests each pool serves
+POOL_REQUESTS = 8
+
+_pools = {}
+
+
+def _get_pool(name):
+    """
+    This process's pool for LLM calls ("llm") or early discovers ("discover")
+
+    An LLM call abandoned at the latency budget keeps its thread until the
+    LLM read timeout, so the LLM pool has room for the calls that can pile
+    up meanwhile instead of letting them starve newer requests.
+    """
+    pool, pid = _pools.get(name, (None, None))
+    if pool is None or pid != os.getpid():
+        workers = POOL_REQUESTS
+        if name == "llm":
+            call_time = settings.LLM_CONNECT_TIMEOUT + settings.LLM_READ_TIMEOUT
+            workers *= max(1, math.ceil(call_time / settings.LLM_LATENCY_BUDGET))
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"recommendation-{name}")
+        _pools[name] = (pool, os.getpid())
+    return pool
+
+
+def _filters_key(tmdb_filters):
+    return (
+        tuple(tmdb_filters.get("with_genres") or []),
+        tuple(tmdb_filters.get("with_keywords") or []),
+        tmdb_filters.get("sort_by", "popularity.desc"),
+    )
+
+
+def get_filters(preferences, movie_data_list):
+    """
+    Get recommendation filters from the LLM, falling back to local extraction
+
+    The local extractor answers when the LLM circuit is open, when the LLM
+    fails, or when it has not answered within LLM_LATENCY_BUDGET seconds.
+
+    Returns:
+        (recommendation_filters, source) where source is "llm" or "local"
+    """
+    llm_service = LLMService()
+    if not settings.LOCAL_FILTERS_FALLBACK_ENABLED:
+        return llm_service.get_recommendation_filters(preferences, movie_data_list), "llm"
+
+    if get_breaker("llm").is_open:
+        return extract_filters(preferences, movie_data_list), "local"
+
+    future = _get_pool("llm").submit(
+        governor.bind(llm_service.get_recommendation_filters), preferences, movie_data_list
+    )
+    try:
+        return future.result(timeout=settings.LLM_LATENCY_BUDGET), "llm"
+    except TimeoutError:
+        # Drops the call if it is still queued; a running one ends at the LLM timeout
+        future.cancel()
+        logger.warning("LLM exceeded %.1fs latency budget; using local filters", settings.LLM_LATENCY_BUDGET)
+    except LLM_FALLBACK_ERRORS as e:
+        logger.warning("LLM failed (%s); using local filters", e)
+    return extract_filters(preferences, movie_data_list), "local"
+
+
+def _stream_filters(preferences, movie_data_list, exclude_ids=()):
+    """
+    Stream the LLM analysis and start TMDB discover as soon as the filters are in
+
+    Discover runs while themes and mood are still streaming. Returns
+    (recommendation_filters, discover_future); the future is None when the
+    final filters differ from the early ones (they should not), and raises
+    discover's own errors only once its result is asked for. Like
+    get_filters, the LLM is held to LLM_LATENCY_BUDGET when the local
+    fallback is enabled (TimeoutError past it).
+    """
+    early = {}
+
+    def on_filters(tmdb_filters):
+        if early.get("abandoned"):
+            return
+        early["key"] = _filters_key(tmdb_filters)
+        early["future"] = _get_pool("discover").submit(
+            governor.bind(discover_from_filters), {"tmdbFilters": tmdb_filters}, movie_data_list, exclude_ids
+        )
+
+    def stream():
+        return LLMService().get_recommendation_filters(preferences, movie_data_list, on_filters=on_filters)
+
+    try:
+        if not settings.LOCAL_FILTERS_FALLBACK_ENABLED:
+            recommendation_filters = stream()
+        else:
+            future = _get_pool("llm").submit(governor.bind(stream))
+            try:
+                recommendation_filters = future.result(timeout=settings.LLM_LATENCY_BUDGET)
+            except TimeoutError:
+                # Drops the call if it is still queued; a running one ends at the LLM timeout
+                future.cancel()
+                raise TimeoutError(f"LLM exceeded {settings.LLM_LATENCY_BUDGET:.1f}s latency budget")
+    except BaseException:
+        early["abandoned"] = True
+        if "future" in early:
+            early["future"].cancel()
+        raise
+
+    future = early.get("future")
+    if future is not None and early["key"] != _filters_key(recommendation_filters.get("tmdbFilters", {})):
+        logger.warning("Streamed filters changed after early discover; rerunning discover")
+        future.cancel()
+        future = None
+    return recommendation_filters, future
+
+
+def discover_from_filters(recommendation_filters, seed_movies=None, exclude_ids=()):
+    """
+    Run TMDB discover for the tmdbFilters part of an LLM analysis
+
+    With RERANK_ENABLED and seed movies, several pages are pulled and
+    reranked locally; seeds and exclude_ids never come back.
+    """
+    tmdb_filters = recommendation_filters.get("tmdbFilters", {})
+    sort_by = tmdb_filters.get("sort_by", "popularity.desc")
+
+    # Resolve genre/keyword names (or IDs) to TMDB IDs locally
+    with_genres = resolve_genres(tmdb_filters.get("with_genres", [])) or None
+    with_keywords = resolve_keywords(tmdb_filters.get("with_keywords", [])) or None
+
+    if settings.RERANK_ENABLED and seed_movies:
+        return ranked_discover(with_genres, with_keywords, sort_by, seed_movies, exclude_ids=exclude_ids)
+
+    tmdb_service = TMDBService()
+    return tmdb_service.discover_movies(
+        with_genres=with_genres,
+        with_keywords=with_keywords,
+        sort_by=sort_by,
+        page=1
+    )
+
+
+def generate_recommendations(preferences, movie_ids=None, movie_data_list=None, exclude_ids=()):
+    """
+    Get recommendations for preferences and seed movies
+
+    Seeds are either TMDB movie IDs (details and keywords are fetched) or
+    already-built movie data dictionaries. Seeds and exclude_ids (e.g. the
+    user's favorites) are left out of reranked results.
+
+    Returns:
+        dict with "recommendations" (TMDB discover page) and "analysis"
+    """
+    if movie_data_list is None:
+        movie_data_list = fetch_movie_details_with_keywords(movie_ids or [])
+    if not movie_data_list:
+        raise NoSeedMovies("No valid movie data could be fetched")
+
+    early_discover = None
+    if settings.LLM_STREAM_ENABLED and not get_breaker("llm").is_open:
+        try:
+            recommendation_filters, early_discover = _stream_filters(preferences, movie_data_list, exclude_ids)
+            source = "llm"
+        except LLM_FALLBACK_ERRORS as e:
+            if not settings.LOCAL_FILTERS_FALLBACK_ENABLED:
+                raise
+            logger.warning("Streamed LLM call failed (%s); using local filters", e)
+            recommendation_filters, source = extract_filters(preferences, movie_data_list), "local"
+    else:
+        # Get recommendation filters from LLM (or the local fallback)
+        recommendation_filters, source = get_filters(preferences, movie_data_list)
+
+    # Outside the LLM fallback: a TMDB failure here is not an LLM failure
+    if early_discover is not None:
+        recommendations = early_discover.result()
+    else:
+        recommendations = discover_from_filters(recommendation_filters, movie_data_list, exclude_ids)
+
+    return {
+        "recommendations": recommendations,
+        "analysis": {
+            "themes": recommendation_filters.get("themes", []),
+            "genres": recommendation_filters.get("genres", []),
+            "keywords": recommendation_filters.get("keywords", []),
+            "mood": recommendation_filters.get("mood", ""),
+            "source": source,
+        }
+    }
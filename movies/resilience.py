@@ -0,0 +1,218 @@
+"""
+Resilience helpers for upstream calls (TMDB, LLM)
+
+Circuit breaker state is kept in the shared Redis cache so that every
+gunicorn worker (and every node) trips and recovers together.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from .exceptions import UpstreamRateLimited, UpstreamUnavailable
+from .profiling import record_response
+
+logger = logging.getLogger(__name__)
+
+
+def is_upstream_failure(exc):
+    """Whether an exception means the upstream is degraded (not a client error)"""
+    if isinstance(exc, UpstreamUnavailable):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return isinstance(exc, requests.RequestException)
+
+
+class CircuitBreaker:
+    """
+    Redis-backed circuit breaker
+
+    closed    -> calls go through, failures are counted in a sliding window
+    open      -> calls fail fast with UpstreamUnavailable until reset_timeout
+    half-open -> a single probe call is let through; success closes the
+                 circuit, failure opens it again
+    """
+
+    def __init__(self, name, failure_threshold=None, window=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        self.window = window or settings.CIRCUIT_BREAKER_WINDOW
+        self.reset_timeout = reset_timeout or settings.CIRCUIT_BREAKER_RESET_TIMEOUT
+
+        self.failures_key = f"cb:{name}:failures"
+        self.open_key = f"cb:{name}:open"
+        self.half_open_key = f"cb:{name}:half_open"
+        self.probe_key = f"cb:{name}:probe"
+
+    def _safe(self, fn, default=None):
+        # Breaker bookkeeping must never take the request down with it
+        try:
+            return fn()
+        except Exception as e:
+            logger.warning("Circuit breaker %s: cache unavailable (%s)", self.name, e)
+            return default
+
+    @property
+    def is_open(self):
+        return bool(self._safe(lambda: cache.get(self.open_key)))
+
+    def allow_request(self):
+        """Return True if a call may be attempted right now"""
+        state = self._safe(lambda: cache.get_many([self.open_key, self.half_open_key]), default={})
+        if state.get(self.open_key):
+            return False
+        if state.get(self.half_open_key):
+            # Only one worker gets to probe the upstream per reset period
+            return bool(self._safe(lambda: cache.add(self.probe_key, 1, self.reset_timeout), default=True))
+        return True
+
+    def record_success(self):
+        # Healthy closed circuit (the common case): a single read, no writes
+        state = self._safe(lambda: cache.get_many([self.failures_key, self.half_open_key]), default={})
+        if not state:
+            return
+        if state.get(self.half_open_key):
+            logger.info("Circuit breaker %s: closed", self.name)
+        self._safe(lambda: cache.delete_many([self.failures_key, self.half_open_key, self.probe_key]))
+
+    def record_failure(self):
+        if self._safe(lambda: cache.get(self.half_open_key)):
+            self.trip()
+            return
+
+        def incr():
+            cache.add(self.failures_key, 0, self.window)
+            return cache.incr(self.failures_key)
+
+        failures = self._safe(incr, default=0)
+        if failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self):
+        logger.warning("Circuit breaker %s: open for %ss", self.name, self.reset_timeout)
+        self._safe(lambda: cache.set(self.open_key, 1, self.reset_timeout))
+        # Half-open marker outlives the open marker; it is cleared on the first success
+        self._safe(lambda: cache.set(self.half_open_key, 1, self.reset_timeout * 10))
+        self._safe(lambda: cache.delete_many([self.failures_key, self.probe_key]))
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn through the breaker, raising UpstreamUnavailable when open"""
+        if not self.allow_request():
+            raise UpstreamUnavailable(self.name, retry_after=self.reset_timeout)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            # Our own pacing giving up says nothing about the upstream's health
+            if is_upstream_failure(e) and not isinstance(e, UpstreamRateLimited):
+                self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+class LatencyTracker:
+    """Per-process rolling latency samples used to pick the hedge delay"""
+
+    def __init__(self, maxlen=200, min_samples=20):
+        self.samples = deque(maxlen=maxlen)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct, default=None):
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return default
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+
+_breakers = {}
+_latency = {}
+_sessions = {}
+_hedge_pool = None
+_hedge_pool_pid = None
+
+
+def get_breaker(name):
+    """Get the circuit breaker for an upstream ('tmdb', 'llm')"""
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+
+def get_latency_tracker(name):
+    if name not in _latency:
+        _latency[name] = LatencyTracker()
+    return _latency[name]
+
+
+def get_session(name):
+    """
+    Get a keep-alive requests.Session for an upstream
+
+    Sessions are created per process so they are never shared across a fork.
+    """
+    key = (name, os.getpid())
+    if key not in _sessions:
+        session = requests.Session()
+        # Records the call when the current request is being profiled
+        session.hooks["response"].append(record_response)
+        _sessions[key] = session
+    return _sessions[key]
+
+
+def _get_hedge_pool():
+    global _hedge_pool, _hedge_pool_pid
+    if _hedge_pool is None or _hedge_pool_pid != os.getpid():
+        _hedge_pool = ThreadPoolExecutor(
+            max_workers=settings.TMDB_HEDGE_MAX_WORKERS,
+            thread_name_prefix="tmdb-hedge"
+        )
+        _hedge_pool_pid = os.getpid()
+    return _hedge_pool
+
+
+def hedged_call(fn, delay):
+    """
+    Call fn, and if it has not finished after `delay` seconds fire a second
+    identical call and return whichever finishes first.
+
+    Only use this for idempotent requests.
+    """
+    pool = _get_hedge_pool()
+    first = pool.submit(contextvars.copy_context().run, fn)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    logger.info("Hedging slow upstream request after %.3fs", delay)
+    second = pool.submit(contextvars.copy_context().run, fn)
+    done, pending = wait([first, second], return_when=FIRST_COMPLETED)
+    winner = done.pop()
+    if winner.exception() is not None and pending:
+        # The first one back failed; give the other attempt a chance
+        return pending.pop().result()
+    return winner.result()
+
+
+def timed(tracker, fn):
+    """Wrap fn so successful call durations are recorded on tracker"""
+    def wrapper():
+        start = time.monotonic()
+        result = fn()
+        tracker.record(time.monotonic() - start)
+        return result
+    return wrapper
@@ -0,0 +1,232 @@
+"""
+Local genre/keyword ID resolution for LLM output
+
+The LLM returns plain genre and keyword strings; they are mapped to TMDB
+IDs through an in-memory index built from the Genre and Keyword tables, so
+resolving costs dictionary lookups instead of TMDB /search/keyword calls.
+Keyword rows are ingested whenever movie keywords are fetched from TMDB:
+the ingesting process adds them to its index in place, and other
+processes reload theirs at most every RESOLUTION_KEYWORDS_PUBLISH_INTERVAL
+seconds to pick them up.
+"""
+import difflib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Genre, Keyword
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "resolution_index:version"
+# Set when keywords were ingested since the last version bump
+PENDING_KEY = "resolution_index:keywords_pending"
+# Held for RESOLUTION_KEYWORDS_PUBLISH_INTERVAL after a keywords bump
+PUBLISHED_KEY = "resolution_index:keywords_published"
+
+# Alternative spellings the LLM (or users) use for TMDB genre names
+GENRE_ALIASES = {
+    "action": ["action movie", "action film"],
+    "adventure": ["adventures"],
+    "animation": ["animated", "cartoon", "anime"],
+    "comedy": ["comedies", "funny", "humor", "humour"],
+    "crime": ["noir", "gangster", "heist"],
+    "documentary": ["documentaries", "doc", "docs"],
+    "drama": ["dramas", "dramatic"],
+    "family": ["kids", "children", "family friendly"],
+    "fantasy": ["fantastical"],
+    "history": ["historical", "period", "period piece", "biopic"],
+    "horror": ["scary", "slasher"],
+    "music": ["musical", "musicals"],
+    "mystery": ["whodunit", "detective"],
+    "romance": ["romantic", "rom com", "romcom", "love story"],
+    "science fiction": ["sci fi", "scifi", "sf", "science-fiction"],
+    "tv movie": ["television movie", "made for tv"],
+    "thriller": ["thrillers", "suspense", "psychological thriller"],
+    "war": ["war movie", "military"],
+    "western": ["westerns", "cowboy"],
+}
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Normalize a genre/keyword string for lookup: case, accents, punctuation, plurals"""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode()
+    text = _PUNCTUATION.sub(" ", text.lower())
+    words = []
+    for word in _WHITESPACE.split(text.strip()):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        if word:
+            words.append(word)
+    return " ".join(words)
+
+
+class ResolutionIndex:
+    """In-memory genre/keyword name -> TMDB ID lookup tables"""
+
+    def __init__(self, genres=(), keywords=()):
+        self.genres = {}
+        self.keywords = {}
+        self.genre_ids = set()
+        self.keyword_ids = set()
+        # Fuzzy candidates bucketed by their first three characters so a
+        # miss only compares against a handful of names
+        self._buckets = defaultdict(list)
+        for genre_id, name, aliases in genres:
+            self.genre_ids.add(genre_id)
+            self.genres[normalize(name)] = genre_id
+            for alias in aliases:
+                self.genres.setdefault(normalize(alias), genre_id)
+        for keyword_id, normalized in keywords:
+            self.add_keyword(keyword_id, normalized)
+
+    def add_keyword(self, keyword_id, normalized):
+        self.keyword_ids.add(keyword_id)
+        if normalized and normalized not in self.keywords:
+            self.keywords[normalized] = keyword_id
+            self._buckets[normalized[:3]].append(normalized)
+
+    def resolve_genre(self, value):
+        # Numeric IDs are only trusted when they are known TMDB IDs
+        if isinstance(value, int) or str(value).isdigit():
+            return int(value) if int(value) in self.genre_ids else None
+        return self.genres.get(normalize(value))
+
+    def resolve_keyword(self, value, fuzzy=True):
+        if isinstance(value, int) or str(value).isdigit():
+            return int(value) if int(value) in self.keyword_ids else None
+        key = normalize(value)
+        if key in self.keywords:
+            return self.keywords[key]
+        if not fuzzy or not key:
+            return None
+        matches = difflib.get_close_matches(key, self._buckets.get(key[:3], []), n=1, cutoff=0.85)
+        return self.keywords[matches[0]] if matches else None
+
+
+_index = None
+_index_version = None
+_index_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _load_index(sync=True):
+    genres = list(Genre.objects.values_list("id", "name", "aliases"))
+    if not genres:
+        if not sync:
+            raise LookupError("No genres stored yet")
+        genres = sync_genres()
+    keywords = Keyword.objects.values_list("id", "normalized").iterator(chunk_size=5000)
+    return ResolutionIndex(genres, keywords)
+
+
+def get_index(sync=True):
+    """
+    Get the process-wide resolution index
+
+    The index is rebuilt when another process bumps the version key
+    (checked at most every RESOLUTION_INDEX_REFRESH seconds). With
+    sync=False an empty genre table raises LookupError instead of fetching
+    the genres from TMDB.
+    """
+    global _index, _index_version, _index_checked_at
+    now = time.monotonic()
+    if _index is not None and now - _index_checked_at < settings.RESOLUTION_INDEX_REFRESH:
+        return _index
+
+    with _lock:
+        state = cache.get_many([VERSION_KEY, PENDING_KEY])
+        version = state.get(VERSION_KEY, 0)
+        if state.get(PENDING_KEY) and cache.add(PUBLISHED_KEY, 1, settings.RESOLUTION_KEYWORDS_PUBLISH_INTERVAL):
+            # Keywords other processes ingested: one reload everywhere,
+            # this process included
+            cache.delete(PENDING_KEY)
+            version = _incr_version()
+        if _index is None or version != _index_version:
+            _index = _load_index(sync)
+            _index_version = version
+            logger.info(
+                "Loaded resolution index: %d genre names, %d keywords",
+                len(_index.genres), len(_index.keywords)
+            )
+        _index_checked_at = now
+    return _index
+
+
+def _incr_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+        return 1
+
+
+def bump_version():
+    """Tell other processes to reload their index"""
+    global _index_version
+    version = _incr_version()
+    # Our own index already has the change unless someone else bumped too
+    if _index_version is not None and version == _index_version + 1:
+        _index_version = version
+
+
+def sync_genres():
+    """Store TMDB's genre list (plus aliases) in the Genre table"""
+    from .services import TMDBService
+
+    genre_list = TMDBService().get_genre_list()
+    rows = [
+        Genre(id=g["id"], name=g["name"], aliases=GENRE_ALIASES.get(g["name"].lower(), []))
+        for g in genre_list.get("genres", [])
+    ]
+    Genre.objects.bulk_create(
+        rows, update_conflicts=True, update_fields=["name", "aliases"], unique_fields=["id"]
+    )
+    return [(g.id, g.name, g.aliases) for g in rows]
+
+
+def ingest_keywords(keywords):
+    """
+    Add TMDB keyword objects ({"id", "name"}) to the table and the local index
+
+    Only keywords the index has not seen yet touch the database. Other
+    processes are not told right away (each would reload the whole Keyword
+    table); get_index() publishes pending keywords in batches.
+    """
+    index = get_index()
+    new = [
+        Keyword(id=k["id"], name=k["name"], normalized=normalize(k["name"]))
+        for k in keywords
+        if k.get("id") and k.get("name") and normalize(k["name"]) not in index.keywords
+    ]
+    if not new:
+        return 0
+
+    Keyword.objects.bulk_create(new, ignore_conflicts=True)
+    for keyword in new:
+        index.add_keyword(keyword.id, keyword.normalized)
+    cache.set(PENDING_KEY, 1, None)
+    return len(new)
+
+
+def resolve_genres(values):
+    """Map genre names/aliases/IDs to TMDB genre IDs, dropping unknowns"""
+    index = get_index()
+    ids = [index.resolve_genre(v) for v in values or [] if v not in (None, "")]
+    return list(dict.fromkeys(i for i in ids if i))
+
+
+def resolve_keywords(values):
+    """Map keyword strings/IDs to TMDB keyword IDs, dropping unknowns"""
+    index = get_index()
+    ids = [index.resolve_keyword(v) for v in values or [] if v not in (None, "")]
+    return list(dict.fromkeys(i for i in ids if i))
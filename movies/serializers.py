@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from .caching import FAMILIES
 from .models import User, Preference, Movie, Favorite
 
 
@@ -6,6 +7,7 @@ class PreferenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Preference
         fields = "__all__"
+        read_only_fields = ("id", "user")
 
 
 class MovieSerializer(serializers.ModelSerializer):
@@ -19,7 +21,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Favorite
-        fields = "__all__"
+        exclude = ("in_profile",)  # Taste profile bookkeeping
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -29,3 +31,30 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = "__all__"
+        read_only_fields = ("id", "email", "clerk_id")
+
+
+class FavoriteMovieIdsSerializer(serializers.Serializer):
+    """Payload for bulk adding/removing favorites"""
+    movie_ids = serializers.ListField(
+        child=serializers.CharField(max_length=100),
+        allow_empty=False,
+        max_length=100,
+    )
+
+
+class CachePurgeSerializer(serializers.Serializer):
+    """Payload for invalidating cached TMDB responses (same options as manage.py purge_cache)"""
+    families = serializers.ListField(child=serializers.ChoiceField(choices=FAMILIES), required=False, default=list)
+    all = serializers.BooleanField(required=False, default=False)
+    movie_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        default=list,
+        max_length=1000,
+    )
+
+    def validate(self, data):
+        if not (data["families"] or data["all"] or data["movie_ids"]):
+            raise serializers.ValidationError("Nothing to do: pass families, all and/or movie_ids")
+        return data
@@ -1,9 +1,50 @@
 import requests
 import json
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from django.core.cache import cache
 
+from . import governor, store
+from .caching import STALE_PREFIX, family_of, get_many, set_many, tmdb_cache_key
+from .exceptions import UpstreamUnavailable
+from .prompting import build_movie_section, count_tokens, record_token_usage
+from .streaming import IncrementalJSONParser
+from .resilience import (
+    get_breaker,
+    get_latency_tracker,
+    get_session,
+    hedged_call,
+    is_upstream_failure,
+    timed,
+)
+
+logger = logging.getLogger(__name__)
+
+# JSON shape the LLM returns for one recommendation analysis
+# tmdbFilters comes first so a streamed completion delivers it early
+ANALYSIS_SCHEMA = """{
+  "tmdbFilters": {
+    "sort_by": string,
+    "with_genres": string[],
+    "with_keywords": string[]
+  },
+  "themes": string[],
+  "genres": string[],
+  "keywords": string[],
+  "mood": string
+}"""
+
+STREAMED_FILTER_PATHS = [
+    ("tmdbFilters", "sort_by"),
+    ("tmdbFilters", "with_genres"),
+    ("tmdbFilters", "with_keywords"),
+]
+
+FILTER_INSTRUCTIONS = """Use TMDB genre names for "with_genres" and short keyword phrases (preferably
+ones from the movie data) for "with_keywords"; they are mapped to IDs locally."""
+
 
 class TMDBService:
     """Service for interacting with TMDB API"""
@@ -17,74 +58,240 @@ class TMDBService:
     
     def _make_request(self, endpoint, params=None, use_cache=True, cache_key=None, cache_timeout=86400):
         """Make a request to TMDB API with optional caching"""
+        durable = use_cache and store.is_durable(family_of(cache_key))
         if use_cache and cache_key:
             cached = cache.get(cache_key)
             if cached:
+                if durable:
+                    store.record_hit(cache_key)
                 return cached
-        
-        url = f"{self.base_url}{endpoint}"
-        
-        response = requests.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        print(f"URL: {response.url}")
+            if durable:
+                # Redis lost it (restart/eviction); the durable store still has it
+                stored = store.get(cache_key)
+                if stored is not None:
+                    store.record_hit(cache_key)
+                    cache.set(cache_key, stored, cache_timeout)
+                    return stored
+
+        try:
+            data = self._fetch(endpoint, params)
+        except (UpstreamUnavailable, requests.RequestException) as e:
+            if not (use_cache and cache_key) or not is_upstream_failure(e) or not self._keeps_stale(cache_key):
+                raise
+            stale = cache.get(f"{STALE_PREFIX}{cache_key}")
+            if stale is None:
+                raise
+            logger.warning("Serving stale %s: %s", cache_key, e)
+            return stale
         
         if use_cache and cache_key:
-            cache.set(cache_key, data, cache_timeout)
+            set_many(self._cache_entries(cache_key, data, cache_timeout))
+            if durable:
+                store.put(cache_key, family_of(cache_key), data)
         
         return data
+
+    def _make_requests(self, requests_by_key, cache_timeout=86400):
+        """
+        Cached requests for many keys at once
+
+        One MGET for all keys, one store query for the misses, concurrent
+        upstream fetches for the rest and one pipelined write for everything
+        fetched.
+
+        Args:
+            requests_by_key: dict of cache key -> (endpoint, params)
+
+        Returns:
+            dict of cache key -> response data, or the exception it failed with
+        """
+        results = get_many(list(requests_by_key))
+        for key in results:
+            if store.is_durable(family_of(key)):
+                store.record_hit(key)
+
+        entries = []
+        misses = [key for key in requests_by_key if key not in results]
+        durable_misses = [key for key in misses if store.is_durable(family_of(key))]
+        if durable_misses:
+            for key, data in store.get_many(durable_misses).items():
+                store.record_hit(key)
+                results[key] = data
+                entries.append((key, data, cache_timeout))
+            misses = [key for key in misses if key not in results]
+
+        def fetch(key):
+            endpoint, params = requests_by_key[key]
+            try:
+                return key, self._fetch(endpoint, params)
+            except Exception as e:
+                return key, e
+
+        failed = []
+        if misses:
+            with ThreadPoolExecutor(max_workers=min(len(misses), 8)) as pool:
+                for key, data in pool.map(governor.bind(fetch), misses):
+                    results[key] = data
+                    if isinstance(data, Exception):
+                        failed.append(key)
+                        continue
+                    entries.extend(self._cache_entries(key, data, cache_timeout))
+                    if store.is_durable(family_of(key)):
+                        store.put(key, family_of(key), data)
+        if entries:
+            set_many(entries)
+
+        upstream_failed = [key for key in failed if is_upstream_failure(results[key]) and self._keeps_stale(key)]
+        if upstream_failed:
+            stale = get_many([f"{STALE_PREFIX}{key}" for key in upstream_failed])
+            for key in upstream_failed:
+                if f"{STALE_PREFIX}{key}" in stale:
+                    logger.warning("Serving stale %s", key)
+                    results[key] = stale[f"{STALE_PREFIX}{key}"]
+        return results
+
+    def _keeps_stale(self, cache_key):
+        return family_of(cache_key) in settings.TMDB_STALE_TTLS
+
+    def _cache_entries(self, cache_key, data, cache_timeout):
+        """(key, value, timeout) entries for a fresh response and, if its family keeps one, its stale copy"""
+        entries = [(cache_key, data, cache_timeout)]
+        stale_ttl = settings.TMDB_STALE_TTLS.get(family_of(cache_key))
+        if stale_ttl:
+            entries.append((f"{STALE_PREFIX}{cache_key}", data, max(cache_timeout, stale_ttl)))
+        return entries
+
+    def _fetch(self, endpoint, params=None):
+        """Call TMDB through the circuit breaker (and hedging), without caching"""
+        url = f"{self.base_url}{endpoint}"
+        family = endpoint.strip("/").split("/")[0]
+        timeout = (
+            settings.TMDB_CONNECT_TIMEOUT,
+            settings.TMDB_TIMEOUTS.get(family, settings.TMDB_TIMEOUTS["default"])
+        )
+        tracker = get_latency_tracker(f"tmdb:{family}")
+        # Read here: hedged attempts run in pool threads without our context
+        priority = governor.current_priority()
+
+        def fetch():
+            # A 429 pauses every worker; once the pause is over, try again
+            for attempt in range(settings.TMDB_GOVERNOR_RETRIES + 1):
+                governor.acquire(priority)
+                response = get_session("tmdb").get(url, headers=self.headers, params=params, timeout=timeout)
+                governor.observe(response)
+                if response.status_code != 429:
+                    break
+            response.raise_for_status()
+            logger.debug("TMDB %s %s", response.status_code, response.url)
+            return response.json()
+
+        def fetch_maybe_hedged():
+            fetch_timed = timed(tracker, fetch)
+            if not settings.TMDB_HEDGE_ENABLED:
+                return fetch_timed()
+            delay = tracker.percentile(95, default=settings.TMDB_HEDGE_DEFAULT_DELAY)
+            return hedged_call(fetch_timed, max(delay, settings.TMDB_HEDGE_MIN_DELAY))
+
+        return get_breaker("tmdb").call(fetch_maybe_hedged)
     
+    def _discover_locally(self, params):
+        """A /discover/movie page from the local catalog, or None to ask TMDB"""
+        from .discover import discover
+        return discover(params)
+
     def get_trending_movies(self, page=1, time_window=None):
         
         """Get trending movies"""
-        cache_key = f"trending_movies_page_{page}_time_window_{time_window}"
         if time_window == "day":
-            return self._make_request("/trending/movie/day", params={ "page": page, "without_genres": "16"}, cache_key=cache_key)
+            endpoint = "/trending/movie/day"
         elif time_window == "week":
-            return self._make_request("/trending/movie/week", params={ "page": page, "without_genres": "16"}, cache_key=cache_key)
+            endpoint = "/trending/movie/week"
         else:
-            return self._make_request("/trending/movie/", params={ "page": page, "without_genres": "16"}, cache_key=cache_key)
+            endpoint = "/trending/movie/"
+        params = {"page": page, "without_genres": "16"}
+        cache_key = tmdb_cache_key("trending", endpoint, params)
+        return self._make_request(endpoint, params=params, cache_key=cache_key)
     
     def get_top_rated_movies(self, page=1):
         """Get top rated movies"""
-        cache_key = f"top_rated_movies_page_{page}"
-        return self._make_request("/movie/top_rated", params={"page": page, "without_genres": "16"}, cache_key=cache_key)
+        params = {"page": page, "without_genres": "16"}
+        cache_key = tmdb_cache_key("top_rated", "/movie/top_rated", params)
+        return self._make_request("/movie/top_rated", params=params, cache_key=cache_key)
     
     def get_movies_by_genre(self, genre_id, page=1):
         """Get movies by genre ID"""
-        cache_key = f"movies_genre_{genre_id}_page_{page}"
-        return self._make_request("/discover/movie", params={
+        params = {
             "with_genres": genre_id,
             "page": page,
             "sort_by": "vote_average.desc",
             "vote_count.gte": 50,
             "without_genres": "16"
-        }, cache_key=cache_key)
+        }
+        local = self._discover_locally(params)
+        if local is not None:
+            return local
+        cache_key = tmdb_cache_key("genre", "/discover/movie", params)
+        return self._make_request("/discover/movie", params=params, cache_key=cache_key)
     
     def search_movie_by_title(self, query, page=1):
         """Search movies by title"""
-        cache_key = f"search_movie_{query}_{page}"
-        return self._make_request("/search/movie", params={
+        params = {
             "query": query,
             "page": page
-        }, cache_key=cache_key, cache_timeout=3600)  # Cache searches for 1 hour
+        }
+        cache_key = tmdb_cache_key("search", "/search/movie", params)
+        # Cache searches for 1 hour
+        return self._make_request("/search/movie", params=params, cache_key=cache_key, cache_timeout=3600)
     
     def get_movie_details(self, movie_id):
         """Get full movie details by ID"""
-        cache_key = f"movie_details_{movie_id}"
+        cache_key = tmdb_cache_key("movie", f"/movie/{movie_id}", movie_id=movie_id)
         return self._make_request(f"/movie/{movie_id}", cache_key=cache_key)
     
+    def get_movies_with_keywords(self, movie_ids):
+        """
+        Details with keywords for many movies in one batched cache round trip
+
+        Returns:
+            (list of movie detail dicts with "keywords", dict of movie ID -> exception)
+        """
+        keys = {}
+        for movie_id in movie_ids:
+            details_key = tmdb_cache_key("movie", f"/movie/{movie_id}", movie_id=movie_id)
+            keywords_endpoint = f"/movie/{movie_id}/keywords"
+            keywords_key = tmdb_cache_key("movie", keywords_endpoint, movie_id=movie_id)
+            keys[movie_id] = (details_key, keywords_key)
+
+        results = self._make_requests({
+            key: (endpoint, None)
+            for movie_id, (details_key, keywords_key) in keys.items()
+            for key, endpoint in (
+                (details_key, f"/movie/{movie_id}"),
+                (keywords_key, f"/movie/{movie_id}/keywords"),
+            )
+        })
+
+        movies, errors = [], {}
+        for movie_id, (details_key, keywords_key) in keys.items():
+            details, keywords = results[details_key], results[keywords_key]
+            error = next((r for r in (details, keywords) if isinstance(r, Exception)), None)
+            if error is not None:
+                errors[movie_id] = error
+                continue
+            movies.append(dict(details, keywords=keywords))
+        return movies, errors
+
     def get_movie_keywords(self, movie_id):
         """Get keywords for a movie"""
-        cache_key = f"movie_keywords_{movie_id}"
-        return self._make_request(f"/movie/{movie_id}/keywords", cache_key=cache_key)
+        endpoint = f"/movie/{movie_id}/keywords"
+        cache_key = tmdb_cache_key("movie", endpoint, movie_id=movie_id)
+        return self._make_request(endpoint, cache_key=cache_key)
     
     def discover_movies(self, with_genres=None, with_keywords=None, sort_by="popularity.desc", page=1):
         """Discover movies with filters"""
         params = {
             "sort_by": sort_by,
             "page": page,
-            "sort_by": "vote_average.desc",
             "vote_count.gte": 50,
             "without_genres": "16"
         }
@@ -92,32 +299,45 @@ class TMDBService:
             params["with_genres"] = ",".join(map(str, with_genres)) if isinstance(with_genres, list) else str(with_genres)
         if with_keywords:
             params["with_keywords"] = ",".join(map(str, with_keywords)) if isinstance(with_keywords, list) else str(with_keywords)
-        
-        cache_key = f"discover_{params.get('with_genres', '')}_{params.get('with_keywords', '')}_{sort_by}_{page}"
+        local = self._discover_locally(params)
+        if local is not None:
+            return local
+
+        cache_key = tmdb_cache_key("discover", "/discover/movie", params)
         return self._make_request("/discover/movie", params=params, cache_key=cache_key, cache_timeout=3600)
     
     def get_genre_list(self):
         """Get list of all genres"""
-        cache_key = "genre_list"
+        cache_key = tmdb_cache_key("genre_list", "/genre/movie/list")
         return self._make_request("/genre/movie/list", cache_key=cache_key, cache_timeout=86400 * 7)  # Cache for 7 days
 
     def get_movie_details(self, movie_id):
         """Get full movie details by ID"""
-        cache_key = f"movie_details_{movie_id}"
+        cache_key = tmdb_cache_key("movie", f"/movie/{movie_id}", movie_id=movie_id)
         return self._make_request(f"/movie/{movie_id}", cache_key=cache_key)
 
-    def get_trending_genres(self, with_genres, primary_release_year, sort_by="popularity.desc", page=1):
+    def get_configuration(self):
+        """Get the API configuration (image base URLs and sizes)"""
+        cache_key = tmdb_cache_key("configuration", "/configuration")
+        return self._make_request("/configuration", cache_key=cache_key, cache_timeout=86400 * 7)
+
+    def get_trending_genres(self, with_genres, primary_release_year, sort_by="popularity.desc", page=1, use_cache=True):
         """Get trending genres"""
-        cache_key = f"trending_genres_{with_genres}_{primary_release_year}_{page}"
-        return self._make_request("/discover/movie", params={
+        params = {
             "with_genres": with_genres,
             "primary_release_year": primary_release_year,
             "page": page,
-            "sort_by": "vote_average.desc",
+            "sort_by": sort_by,
             "vote_count.gte": 50,
             "without_genres": "16"
-            
-        }, cache_key=cache_key)
+        }
+        # use_cache=False is materialize_trending refreshing from TMDB itself
+        if use_cache:
+            local = self._discover_locally(params)
+            if local is not None:
+                return local
+        cache_key = tmdb_cache_key("trending_genres", "/discover/movie", params) if use_cache else None
+        return self._make_request("/discover/movie", params=params, use_cache=use_cache, cache_key=cache_key)
 
 
 class LLMService:
@@ -128,68 +348,113 @@ class LLMService:
         self.api_base_url = settings.LLM_API_BASE_URL
         self.model = settings.LLM_MODEL
     
-    def get_recommendation_filters(self, preferences, movie_data_list):
+    def get_recommendation_filters(self, preferences, movie_data_list, on_filters=None):
         """
         Send preferences and movie data to LLM and get recommendation filters
         
         Args:
             preferences: dict with 'genres', 'mood', 'description'
             movie_data_list: list of movie detail dictionaries from TMDB
+            on_filters: optional callback; when given the completion is
+                streamed and on_filters(tmdb_filters) is called as soon as
+                the genre/keyword filters are complete
         
         Returns:
             dict with themes, genres, keywords, mood, and tmdbFilters
         """
+        if settings.LLM_BATCH_ENABLED and not on_filters:
+            # Share one LLM call with other requests arriving in the same window
+            from .batching import get_dispatcher
+            return get_dispatcher().submit(preferences, movie_data_list)
+        
         # Build the prompt
         prompt = self._build_prompt(preferences, movie_data_list)
         
         # Call LLM API
-        response = self._call_llm(prompt)
+        response = self._call_llm(prompt, stream=bool(on_filters), on_filters=on_filters)
+        record_token_usage(response, 1)
         
         # Parse and return the response
         return self._parse_llm_response(response)
     
+    def _build_request_section(self, preferences, movie_data_list):
+        """Build the per-request part of the prompt (preferences and movie data)"""
+        # Format movie data within the prompt token budget
+        movies_text, stats = build_movie_section(preferences, movie_data_list)
+        
+        section = f"""User Preferences:
+- Preferred Genres: {', '.join(preferences.get('genres', []))}
+- Preferred Mood: {preferences.get('mood', 'Not specified')}
+- Description: {preferences.get('description', 'Not provided')}
+
+Movie Data:
+{movies_text}"""
+        return section, stats
+    
     def _build_prompt(self, preferences, movie_data_list):
         """Build the prompt for LLM"""
-        # Format movie data
-        movies_text = "\n".join([
-            f"Movie: {movie.get('title', 'Unknown')} ({movie.get('release_date', 'Unknown')[:4] if movie.get('release_date') else 'Unknown'})\n"
-            f"Genres: {', '.join([g['name'] for g in movie.get('genres', [])])}\n"
-            f"Overview: {movie.get('overview', 'N/A')}\n"
-            f"Keywords: {', '.join([k['name'] for k in movie.get('keywords', {}).get('keywords', [])[:10]])}\n"
-            for movie in movie_data_list
-        ])
+        section, stats = self._build_request_section(preferences, movie_data_list)
         
         prompt = f"""You are an AI movie recommendation engine.
 
 Using the user preferences and movie data below, analyze the user's taste
 and return ONLY a JSON object in the following shape:
 
-{{
-  "themes": string[],
-  "genres": string[],
-  "keywords": string[],
-  "mood": string,
-  "tmdbFilters": {{
-    "with_genres": number[],
-    "with_keywords": number[],
-    "sort_by": string
-  }}
-}}
-
-User Preferences:
-- Preferred Genres: {', '.join(preferences.get('genres', []))}
-- Preferred Mood: {preferences.get('mood', 'Not specified')}
-- Description: {preferences.get('description', 'Not provided')}
+{ANALYSIS_SCHEMA}
 
-Movie Data:
-{movies_text}
+{FILTER_INSTRUCTIONS}
+
+{section}
 
 Return ONLY the JSON object, no additional text or explanation."""
         
+        logger.info(
+            "LLM prompt: %d tokens (movie data %d tokens, %d/%d seed movies)",
+            count_tokens(prompt), stats["tokens"], stats["seeds_used"], stats["seeds_total"]
+        )
         return prompt
     
-    def _call_llm(self, prompt):
-        """Call the LLM API"""
+    def _build_batch_prompt(self, requests_by_id):
+        """
+        Build one prompt analyzing several independent requests
+        
+        Args:
+            requests_by_id: dict of request ID -> (preferences, movie_data_list)
+        """
+        sections = []
+        for request_id, (preferences, movie_data_list) in requests_by_id.items():
+            section, _ = self._build_request_section(preferences, movie_data_list)
+            sections.append(f"=== Request {request_id} ===\n{section}")
+        requests_text = "\n\n".join(sections)
+        
+        prompt = f"""You are an AI movie recommendation engine.
+
+Below are {len(requests_by_id)} independent requests, each with its own user
+preferences and movie data. Analyze each user's taste separately and return
+ONLY a JSON object of the shape {{"results": [...]}} with exactly one entry
+per request, where each entry is {{"id": "<request id>", ...analysis}} and
+the analysis has the following shape:
+
+{ANALYSIS_SCHEMA}
+
+{FILTER_INSTRUCTIONS}
+
+{requests_text}
+
+Return ONLY the JSON object, no additional text or explanation."""
+        
+        logger.info("LLM batch prompt: %d tokens for %d requests", count_tokens(prompt), len(requests_by_id))
+        return prompt
+    
+    def _call_llm(self, prompt, stream=False, on_filters=None):
+        """
+        Call the LLM API
+        
+        With stream=True the completion is read as server-sent events and
+        fed through an incremental JSON parser; on_filters(tmdb_filters) is
+        called as soon as with_genres and with_keywords are complete. The
+        return value has the same shape as a non-streamed completion.
+        """
         url = f"{self.api_base_url}/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -211,10 +476,60 @@ Return ONLY the JSON object, no additional text or explanation."""
             "temperature": 0.7,
             "response_format": {"type": "json_object"}
         }
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
         
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
+        def post_stream():
+            filters = {}
+            fired = []
+            
+            def on_value(path, value):
+                filters[path[-1]] = value
+                if on_filters and not fired and "with_genres" in filters and "with_keywords" in filters:
+                    fired.append(True)
+                    on_filters(dict(filters))
+            
+            parser = IncrementalJSONParser(STREAMED_FILTER_PATHS, on_value)
+            content = []
+            usage = None
+            with get_session("llm").post(
+                url,
+                headers=headers,
+                json=payload,
+                stream=True,
+                timeout=(settings.LLM_CONNECT_TIMEOUT, settings.LLM_READ_TIMEOUT)
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    usage = chunk.get("usage") or usage
+                    for choice in chunk.get("choices", []):
+                        delta = choice.get("delta", {}).get("content")
+                        if delta:
+                            content.append(delta)
+                            parser.feed(delta)
+            return {
+                "choices": [{"message": {"content": "".join(content)}}],
+                "usage": usage or {},
+            }
+        
+        def post():
+            response = get_session("llm").post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=(settings.LLM_CONNECT_TIMEOUT, settings.LLM_READ_TIMEOUT)
+            )
+            response.raise_for_status()
+            return response.json()
+
+        return get_breaker("llm").call(post_stream if stream else post)
     
     def _parse_llm_response(self, llm_response):
         """Parse LLM response and extract JSON"""
@@ -0,0 +1,158 @@
+"""
+Durable second-level store for TMDB responses
+
+Immutable-ish payloads (movie details, keywords, the genre list) are kept
+in the TMDBResponse table (JSONB on Postgres, JSON text on SQLite) under
+the same versioned key as in Redis. A Redis miss reads through to the
+table before going to TMDB, so a Redis restart or eviction does not turn
+into a burst of upstream requests.
+
+Writes and hit counts are buffered in-process and flushed in batches by a
+background thread (write-behind), so request latency never includes a
+database write.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import orphaned_keys
+from .models import TMDBResponse
+
+logger = logging.getLogger(__name__)
+
+_pending = {}      # key -> (family, data)
+_hits = Counter()  # key -> hits since the last flush
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_flusher_pid = None
+
+
+def is_durable(family):
+    return settings.TMDB_STORE_ENABLED and family in settings.TMDB_STORE_FAMILIES
+
+
+def get(key):
+    """Stored payload for a cache key, or None"""
+    with _lock:
+        pending = _pending.get(key)
+    if pending is not None:
+        return pending[1]
+    try:
+        return TMDBResponse.objects.filter(key=key).values_list("data", flat=True).first()
+    except Exception as e:
+        logger.warning("TMDB store read failed for %s: %s", key, e)
+        return None
+
+
+def get_many(keys):
+    """Stored payloads for many cache keys in one query"""
+    with _lock:
+        found = {key: _pending[key][1] for key in keys if key in _pending}
+    rest = [key for key in keys if key not in found]
+    if rest:
+        try:
+            found.update(TMDBResponse.objects.filter(key__in=rest).values_list("key", "data"))
+        except Exception as e:
+            logger.warning("TMDB store read failed for %d keys: %s", len(rest), e)
+    return found
+
+
+def put(key, family, data):
+    """Queue a payload to be written on the next flush"""
+    _ensure_flusher()
+    with _lock:
+        _pending[key] = (family, data)
+        full = len(_pending) >= settings.TMDB_STORE_BATCH_SIZE
+    if full:
+        _wakeup.set()
+
+
+def record_hit(key):
+    _ensure_flusher()
+    with _lock:
+        _hits[key] += 1
+
+
+def flush():
+    """Write buffered payloads and hit counts; returns the number of rows written"""
+    global _pending, _hits
+    with _lock:
+        pending, _pending = _pending, {}
+        hits, _hits = _hits, Counter()
+    if not pending and not hits:
+        return 0
+
+    now = timezone.now()
+    try:
+        TMDBResponse.objects.bulk_create(
+            [
+                TMDBResponse(key=key, family=family, data=data, updated_at=now)
+                for key, (family, data) in pending.items()
+            ],
+            batch_size=500,
+            update_conflicts=True,
+            update_fields=["family", "data", "updated_at"],
+            unique_fields=["key"],
+        )
+        # One UPDATE per distinct increment rather than per key
+        by_count = defaultdict(list)
+        for key, count in hits.items():
+            by_count[count].append(key)
+        for count, keys in by_count.items():
+            TMDBResponse.objects.filter(key__in=keys).update(hits=F("hits") + count)
+    except Exception as e:
+        # It is a cache: losing a batch only costs future upstream requests
+        logger.warning("TMDB store flush failed (%d payloads dropped): %s", len(pending), e)
+        return 0
+    return len(pending)
+
+
+def _flush_loop():
+    while True:
+        _wakeup.wait(settings.TMDB_STORE_FLUSH_INTERVAL)
+        _wakeup.clear()
+        close_old_connections()
+        flush()
+
+
+def _ensure_flusher():
+    """Start the background flusher once per process (again after a fork)"""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name="tmdb-store-flusher", daemon=True).start()
+        atexit.register(flush)
+
+
+def hottest(limit, families=None):
+    """(key, data) of the most requested entries, for warming Redis"""
+    queryset = TMDBResponse.objects.order_by("-hits")
+    if families:
+        queryset = queryset.filter(family__in=families)
+    return queryset.values_list("key", "data")[:limit].iterator(chunk_size=500)
+
+
+def prune_orphans(batch_size=500):
+    """Delete stored entries of purged cache generations; returns the number removed"""
+    keys = list(TMDBResponse.objects.values_list("key", flat=True))
+    removed = 0
+    for start in range(0, len(keys), batch_size):
+        removed += _delete(orphaned_keys(keys[start:start + batch_size]))
+    return removed
+
+
+def _delete(keys):
+    if not keys:
+        return 0
+    return TMDBResponse.objects.filter(key__in=keys).delete()[0]
@@ -0,0 +1,119 @@
+"""
+Incremental JSON parsing for streamed LLM completions
+
+The parser is fed the completion text chunk by chunk and reports watched
+values (e.g. tmdbFilters.with_genres) as soon as they are complete, so
+work that depends on them can start while the rest is still streaming.
+"""
+import json
+
+_SCALAR_END = set(",}] \t\r\n")
+
+
+class _Container:
+    __slots__ = ("kind", "key", "state")
+
+    def __init__(self, kind):
+        self.kind = kind      # "object" or "array"
+        self.key = None       # Current key (objects only)
+        self.state = "key" if kind == "object" else "value"
+
+
+class IncrementalJSONParser:
+    """
+    Watch a JSON document being streamed in and report values at given paths
+
+    Paths are tuples of object keys from the root, e.g.
+    ("tmdbFilters", "with_genres"). Values inside arrays are never matched.
+    on_value(path, value) is called once per watched value, when it closes.
+    """
+
+    def __init__(self, watch_paths, on_value=None):
+        self.watch_paths = {tuple(p) for p in watch_paths}
+        self.on_value = on_value
+        self.values = {}
+        self._chars = []
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_is_key = False
+        self._token_start = None
+        self._in_scalar = False
+        self._capture = None  # (path, start index, stack depth)
+
+    def feed(self, text):
+        for ch in text:
+            self._feed_char(ch)
+
+    def _path(self):
+        if any(c.kind == "array" for c in self._stack):
+            return None
+        return tuple(c.key for c in self._stack)
+
+    def _begin_value(self, index):
+        path = self._path()
+        if path in self.watch_paths and path not in self.values:
+            self._capture = (path, index, len(self._stack))
+
+    def _end_value(self, end):
+        if self._capture and self._capture[2] == len(self._stack):
+            path, start, _ = self._capture
+            self._capture = None
+            value = json.loads("".join(self._chars[start:end]))
+            self.values[path] = value
+            if self.on_value:
+                self.on_value(path, value)
+        if self._stack and self._stack[-1].kind == "object":
+            self._stack[-1].state = "comma"
+
+    def _feed_char(self, ch):
+        index = len(self._chars)
+        self._chars.append(ch)
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._string_is_key:
+                    self._stack[-1].key = json.loads("".join(self._chars[self._token_start:index + 1]))
+                    self._stack[-1].state = "colon"
+                else:
+                    self._end_value(index + 1)
+            return
+
+        if self._in_scalar:
+            if ch not in _SCALAR_END:
+                return
+            self._in_scalar = False
+            self._end_value(index)
+
+        top = self._stack[-1] if self._stack else None
+
+        if ch in " \t\r\n":
+            return
+        if ch == '"':
+            self._in_string = True
+            self._token_start = index
+            self._string_is_key = top is not None and top.kind == "object" and top.state == "key"
+            if not self._string_is_key:
+                self._begin_value(index)
+        elif ch in "{[":
+            self._begin_value(index)
+            self._stack.append(_Container("object" if ch == "{" else "array"))
+        elif ch in "}]":
+            if self._stack:
+                self._stack.pop()
+            self._end_value(index + 1)
+        elif ch == ":":
+            if top is not None:
+                top.state = "value"
+        elif ch == ",":
+            if top is not None and top.kind == "object":
+                top.state = "key"
+        else:
+            # Number, true, false or null
+            self._in_scalar = True
+            self._begin_value(index)
@@ -0,0 +1,297 @@
+"""
+Background recommendation jobs
+
+POST /api/recommendations/jobs/ enqueues a job and returns its ID right
+away; the seed fetch -> LLM -> discover pipeline then runs outside the
+web workers. With the "redis" backend job IDs are pushed onto a Redis list
+consumed by `manage.py run_recommendation_worker`; the "local" backend
+runs jobs in an in-process thread pool (development, single node).
+
+Job IDs are a hash of the request, so identical in-flight (or recently
+finished) requests share one job instead of running the pipeline twice.
+
+A worker claims a job by taking its lease key and refreshes the lease
+while the pipeline runs. A RUNNING job whose lease expired belonged to a
+worker that died, and a QUEUED one nobody leased within
+RECOMMENDATION_JOB_QUEUE_TIMEOUT was lost on its way to a worker; both
+are reported as failed (and so retried by the next identical request)
+instead of blocking de-duplication until the job TTL.
+Callback URLs are kept in their own keys, appended with an atomic
+counter, so concurrent joins never overwrite each other.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import redis
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from .exceptions import NoSeedMovies
+from .recommendations import generate_recommendations
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "recommendation_jobs:queue"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Threads POSTing callbacks for jobs that were already done
+CALLBACK_WORKERS = 4
+
+_pools = {}
+
+
+def job_key(job_id):
+    return f"recommendation_jobs:{job_id}"
+
+
+def lease_key(job_id):
+    return f"{job_key(job_id)}:lease"
+
+
+def callbacks_key(job_id):
+    return f"{job_key(job_id)}:callbacks"
+
+
+def job_id_for(movie_ids, preferences):
+    """Stable job ID for a request, used to de-duplicate identical jobs"""
+    payload = json.dumps(
+        {"movie_ids": sorted(str(m) for m in movie_ids), "preferences": preferences},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def callback_allowed(url):
+    """Only POST results to https hosts on the RECOMMENDATION_CALLBACK_HOSTS allow list"""
+    parsed = urlparse(url or "")
+    return parsed.scheme == "https" and parsed.hostname in settings.RECOMMENDATION_CALLBACK_HOSTS
+
+
+def _lost(job):
+    """Why a RUNNING or QUEUED job will never finish, or None"""
+    if job["status"] == RUNNING:
+        error = "The worker running this job stopped before it finished"
+    elif job["status"] == QUEUED and time.time() - job["created_at"] > settings.RECOMMENDATION_JOB_QUEUE_TIMEOUT:
+        error = "No worker picked this job up"
+    else:
+        return None
+    return error if cache.get(lease_key(job["id"])) is None else None
+
+
+def get_job(job_id):
+    """A job's state; a job whose worker is gone (or never came) is reported as failed"""
+    job = cache.get(job_key(job_id))
+    error = _lost(job) if job else None
+    if error:
+        logger.warning("Recommendation job %s lost: %s", job_id, error)
+        job["status"] = FAILED
+        job["error"] = error
+        job["finished_at"] = time.time()
+        _save_job(job)
+    return job
+
+
+def _save_job(job):
+    cache.set(job_key(job["id"]), job, settings.RECOMMENDATION_JOB_TTL)
+
+
+def add_callback(job_id, url):
+    """Register a callback URL for a job (atomic: an INCR-allocated slot per URL)"""
+    counter = callbacks_key(job_id)
+    for _ in range(2):
+        cache.add(counter, 0, settings.RECOMMENDATION_JOB_TTL)
+        try:
+            slot = cache.incr(counter)
+            break
+        except ValueError:
+            # Expired between add and incr
+            continue
+    else:
+        return
+    cache.set(f"{counter}:{slot}", url, settings.RECOMMENDATION_JOB_TTL)
+
+
+def get_callbacks(job_id):
+    counter = callbacks_key(job_id)
+    count = cache.get(counter) or 0
+    slots = [f"{counter}:{slot}" for slot in range(1, count + 1)]
+    urls = cache.get_many(slots) if slots else {}
+    return list(dict.fromkeys(urls[slot] for slot in slots if slot in urls))
+
+
+def _heartbeat(job_id, stop):
+    """Keep a running job's lease alive until stop is set"""
+    lease = settings.RECOMMENDATION_JOB_LEASE
+    while not stop.wait(lease / 3):
+        try:
+            cache.touch(lease_key(job_id), lease)
+        except Exception as e:
+            logger.warning("Could not renew the lease of job %s: %s", job_id, e)
+
+
+def enqueue_recommendation_job(movie_ids, preferences, callback_url=None):
+    """
+    Create (or join) a recommendation job
+
+    Returns the job dictionary; its status is "queued" for a new job or
+    whatever state the identical existing job is in.
+    """
+    job_id = job_id_for(movie_ids, preferences)
+    job = {
+        "id": job_id,
+        "status": QUEUED,
+        "movie_ids": movie_ids,
+        "preferences": preferences,
+        "created_at": time.time(),
+    }
+
+    if not cache.add(job_key(job_id), job, settings.RECOMMENDATION_JOB_TTL):
+        existing = get_job(job_id)
+        if existing and existing["status"] != FAILED:
+            if callback_url:
+                if existing["status"] == DONE:
+                    # Not in the request: the receiver may be slow
+                    _get_pool("callbacks").submit(_send_callback, callback_url, existing)
+                else:
+                    add_callback(job_id, callback_url)
+            return existing
+        # Failed (or evicted) jobs are retried from scratch
+        _save_job(job)
+
+    if callback_url:
+        add_callback(job_id, callback_url)
+    _dispatch(job_id)
+    return job
+
+
+def _dispatch(job_id):
+    if settings.RECOMMENDATION_JOBS_BACKEND == "local":
+        _get_pool("jobs").submit(run_job, job_id)
+    else:
+        get_redis_connection("default").rpush(QUEUE_KEY, job_id)
+
+
+def _get_pool(name):
+    """This process's pool for local-backend jobs ("jobs") or callbacks ("callbacks")"""
+    pool, pid = _pools.get(name, (None, None))
+    if pool is None or pid != os.getpid():
+        workers = settings.RECOMMENDATION_JOB_LOCAL_WORKERS if name == "jobs" else CALLBACK_WORKERS
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"recommendation-{name}")
+        _pools[name] = (pool, os.getpid())
+    return pool
+
+
+def run_job(job_id):
+    """Run the recommendation pipeline for a queued job and store the outcome"""
+    job = get_job(job_id)
+    if job is None:
+        logger.warning("Recommendation job %s expired before it ran", job_id)
+        return None
+    if job["status"] not in (QUEUED, FAILED):
+        return job
+    # Only one worker runs a job, even if it was dispatched twice
+    if not cache.add(lease_key(job_id), os.getpid(), settings.RECOMMENDATION_JOB_LEASE):
+        return job
+
+    job["status"] = RUNNING
+    job["started_at"] = time.time()
+    job.pop("error", None)
+    _save_job(job)
+
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, stop), name=f"job-lease-{job_id[:8]}", daemon=True).start()
+    try:
+        job["result"] = generate_recommendations(job["preferences"], movie_ids=job["movie_ids"])
+        job["status"] = DONE
+    except NoSeedMovies as e:
+        job["status"] = FAILED
+        job["error"] = str(e)
+    except Exception as e:
+        logger.exception("Recommendation job %s failed", job_id)
+        job["status"] = FAILED
+        job["error"] = f"Failed to generate recommendations: {e}"
+    finally:
+        stop.set()
+    job["finished_at"] = time.time()
+    _save_job(job)
+    cache.delete(lease_key(job_id))
+
+    for url in get_callbacks(job_id):
+        _send_callback(url, job)
+    return job
+
+
+def public_job(job):
+    """The part of a job returned to clients"""
+    data = {key: job[key] for key in ("id", "status", "created_at") if key in job}
+    for key in ("result", "error", "finished_at"):
+        if key in job:
+            data[key] = job[key]
+    return data
+
+
+def _send_callback(url, job):
+    if not callback_allowed(url):
+        logger.warning("Skipping callback to non-allowed URL %s", url)
+        return
+    try:
+        requests.post(url, json=public_job(job), timeout=5).raise_for_status()
+    except requests.RequestException as e:
+        logger.warning("Callback for job %s to %s failed: %s", job["id"], url, e)
+
+
+def run_worker(poll_timeout=5, max_jobs=None, concurrency=1):
+    """
+    Consume job IDs from the Redis queue until stopped (or max_jobs are done)
+
+    With concurrency > 1 several jobs run at once in threads, which also
+    lets LLM micro-batching combine their analyses.
+    """
+    if concurrency > 1:
+        threads = [
+            threading.Thread(
+                target=run_worker,
+                kwargs={"poll_timeout": poll_timeout, "max_jobs": max_jobs},
+                name=f"recommendation-worker-{i}",
+                daemon=True,
+            )
+            for i in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return
+
+    # BLPOP blocks for up to poll_timeout, longer than the shared pool's
+    # socket timeout, so the worker gets a dedicated connection
+    connection = redis.Redis.from_url(
+        settings.CACHES["default"]["LOCATION"],
+        socket_timeout=poll_timeout + 5,
+        health_check_interval=30,
+    )
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        item = connection.blpop(QUEUE_KEY, timeout=poll_timeout)
+        if item is None:
+            continue
+        job_id = item[1].decode() if isinstance(item[1], bytes) else item[1]
+        start = time.monotonic()
+        job = run_job(job_id)
+        processed += 1
+        if job:
+            logger.info(
+                "Recommendation job %s %s in %.2fs", job_id, job["status"], time.monotonic() - start
+            )
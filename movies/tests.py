@@ -1,3 +1,1005 @@
-from django.test import TestCase
+import io
+import ipaddress
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework.test import APIClient
+
+from . import (
+    banlist, caching, catalog, discover, governor, images, ranking, recommendations, resolution, tasks, trending
+)
+from .exceptions import UpstreamRateLimited, UpstreamUnavailable
+from .favorites import favorite_id
+from .ip import get_client_ip
+from .models import CacheGeneration, Favorite, Genre, Movie, Preference, TasteProfile, TrendingMovie, User
+from .profiles import bump_profile_version, get_personalized_recommendations
+from .services import LLMService, TMDBService
+from .streaming import IncrementalJSONParser
+from .throttling import AnonymousRateThrottle, ImageProxyRateThrottle
+
+
+# The anonymous throttle allows 5 requests a minute, which a test class
+# burns through immediately; these tests are about the database layer.
+@mock.patch("movies.throttling.AnonymousRateThrottle.allow_request", return_value=True)
+@override_settings(INTERNAL_API_TOKEN="test-internal-token")
+class UserEndpointsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(id="user_1", email="a@example.com", clerk_id="clerk_1")
+        Preference.objects.create(id=self.user.id, user=self.user, genres=["Drama"], mood_tags=["dark"])
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_CLERK_USER_ID="clerk_1", HTTP_X_INTERNAL_TOKEN="test-internal-token")
+
+    def add_favorites(self, count, start=0):
+        for i in range(start, start + count):
+            movie = Movie.objects.create(id=str(i), title=f"Movie {i}", genres=["Drama"])
+            Favorite.objects.create(id=f"{self.user.id}:{movie.id}", user=self.user, movie=movie)
+
+    def count_queries(self, method, path, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(path, **kwargs)
+        self.assertLess(response.status_code, 300, response.content)
+        return len(ctx.captured_queries)
+
+    def test_profile_query_count_is_constant(self, _):
+        self.add_favorites(1)
+        few = self.count_queries("get", "/api/me/")
+        self.add_favorites(25, start=1)
+        many = self.count_queries("get", "/api/me/")
+        self.assertEqual(few, many)
+
+        response = self.client.get("/api/me/")
+        self.assertEqual(len(response.data["favorites"]), 26)
+        self.assertEqual(response.data["preferences"]["genres"], ["Drama"])
+
+    def test_favorites_list_query_count_is_constant(self, _):
+        self.add_favorites(1)
+        few = self.count_queries("get", "/api/me/favorites/")
+        self.add_favorites(15, start=1)
+        many = self.count_queries("get", "/api/me/favorites/")
+        self.assertEqual(few, many)
+
+    def test_favorites_cursor_pagination(self, _):
+        self.add_favorites(25)
+        response = self.client.get("/api/me/favorites/")
+        self.assertEqual(len(response.data["results"]), 20)
+        self.assertIsNotNone(response.data["next"])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertIsNone(response.data["next"])
+
+    @mock.patch.object(TMDBService, "get_movies_with_keywords")
+    def test_bulk_add_and_remove_favorites(self, get_movies_with_keywords, _):
+        get_movies_with_keywords.side_effect = lambda movie_ids: (
+            [{"id": int(m), "keywords": {"keywords": [{"id": 1, "name": "heist"}]}} for m in movie_ids],
+            {},
+        )
+        for i in range(3):
+            Movie.objects.create(id=str(i), title=f"Movie {i}", genres=["Drama"])
+
+        response = self.client.post("/api/me/favorites/", {"movie_ids": [0, 1, 2, 1]}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["added"], ["0", "1", "2"])
+        self.assertEqual(self.user.favorites.count(), 3)
+
+        # Re-adding is a no-op, for the favorites and the taste profile
+        self.client.post("/api/me/favorites/", {"movie_ids": [0]}, format="json")
+        self.assertEqual(self.user.favorites.count(), 3)
+        profile = TasteProfile.objects.get(user=self.user)
+        self.assertEqual(profile.genre_weights, {"Drama": 3})
+        self.assertEqual(profile.keyword_weights, {"heist": 3})
+
+        response = self.client.delete("/api/me/favorites/", {"movie_ids": [0, 2]}, format="json")
+        self.assertEqual(response.data["removed"], 2)
+        self.assertEqual(list(self.user.favorites.values_list("movie_id", flat=True)), ["1"])
+        self.assertEqual(TasteProfile.objects.get(user=self.user).genre_weights, {"Drama": 1})
+
+    @mock.patch.object(TMDBService, "get_movies_with_keywords", return_value=([], {}))
+    @mock.patch("movies.profiles.generate_recommendations", return_value={"recommendations": {}, "analysis": {}})
+    def test_legacy_favorites_are_counted_after_a_preferences_change(self, generate, _, __):
+        # Saved before taste profiles existed; a preferences change then creates the profile
+        self.add_favorites(2)
+        bump_profile_version(self.user)
+        with override_settings(CACHES=LOCMEM_CACHE):
+            get_personalized_recommendations(self.user)
+        self.assertEqual(TasteProfile.objects.get(user=self.user).genre_weights, {"Drama": 2})
+        self.assertIn("Drama", generate.call_args[0][0]["description"])
+        self.assertFalse(self.user.favorites.filter(in_profile=False).exists())
+
+    def test_favorite_id_fits_column(self, _):
+        user = User(id="u" * 100)
+        self.assertEqual(favorite_id(self.user, 550), "user_1:550")
+        self.assertLessEqual(len(favorite_id(user, 550)), Favorite._meta.get_field("id").max_length)
+        self.assertEqual(favorite_id(user, 550), favorite_id(user, "550"))
+
+    def test_preferences_put(self, _):
+        response = self.client.put(
+            "/api/me/preferences/",
+            {"genres": ["Horror"], "mood_tags": ["tense"], "pace": "fast"},
+            format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Preference.objects.get(user=self.user).genres, ["Horror"])
+
+    def test_requires_internal_token(self, _):
+        client = APIClient()
+        client.credentials(HTTP_X_CLERK_USER_ID="clerk_1", HTTP_X_INTERNAL_TOKEN="wrong")
+        self.assertEqual(client.get("/api/me/").status_code, 401)
+        self.assertIn(APIClient().get("/api/me/").status_code, (401, 403))
+
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE, CACHE_GENERATION_REFRESH=0)
+class CacheGenerationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caching._generations.clear()
+
+    def test_generations_survive_redis_loss(self):
+        caching.purge_family("trending")
+        caching.purge_movie(550)
+        key = caching.tmdb_cache_key("trending", "/trending/movie/")
+        movie_key = caching.tmdb_cache_key("movie", "/movie/550", movie_id=550)
+
+        # Redis restarted: the counters come back from the table
+        cache.clear()
+        self.assertEqual(caching.tmdb_cache_key("trending", "/trending/movie/"), key)
+        self.assertEqual(caching.tmdb_cache_key("movie", "/movie/550", movie_id=550), movie_key)
+        self.assertIn(":g1:", key)
+        self.assertEqual(caching.orphaned_keys(["tmdb:trending:g0:abc", key]), ["tmdb:trending:g0:abc"])
+
+    def test_bump_continues_from_redis_counter(self):
+        # Bumped before the table existed
+        cache.set(caching.generation_key("discover"), 4, None)
+        self.assertEqual(caching.purge_family("discover"), 5)
+        self.assertEqual(CacheGeneration.objects.get(key=caching.generation_key("discover")).value, 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, CACHE_GENERATION_REFRESH=0, ADMIN_API_TOKEN="test-admin-token")
+class CachePurgeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caching._generations.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_ADMIN_TOKEN="test-admin-token")
+
+    def keys(self):
+        return {
+            "trending": caching.tmdb_cache_key("trending", "/trending/movie/", {"page": 1}),
+            "discover": caching.tmdb_cache_key("discover", "/discover/movie", {"page": 1}),
+            "movie 550": caching.tmdb_cache_key("movie", "/movie/550", movie_id=550),
+            "movie 551": caching.tmdb_cache_key("movie", "/movie/551", movie_id=551),
+        }
+
+    def changed_after(self, purge):
+        before = self.keys()
+        purge()
+        after = self.keys()
+        return sorted(name for name in before if before[name] != after[name])
+
+    def test_family_and_movie_purges_only_touch_their_keys(self):
+        self.assertEqual(self.changed_after(lambda: caching.purge_family("trending")), ["trending"])
+        self.assertEqual(self.changed_after(lambda: caching.purge_movie(550)), ["movie 550"])
+        # A movie-family purge reaches every movie
+        self.assertEqual(self.changed_after(lambda: caching.purge_family("movie")), ["movie 550", "movie 551"])
+        self.assertEqual(caching.purge_family("trending"), 2)
+        with self.assertRaises(ValueError):
+            caching.purge_family("nope")
+
+    def test_purge_endpoint(self):
+        response = None
+
+        def purge():
+            nonlocal response
+            response = self.client.post(
+                "/api/internal/cache/purge/", {"families": ["discover"], "movie_ids": [551]}, format="json"
+            )
+        self.assertEqual(self.changed_after(purge), ["discover", "movie 551"])
+        self.assertEqual(response.data["generations"], {"discover": 1, "movie:551": 1})
+
+        self.assertEqual(self.client.post("/api/internal/cache/purge/", {}, format="json").status_code, 400)
+        self.assertEqual(
+            self.client.post("/api/internal/cache/purge/", {"families": ["nope"]}, format="json").status_code, 400
+        )
+        self.assertIn(
+            APIClient().post("/api/internal/cache/purge/", {"all": True}, format="json").status_code, (401, 403)
+        )
+
+    def test_purge_command(self):
+        out = io.StringIO()
+        self.assertEqual(
+            self.changed_after(
+                lambda: call_command("purge_cache", "--movie", "550", "--family", "trending", stdout=out)
+            ),
+            ["movie 550", "trending"],
+        )
+        self.assertIn("movie 550: generation 1", out.getvalue())
+        self.assertEqual(len(self.changed_after(lambda: call_command("purge_cache", "--all", stdout=out))), 4)
+
+    def test_orphan_cleanup_is_skipped_without_django_redis(self):
+        out = io.StringIO()
+        with self.assertLogs("movies.caching", "WARNING"):
+            call_command("purge_cache", "--orphans", stdout=out)
+        self.assertIn("Removed 0 orphaned keys", out.getvalue())
+
+
+class FetchCandidatesTests(SimpleTestCase):
+
+    def test_partial_failures_are_skipped(self):
+        def discover(self, with_genres=None, with_keywords=None, sort_by=None, page=1):
+            if page == 2:
+                raise UpstreamUnavailable("tmdb")
+            return {"results": [{"id": page}]}
+
+        with mock.patch.object(TMDBService, "discover_movies", discover):
+            candidates = ranking.fetch_candidates([18], None, "popularity.desc", 3)
+        self.assertEqual(sorted(candidates), [1, 3])
+
+    def test_raises_when_every_page_fails(self):
+        with mock.patch.object(TMDBService, "discover_movies", side_effect=UpstreamUnavailable("tmdb", 30)):
+            with self.assertRaises(UpstreamUnavailable):
+                ranking.fetch_candidates([18], [1], "popularity.desc", 2)
+
+    def test_keywords_are_and_ed_with_or_backfill(self):
+        pages = {"1,2": [10], None: [10, 11], "1|2": [12, 10]}
+
+        def discover(self, with_genres=None, with_keywords=None, sort_by=None, page=1):
+            return {"results": [{"id": movie_id} for movie_id in pages[with_keywords]]}
+
+        with mock.patch.object(TMDBService, "discover_movies", autospec=True, side_effect=discover) as calls:
+            candidates = ranking.fetch_candidates([18], [1, 2], "popularity.desc", 1)
+        self.assertEqual({m: match for m, (_, match) in candidates.items()}, {10: 1.0, 11: 0.0, 12: 0.5})
+        self.assertEqual(calls.call_args_list[-1].kwargs["with_keywords"], "1|2")
+
+        # Enough movies have every keyword: no backfill
+        with override_settings(RERANK_TOP_K=1), \
+                mock.patch.object(TMDBService, "discover_movies", autospec=True, side_effect=discover) as calls:
+            candidates = ranking.fetch_candidates([18], [1, 2], "popularity.desc", 1)
+        self.assertEqual(sorted(c.kwargs["with_keywords"] or "" for c in calls.call_args_list), ["", "1,2"])
+        self.assertNotIn(12, candidates)
+
+
+class RerankTests(SimpleTestCase):
+
+    seeds = [{"id": 1, "genres": [{"id": 18}, {"id": 80}]}]
+
+    def candidates(self, *movies):
+        return {
+            movie_id: ({
+                "id": movie_id, "genre_ids": genre_ids, "vote_average": 7.0, "vote_count": 500,
+                "popularity": 50.0, "release_date": "2015-05-01",
+            }, match)
+            for movie_id, genre_ids, match in movies
+        }
+
+    def test_orders_by_relevance(self):
+        candidates = self.candidates((2, [35], 0.0), (3, [18, 80], 1.0), (4, [18, 80], 0.0), (5, [18], 0.0))
+        ranked = ranking.rerank(candidates, self.seeds, diversity=0)
+        self.assertEqual([r["id"] for r in ranked], [3, 4, 5, 2])
+        self.assertEqual(ranked, sorted(ranked, key=lambda r: -r["score"]))
+
+    def test_mmr_spreads_out_near_duplicates(self):
+        candidates = self.candidates((2, [18, 80], 1.0), (3, [18, 80], 0.5), (4, [18, 35], 0.0))
+        self.assertEqual([r["id"] for r in ranking.rerank(candidates, self.seeds, diversity=0)], [2, 3, 4])
+        self.assertEqual([r["id"] for r in ranking.rerank(candidates, self.seeds, diversity=0.6)], [2, 4, 3])
+
+    def test_seeds_and_excluded_movies_are_dropped(self):
+        candidates = self.candidates((1, [18, 80], 1.0), (2, [18], 0.0), (3, [35], 0.0))
+        self.assertEqual([r["id"] for r in ranking.rerank(candidates, self.seeds, exclude_ids=["3"], k=5)], [2])
+        self.assertEqual(ranking.rerank(candidates, self.seeds, exclude_ids=[2, 3]), [])
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHE, LLM_STREAM_ENABLED=True, LOCAL_FILTERS_FALLBACK_ENABLED=True, LLM_LATENCY_BUDGET=0.2
+)
+class StreamedRecommendationTests(SimpleTestCase):
+
+    seeds = [{"id": 1, "title": "Seed"}]
+    llm_filters = {"tmdbFilters": {"with_genres": ["Drama"], "with_keywords": []}, "themes": ["loss"]}
+    local_filters = {"tmdbFilters": {"with_genres": ["Comedy"], "with_keywords": []}}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(mock.patch.stopall)
+        self.discover = mock.patch.object(
+            recommendations, "discover_from_filters", return_value={"results": []}
+        ).start()
+        mock.patch.object(recommendations, "extract_filters", return_value=self.local_filters).start()
+
+    def llm(self, delay=0):
+        def get_recommendation_filters(service, preferences, movie_data_list, on_filters=None):
+            on_filters(self.llm_filters["tmdbFilters"])
+            time.sleep(delay)
+            return self.llm_filters
+        return mock.patch.object(LLMService, "get_recommendation_filters", get_recommendation_filters)
+
+    def test_early_discover_is_used(self):
+        with self.llm():
+            result = recommendations.generate_recommendations({}, movie_data_list=self.seeds)
+        self.assertEqual(result["analysis"]["source"], "llm")
+        self.discover.assert_called_once()
+
+    def test_slow_stream_falls_back_within_budget(self):
+        start = time.monotonic()
+        with self.llm(delay=1), self.assertLogs("movies.recommendations", "WARNING"):
+            result = recommendations.generate_recommendations({}, movie_data_list=self.seeds)
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(result["analysis"]["source"], "local")
+        self.assertEqual(self.discover.call_args[0][0], self.local_filters)
+
+    def test_discover_errors_are_not_llm_failures(self):
+        self.discover.side_effect = requests.ConnectionError("tmdb down")
+        with self.llm(), self.assertRaises(requests.ConnectionError):
+            recommendations.generate_recommendations({}, movie_data_list=self.seeds)
+        recommendations.extract_filters.assert_not_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RecommendationJobTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_running_job_without_lease_is_failed(self):
+        tasks._save_job({"id": "abc", "status": tasks.RUNNING, "movie_ids": [], "preferences": {}})
+        self.assertEqual(tasks.get_job("abc")["status"], tasks.FAILED)
+
+        cache.set(tasks.lease_key("def"), 1)
+        tasks._save_job({"id": "def", "status": tasks.RUNNING, "movie_ids": [], "preferences": {}})
+        self.assertEqual(tasks.get_job("def")["status"], tasks.RUNNING)
+
+    def test_queued_job_never_leased_is_failed(self):
+        def queued(job_id, created_at):
+            tasks._save_job({"id": job_id, "status": tasks.QUEUED, "created_at": created_at})
+            return tasks.get_job(job_id)["status"]
+
+        self.assertEqual(queued("abc", time.time() - settings.RECOMMENDATION_JOB_QUEUE_TIMEOUT - 1), tasks.FAILED)
+        self.assertEqual(queued("def", time.time()), tasks.QUEUED)
+
+    def test_callback_for_a_done_job_leaves_the_request(self):
+        job_id = tasks.job_id_for([550], {})
+        tasks._save_job({"id": job_id, "status": tasks.DONE, "created_at": time.time(), "result": {}})
+        with mock.patch.object(tasks, "_get_pool") as get_pool, mock.patch.object(tasks, "_send_callback") as send:
+            job = tasks.enqueue_recommendation_job([550], {}, callback_url="https://a.example/cb")
+        self.assertEqual(job["status"], tasks.DONE)
+        send.assert_not_called()
+        get_pool.return_value.submit.assert_called_once_with(send, "https://a.example/cb", job)
+
+    def test_callbacks_are_appended(self):
+        for url in ["https://a.example/cb", "https://b.example/cb", "https://a.example/cb"]:
+            tasks.add_callback("abc", url)
+        self.assertEqual(tasks.get_callbacks("abc"), ["https://a.example/cb", "https://b.example/cb"])
+
+
+class TrendingListingTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        TrendingMovie.objects.bulk_create([
+            TrendingMovie(genre_id=18, year=2024, movie_id=i, title=f"Movie {i}", popularity=30 - i,
+                          data={"id": i}, slice_total=95, refreshed_at=now)
+            for i in range(25)
+        ])
+
+    def test_pages_report_tmdb_totals(self):
+        data = trending.get_listing(18, 2024, page=2)
+        self.assertEqual([r["id"] for r in data["results"]], list(range(20, 25)))
+        self.assertEqual((data["total_results"], data["total_pages"]), (95, 5))
+
+    def test_page_past_slice_falls_back(self):
+        self.assertIsNone(trending.get_listing(18, 2024, page=3))
+        self.assertIsNone(trending.get_listing(18, 2023))
+
+
+class IncrementalJSONParserTests(SimpleTestCase):
+
+    DOCUMENT = (
+        '{"tmdbFilters": {"sort_by": "popularity.desc", "with_genres": ["Drama", "Sci \\"Fi\\" {x}"], '
+        '"with_keywords": [], "limit": 5}, "themes": [{"with_genres": 1}]}'
+    )
+    PATHS = [("tmdbFilters", "sort_by"), ("tmdbFilters", "with_genres"), ("tmdbFilters", "limit"), ("with_genres",)]
+
+    def parse(self, *chunks, paths=None):
+        seen = []
+        parser = IncrementalJSONParser(paths or self.PATHS, lambda path, value: seen.append((path, value)))
+        for chunk in chunks:
+            parser.feed(chunk)
+        return seen
+
+    def test_values_are_reported_whatever_the_chunking(self):
+        expected = [
+            (("tmdbFilters", "sort_by"), "popularity.desc"),
+            (("tmdbFilters", "with_genres"), ["Drama", 'Sci "Fi" {x}']),
+            (("tmdbFilters", "limit"), 5),
+        ]
+        for cut in range(len(self.DOCUMENT) + 1):
+            self.assertEqual(self.parse(self.DOCUMENT[:cut], self.DOCUMENT[cut:]), expected, cut)
+        self.assertEqual(self.parse(*self.DOCUMENT), expected)
+
+    def test_values_are_reported_when_they_close(self):
+        seen = []
+        parser = IncrementalJSONParser([("a",)], lambda path, value: seen.append(value))
+        parser.feed('{"a": [1, 2')
+        self.assertEqual(seen, [])
+        parser.feed('], "b": ')
+        self.assertEqual(seen, [[1, 2]])
+
+    def test_truncated_document_reports_nothing(self):
+        self.assertEqual(self.parse('{"tmdbFilters": {"with_genres": ["Dra'), [])
+
+    def test_malformed_input(self):
+        # A malformed watched value fails the call, so the caller falls back
+        with self.assertRaises(ValueError):
+            self.parse('{"a": [1,,2]}', paths=[("a",)])
+        with self.assertRaises(ValueError):
+            self.parse('{"a": tru }', paths=[("a",)])
+        # Garbage outside the watched values is skipped
+        self.assertEqual(self.parse('{"x": [1,,2], "a": 1}', paths=[("a",)]), [(("a",), 1)])
+        self.assertEqual(self.parse('}]{"a": "b"}', paths=[("a",)]), [(("a",), "b")])
+
+
+@override_settings(TRUSTED_PROXIES=["10.0.0.0/8", "::1/128"])
+class ClientIPTests(SimpleTestCase):
+
+    def client_ip(self, remote, forwarded=None):
+        request = RequestFactory().get("/", REMOTE_ADDR=remote)
+        if forwarded is not None:
+            request.META["HTTP_X_FORWARDED_FOR"] = forwarded
+        return get_client_ip(request)
+
+    def test_forwarded_for_ignored_from_untrusted_peer(self):
+        self.assertEqual(self.client_ip("203.0.113.9", "1.2.3.4"), "203.0.113.9")
+
+    def test_spoofed_hops_left_of_the_client_are_ignored(self):
+        # The client prepended a fake hop; our proxies appended the real one
+        self.assertEqual(self.client_ip("10.0.0.2", "1.2.3.4, 198.51.100.7, 10.0.0.5"), "198.51.100.7")
+        self.assertEqual(self.client_ip("10.0.0.2", "10.9.9.9, 10.0.0.5"), "10.9.9.9")
+        self.assertEqual(self.client_ip("10.0.0.2", "1.2.3.4, not-an-ip, 10.0.0.5"), "10.0.0.5")
+        self.assertEqual(self.client_ip("::1", "[2001:db8::1]"), "2001:db8::1")
+
+    def test_ipv4_mapped_addresses(self):
+        self.assertEqual(self.client_ip("::ffff:203.0.113.9"), "203.0.113.9")
+        self.assertEqual(self.client_ip("::ffff:10.0.0.2", "198.51.100.7"), "198.51.100.7")
+
+
+class IPSetTests(SimpleTestCase):
+
+    def test_cidr_edges(self):
+        with self.assertLogs("movies.banlist", "WARNING"):
+            ips = banlist.IPSet(["192.0.2.0/24", "192.0.3.0/24", "198.51.100.7", "2001:db8::/126", "bogus"])
+        contains = lambda ip: ipaddress.ip_address(ip) in ips
+        self.assertTrue(contains("192.0.2.0"))
+        self.assertTrue(contains("192.0.3.255"))  # Adjacent blocks merged
+        self.assertFalse(contains("192.0.1.255"))
+        self.assertFalse(contains("192.0.4.0"))
+        self.assertTrue(contains("198.51.100.7"))
+        self.assertFalse(contains("198.51.100.8"))
+        self.assertTrue(contains("2001:db8::3"))
+        self.assertFalse(contains("2001:db8::4"))
+        # IPv4 and IPv6 integers never collide
+        self.assertFalse(contains("::c000:200"))
+        self.assertEqual(len(ips), 3)
+
+    def test_whole_space_and_canonical_entries(self):
+        self.assertIn(ipaddress.ip_address("255.255.255.255"), banlist.IPSet(["0.0.0.0/0"]))
+        self.assertEqual(banlist.canonical("192.0.2.9/24"), "192.0.2.0/24")
+        self.assertEqual(banlist.canonical("192.0.2.9/32"), "192.0.2.9")
+        self.assertEqual(banlist.canonical("::ffff:192.0.2.9"), "192.0.2.9")
+        with self.assertRaises(ValueError):
+            banlist.canonical("192.0.2.300")
+
+
+class AutomaticBanTests(SimpleTestCase):
+
+    def test_ban_is_issued_and_published_once(self):
+        redis_client = mock.MagicMock()
+        throttle = AnonymousRateThrottle()
+        # Every request is over the limits and past the violation threshold
+        redis_client.pipeline.return_value.execute.side_effect = [
+            [99, True, 99, True, 99, True],
+            [throttle.VIOLATION_THRESHOLD, True],
+        ] * 3
+        redis_client.set.side_effect = [True, None, None]
+        request = RequestFactory().get("/", REMOTE_ADDR="203.0.113.9")
+        with mock.patch("movies.throttling.get_redis_connection", return_value=redis_client), \
+                mock.patch.object(banlist, "check", return_value=None), \
+                mock.patch.object(banlist, "ban") as ban:
+            for _ in range(3):
+                self.assertFalse(throttle.allow_request(request, None))
+        ban.assert_called_once_with("203.0.113.9", throttle.BAN_DURATION)
+
+    def test_extending_a_ban_is_not_published(self):
+        redis_client = mock.MagicMock()
+        redis_client.pipeline.return_value.execute.side_effect = [[0, 1], [1, 1], [0, 0]]
+        with mock.patch("movies.banlist.get_redis_connection", return_value=redis_client):
+            banlist.ban("203.0.113.9", 60)
+            banlist.ban("203.0.113.9", 120)
+        self.assertEqual(redis_client.pipeline.return_value.publish.call_count, 1)
+
+
+@mock.patch.object(images, "get_image_config", return_value=images.DEFAULT_CONFIG)
+@override_settings(
+    IMAGE_PROXY_ENABLED=False, IMAGE_POSTER_SIZES=["w185", "w342", "w9999"], IMAGE_BACKDROP_SIZES=["w780"]
+)
+class ImageURLTests(SimpleTestCase):
+
+    def test_image_urls_keep_only_available_sizes(self, _):
+        self.assertEqual(images.image_urls("/a.jpg"), {
+            "w185": "https://image.tmdb.org/t/p/w185/a.jpg",
+            "w342": "https://image.tmdb.org/t/p/w342/a.jpg",
+        })
+        self.assertEqual(images.image_urls("/a.jpg", "backdrop"), {"w780": "https://image.tmdb.org/t/p/w780/a.jpg"})
+        self.assertEqual(images.image_urls(None), {})
+        with override_settings(IMAGE_PROXY_ENABLED=True, IMAGE_PROXY_SIZES=["w185"]):
+            self.assertEqual(images.image_urls("/a.jpg")["w185"], "/api/images/w185/a.jpg")
+
+    def test_srcset_lists_width_sizes(self, _):
+        self.assertEqual(
+            images.srcset({"w185": "/s.jpg", "w342": "/m.jpg", "original": "/o.jpg"}),
+            "/s.jpg 185w, /m.jpg 342w",
+        )
+
+    def test_attach_image_urls_copies_nested_movies(self, _):
+        data = {
+            "poster_path": "/p.jpg",
+            "results": [{"id": 1, "backdrop_path": "/b.jpg"}, {"id": 2, "poster_path": None}],
+            "recommendations": {"results": [{"id": 3, "poster_path": "/r.jpg"}]},
+        }
+        attached = images.attach_image_urls(data)
+        self.assertEqual(
+            attached["poster_srcset"],
+            "https://image.tmdb.org/t/p/w185/p.jpg 185w, https://image.tmdb.org/t/p/w342/p.jpg 342w",
+        )
+        self.assertEqual(attached["results"][0]["backdrop_urls"], {"w780": "https://image.tmdb.org/t/p/w780/b.jpg"})
+        self.assertNotIn("poster_urls", attached["results"][1])
+        self.assertIn("w342", attached["recommendations"]["results"][0]["poster_urls"])
+        # The payload may be a cached object and is left as it was
+        self.assertNotIn("poster_urls", data)
+        self.assertEqual(data["results"][0], {"id": 1, "backdrop_path": "/b.jpg"})
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHE, IMAGE_PROXY_ENABLED=True, IMAGE_PROXY_SIZES=["w185"], IMAGE_PROXY_SENDFILE_HEADER=""
+)
+class PosterProxyTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings_override = override_settings(IMAGE_PROXY_ROOT=root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.root = Path(root)
+
+        self.session = mock.MagicMock()
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(images, "get_session", return_value=self.session).start()
+        mock.patch.object(images, "get_image_config", return_value=images.DEFAULT_CONFIG).start()
+        mock.patch.object(images, "_account").start()
+        mock.patch("movies.governor.observe").start()
+        self.acquire = mock.patch("movies.governor.acquire").start()
+        self.allow = mock.patch.object(ImageProxyRateThrottle, "allow_request", return_value=True).start()
+
+    def tmdb_returns(self, status_code, content=b""):
+        response = self.session.get.return_value
+        response.status_code = status_code
+        response.content = content
+
+    def get(self, path):
+        return APIClient().get(f"/api/images/{path}")
+
+    def test_miss_is_downloaded_through_the_governor(self):
+        self.tmdb_returns(200, b"poster")
+        response = self.get("w185/a.jpg")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"poster")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.session.get.call_args[0][0], "https://image.tmdb.org/t/p/w185/a.jpg")
+        self.acquire.assert_called_once_with()
+        self.assertEqual((self.root / "w185" / "a.jpg").read_bytes(), b"poster")
+
+    def test_disk_hits_are_not_throttled(self):
+        (self.root / "w185").mkdir()
+        (self.root / "w185" / "a.jpg").write_bytes(b"cached")
+        self.allow.return_value = False
+        response = self.get("w185/a.jpg")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"cached")
+        self.session.get.assert_not_called()
+
+    def test_throttled_miss_is_refused(self):
+        self.allow.return_value = False
+        self.assertEqual(self.get("w185/a.jpg").status_code, 429)
+        self.session.get.assert_not_called()
+
+    def test_tmdb_404_is_passed_through(self):
+        self.tmdb_returns(404)
+        self.assertEqual(self.get("w185/missing.jpg").status_code, 404)
+        self.assertFalse((self.root / "w185" / "missing.jpg").exists())
+
+    def test_unknown_size_or_file(self):
+        self.assertEqual(self.get("w500/a.jpg").status_code, 404)
+        self.assertEqual(self.get("w185/a.exe").status_code, 404)
+        self.session.get.assert_not_called()
+        self.allow.assert_not_called()
+
+
+class DiscoverTests(TestCase):
+
+    def setUp(self):
+        Movie.objects.bulk_create([
+            Movie(
+                id=str(movie_id),
+                title=f"Movie {movie_id}",
+                release_date=date(2020, 1, 1),
+                genre_ids=[18] if movie_id % 2 else [18, 35],
+                keyword_ids=[],
+                vote_average=7.0,
+                vote_count=100,
+                popularity=float(movie_id),
+                language="en",
+            )
+            for movie_id in range(1, 26)
+        ])
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.catalog = catalog.Catalog.open(catalog.build_from_movies(root=root))
+        patcher = mock.patch.object(catalog, "get_catalog", return_value=self.catalog)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_filters(self):
+        cases = [
+            ({"with_genres": "18,35"}, {"genres_all": [18, 35]}),
+            ({"with_genres": "18|35", "without_keywords": "4,5"}, {"genres_any": [18, 35], "keywords_none": [4, 5]}),
+            ({"with_keywords": "7", "vote_count.gte": "50"}, {"keywords_all": [7], "min_votes": 50}),
+            (
+                {"primary_release_date.gte": "2019-01-01", "release_date.lte": "2021-06-30"},
+                {"released_from": date(2019, 1, 1), "released_to": date(2021, 6, 30)},
+            ),
+            ({"language": "en-US", "include_adult": "false", "page": 3}, {}),
+            ({"with_original_language": "fr"}, {"language": "fr"}),
+            # Everything else goes to TMDB
+            ({"with_cast": "287"}, None),
+            ({"include_adult": "true"}, None),
+            ({"include_video": "true"}, None),
+            ({"language": "de-DE"}, None),
+            ({"with_genres": "18,drama"}, None),
+            ({"vote_average.gte": "high"}, None),
+            ({"primary_release_date.gte": "2019-13-45"}, None),
+            ({"release_date.lte": "yesterday"}, None),
+        ]
+        for params, expected in cases:
+            self.assertEqual(discover._filters(params), expected, params)
+
+    @override_settings(LOCAL_DISCOVER_MIN_MOVIES=1)
+    def test_pages_in_tmdb_shape(self):
+        first = discover.discover({"with_genres": "18"})
+        self.assertEqual((first["page"], first["total_pages"], first["total_results"]), (1, 2, 25))
+        self.assertEqual([m["id"] for m in first["results"]], list(range(25, 5, -1)))
+        self.assertEqual(set(first["results"][0]), {
+            "adult", "backdrop_path", "genre_ids", "id", "original_language", "original_title", "overview",
+            "popularity", "poster_path", "release_date", "title", "video", "vote_average", "vote_count",
+        })
+        self.assertEqual(first["results"][0]["release_date"], "2020-01-01")
+
+        last = discover.discover({"with_genres": "18", "page": "2"})
+        self.assertEqual([m["id"] for m in last["results"]], [5, 4, 3, 2, 1])
+
+        comedies = discover.discover({"with_genres": "18,35", "sort_by": "popularity.asc"})
+        self.assertEqual(comedies["total_results"], 12)
+        self.assertEqual(comedies["results"][0]["id"], 2)
+
+    @override_settings(LOCAL_DISCOVER_MIN_MOVIES=1)
+    def test_falls_back_to_tmdb(self):
+        self.assertIsNone(discover.discover({"with_cast": "287"}))
+        self.assertIsNone(discover.discover({"sort_by": "revenue.desc"}))
+        with override_settings(LOCAL_DISCOVER_MIN_MOVIES=26):
+            self.assertIsNone(discover.discover({}))
+        with override_settings(LOCAL_DISCOVER_ENABLED=False):
+            self.assertIsNone(discover.discover({}))
+        catalog.get_catalog.return_value = None
+        self.assertIsNone(discover.discover({}))
+
+    def test_sync_follows_only_known_changes(self):
+        with mock.patch.object(discover, "_changed_ids", return_value=[3, 999, 7, 1000]), \
+                mock.patch.object(discover, "refresh_movies", return_value=(2, 0)) as refresh:
+            self.assertEqual(discover.sync(changed_days=1, build=False), (2, 0))
+        self.assertEqual(sorted(refresh.call_args[0][0]), [3, 7])
+
+
+@override_settings(CACHES=LOCMEM_CACHE, RESOLUTION_INDEX_REFRESH=0)
+class KeywordIngestTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        Genre.objects.create(id=18, name="Drama", aliases=["dramas"])
+        for name, value in (("_index", None), ("_index_version", None), ("_index_checked_at", 0.0)):
+            self.addCleanup(setattr, resolution, name, getattr(resolution, name))
+            setattr(resolution, name, value)
+
+    def version(self):
+        return cache.get(resolution.VERSION_KEY, 0)
+
+    def test_new_keywords_are_published_in_batches(self):
+        self.assertEqual(resolution.resolve_genres(["dramas", 18, 99]), [18])
+        self.assertEqual(resolution.ingest_keywords([{"id": 1, "name": "Heists"}, {"id": 2, "name": ""}]), 1)
+        # Usable here at once, without making every process reload
+        self.assertEqual(self.version(), 0)
+        self.assertEqual(resolution.resolve_keywords(["heist"]), [1])
+        self.assertEqual(self.version(), 1)
+
+        self.assertEqual(resolution.ingest_keywords([{"id": 1, "name": "heist"}, {"id": 3, "name": "revenge"}]), 1)
+        self.assertEqual(resolution.resolve_keywords(["revenge", "heist"]), [3, 1])
+        self.assertEqual(self.version(), 1)
+        # Published once the interval is over
+        cache.delete(resolution.PUBLISHED_KEY)
+        resolution.get_index()
+        self.assertEqual(self.version(), 2)
+        self.assertIsNone(cache.get(resolution.PENDING_KEY))
+
+
+class GovernorContextTests(SimpleTestCase):
+
+    def test_bind_carries_priority_into_threads(self):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with governor.priority(governor.BACKGROUND):
+                bound = pool.submit(governor.bind(governor.current_priority)).result()
+                unbound = pool.submit(governor.current_priority).result()
+        self.assertEqual((bound, unbound), (governor.BACKGROUND, governor.INTERACTIVE))
+        self.assertEqual(governor.current_priority(), governor.INTERACTIVE)
+
+    def test_pause_for_reads_rate_limit_headers(self):
+        def response(status_code=200, **headers):
+            return mock.Mock(status_code=status_code, headers=headers)
+
+        self.assertEqual(governor._pause_for(response(429, **{"Retry-After": "7"})), 7.0)
+        self.assertEqual(governor._pause_for(response(429, **{"Retry-After": "soon"})), 1.0)
+        reset = str(time.time() + 5)
+        self.assertAlmostEqual(
+            governor._pause_for(response(**{"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset})), 5, delta=1
+        )
+        self.assertIsNone(governor._pause_for(response(**{"X-RateLimit-Remaining": "3", "X-RateLimit-Reset": reset})))
+        with override_settings(TMDB_GOVERNOR_ENABLED=False):
+            self.assertIsNone(governor.observe(response(429)))
+
+
+@override_settings(
+    TMDB_GOVERNOR_ENABLED=True,
+    TMDB_GOVERNOR_RATE=0.01,  # Effectively no refill during a test
+    TMDB_GOVERNOR_MIN_RATE=0.001,
+    TMDB_GOVERNOR_BURST=4,
+    TMDB_GOVERNOR_BACKGROUND_RESERVE=0.5,
+    TMDB_GOVERNOR_RECOVERY=0,
+    TMDB_GOVERNOR_MAX_WAIT=0,
+    TMDB_GOVERNOR_BACKGROUND_MAX_WAIT=0,
+)
+class GovernorTests(SimpleTestCase):
+    """Against the Redis at REDIS_URL (a service in CI); skipped without one"""
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            get_redis_connection("default").ping()
+        except Exception:
+            raise unittest.SkipTest("Redis is not available")
+        super().setUpClass()
+
+    def setUp(self):
+        # calls() reads two minutes of metrics
+        minute = int(time.time() // 60)
+        self.redis = get_redis_connection("default")
+        self.redis.delete(governor.BUCKET_KEY, governor.metrics_key(minute), governor.metrics_key(minute - 1))
+
+    def calls(self, level, field="calls"):
+        return sum(minute[level][field] for minute in governor.metrics(2)["minutes"])
+
+    def test_empty_bucket_refuses(self):
+        for _ in range(4):
+            self.assertLess(governor.acquire(), 0.1)
+        with self.assertRaises(UpstreamRateLimited) as raised:
+            governor.acquire()
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(self.calls(governor.INTERACTIVE), 4)
+        self.assertEqual(self.calls(governor.INTERACTIVE, "rejected"), 1)
+
+    def test_background_is_refused_first(self):
+        with governor.priority(governor.BACKGROUND):
+            governor.acquire()
+            governor.acquire()
+            # Half the burst is kept for interactive calls
+            with self.assertRaises(UpstreamRateLimited):
+                governor.acquire()
+        governor.acquire()
+        governor.acquire()
+        with self.assertRaises(UpstreamRateLimited):
+            governor.acquire()
+        self.assertEqual(self.calls(governor.BACKGROUND), 2)
+        self.assertEqual(self.calls(governor.INTERACTIVE), 2)
+
+    def test_429_empties_the_bucket_and_cuts_the_rate(self):
+        with self.assertLogs("movies.governor", "WARNING"):
+            pause = governor.observe(mock.Mock(status_code=429, headers={"Retry-After": "30"}))
+        self.assertEqual(pause, 30.0)
+        with self.assertRaises(UpstreamRateLimited) as raised:
+            governor.acquire()
+        self.assertGreaterEqual(raised.exception.retry_after, 29)
+        state = governor.metrics(1)
+        self.assertEqual(state["tokens"], 0)
+        self.assertAlmostEqual(state["paused_for"], 30, delta=2)
+        self.assertAlmostEqual(float(self.redis.hget(governor.BUCKET_KEY, "rate")), 0.005)
+        self.assertEqual(sum(minute["rate_limited"] for minute in governor.metrics(2)["minutes"]), 1)
+
+
+class CatalogTests(TestCase):
+
+    def setUp(self):
+        rng = random.Random(7)
+        Movie.objects.bulk_create([
+            Movie(
+                id=str(movie_id),
+                # Repeated titles and popularities exercise the ID tie-break
+                title=f"Title {movie_id % 9}",
+                release_date=None if movie_id % 11 == 0 else date(2015 + movie_id % 8, 1 + movie_id % 12, 1),
+                genre_ids=rng.sample([18, 28, 35, 878], rng.randint(0, 3)),
+                keyword_ids=rng.sample(range(1, 9), rng.randint(0, 4)),
+                vote_average=rng.choice([5.0, 6.5, 7.5]),
+                vote_count=rng.randint(0, 300),
+                popularity=rng.choice([1.0, 2.5, 10.0]),
+                language=rng.choice(["en", "fr"]),
+            )
+            for movie_id in rng.sample(range(1, 5000), 80)
+        ])
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.catalog = catalog.Catalog.open(catalog.build_from_movies(root=self.root))
+
+    def movie_ids(self, rows):
+        return [int(movie_id) for movie_id in self.catalog.ids[rows]]
+
+    def test_filter_matches_orm(self):
+        cases = [
+            ({"genres_all": [18, 35]}, {}, lambda m: {18, 35} <= set(m.genre_ids)),
+            ({"genres_any": [28, 878]}, {}, lambda m: {28, 878} & set(m.genre_ids)),
+            ({"genres_none": [18]}, {}, lambda m: 18 not in m.genre_ids),
+            ({"keywords_all": [1, 2]}, {}, lambda m: {1, 2} <= set(m.keyword_ids)),
+            ({"keywords_any": [3, 4]}, {}, lambda m: {3, 4} & set(m.keyword_ids)),
+            ({"keywords_none": [5], "genres_all": [18]}, {}, lambda m: 5 not in m.keyword_ids and 18 in m.genre_ids),
+            ({"keywords_all": [1, 999]}, {"pk__in": []}, None),
+            ({"min_votes": 100, "min_rating": 6.5}, {"vote_count__gte": 100, "vote_average__gte": 6.5}, None),
+            ({"year": 2020}, {"release_date__year": 2020}, None),
+            (
+                {"released_from": date(2017, 6, 1), "released_to": date(2019, 1, 1)},
+                {"release_date__gte": date(2017, 6, 1), "release_date__lte": date(2019, 1, 1)},
+                None,
+            ),
+            ({"language": "fr"}, {"language": "fr"}, None),
+            ({"language": "de"}, {"pk__in": []}, None),
+        ]
+        for filters, lookups, predicate in cases:
+            expected = sorted(
+                int(m.id) for m in Movie.objects.filter(**lookups) if predicate is None or predicate(m)
+            )
+            self.assertEqual(self.movie_ids(self.catalog.filter(**filters)), expected, filters)
+
+    def test_pages_follow_orm_order_with_ties_broken_by_id(self):
+        movies = list(Movie.objects.all())
+        undated = float("inf")
+        orders = {
+            "popularity.desc": lambda m: (-m.popularity, int(m.id)),
+            "vote_count.asc": lambda m: (m.vote_count, int(m.id)),
+            "title.asc": lambda m: (m.title.casefold(), int(m.id)),
+            "release_date.desc": lambda m: (-m.release_date.toordinal() if m.release_date else undated, int(m.id)),
+        }
+        rows = self.catalog.filter()
+        for sort_by, key in orders.items():
+            paged = []
+            for offset in range(0, len(rows) + 7, 7):
+                paged.extend(self.movie_ids(self.catalog.page(rows, sort_by, offset, 7)))
+            self.assertEqual(paged, [int(m.id) for m in sorted(movies, key=key)], sort_by)
+        self.assertIsNone(self.catalog.page(rows, "revenue.desc"))
+
+    def test_genres_past_64_are_refused(self):
+        movies = [(i, f"Movie {i}", None, 7.0, 10, 1.0, [1000 + i], [], "en") for i in range(1, 71)]
+        with self.assertLogs("movies.catalog", "WARNING"):
+            built = catalog.Catalog.open(catalog.build(movies, root=self.root / "many-genres"))
+        self.assertEqual(len(built.meta["genres"]), 64)
+        self.assertEqual([int(i) for i in built.ids[built.filter(genres_all=[1001])]], [1])
+        self.assertEqual([int(i) for i in built.ids[built.filter(genres_any=[1063, 1064])]], [63, 64])
+        self.assertIsNone(built.filter(genres_any=[1065]))
+        self.assertIsNone(built.filter(genres_none=[1070]))
+
+    def test_publish_swaps_current_and_prunes(self):
+        self.addCleanup(setattr, catalog, "_catalog", None)
+        self.addCleanup(setattr, catalog, "_checked", 0.0)
+        root = self.root / "published"
+        with override_settings(CATALOG_ROOT=str(root), CATALOG_REFRESH=0, CATALOG_KEEP_BUILDS=2):
+            first = catalog.build_from_movies()
+            loaded = catalog.get_catalog()
+            self.assertEqual(loaded.version, first.name)
+
+            Movie.objects.create(id="99999", title="New", genre_ids=[18])
+            builds = [catalog.build_from_movies() for _ in range(2)]
+            self.assertEqual(os.readlink(root / catalog.CURRENT), builds[-1].name)
+            self.assertEqual(len(catalog.get_catalog()), len(loaded) + 1)
+            self.assertEqual(
+                sorted(p.name for p in root.iterdir()), sorted([catalog.CURRENT] + [b.name for b in builds])
+            )
+            # A worker still mapping a pruned build keeps reading it
+            self.assertFalse(first.exists())
+            self.assertEqual(len(loaded.ids), len(loaded))
+            self.assertTrue((loaded.ids[1:] > loaded.ids[:-1]).all())
+
+
+class ImportTimeTests(SimpleTestCase):
+    """Cold-start regressions, measured with python -X importtime in a fresh interpreter"""
+
+    BOOT = (
+        "import django; django.setup(); "
+        "from django.urls import get_resolver; get_resolver().url_patterns"
+    )
+    # Generous for slow CI machines; a worker boots in well under half of this
+    BUDGET_MS = int(os.environ.get("IMPORT_TIME_BUDGET_MS", 2500))
+
+    def import_times(self, **env):
+        """Cumulative import time in microseconds per module for a worker boot"""
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", self.BOOT],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "project.settings", **env},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times = {}
+        for line in result.stderr.splitlines():
+            match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+            if match:
+                times[match.group(3)] = (int(match.group(1)), len(match.group(2)))
+        return times
+
+    def test_boot_does_not_import_heavy_optional_modules(self):
+        times = self.import_times()
+        for module in ("numpy", "tiktoken"):
+            self.assertFalse(module in times, f"{module} is imported at boot")
+
+    def test_lean_profile_skips_unused_apps_and_middleware(self):
+        times = self.import_times(API_ONLY="True")
+        for module in (
+            "django.contrib.sessions.middleware",
+            "django.contrib.messages.middleware",
+            "whitenoise.middleware",
+        ):
+            self.assertFalse(module in times, f"{module} is imported in the lean profile")
+
+    def test_lean_boot_within_budget(self):
+        times = self.import_times(API_ONLY="True")
+        # Top-level entries only; nested ones are included in their parents
+        total_ms = sum(us for us, depth in times.values() if depth == 0) / 1000
+        self.assertLess(total_ms, self.BUDGET_MS)
@@ -1,56 +1,61 @@
 import time
-import redis
+from django_redis import get_redis_connection as get_pooled_connection
 from rest_framework.throttling import BaseThrottle
-from django.conf import settings
+from . import banlist
 from .ip import get_client_ip
 
 def get_redis_connection():
-    redis_url = settings.CACHES['default']['LOCATION']
-    return redis.Redis.from_url(redis_url)
+    # Client on the cache's shared connection pool (no per-request connect)
+    return get_pooled_connection("default")
 
 class AnonymousRateThrottle(BaseThrottle):
 
+    # Counters are kept per scope, so views with their own limits don't
+    # spend each other's budget
+    SCOPE = "ip"
+
     MINUTE_LIMIT = 5
     HOURLY_LIMIT = 20
     DAILY_LIMIT = 50
 
     # How many times can someone violate before getting banned?
+    BAN_ENABLED = True
     VIOLATION_THRESHOLD = 10
     BAN_DURATION = 3600  # 1 hour
 
-    def get_cache_keys(self, request):
-        ip = get_client_ip(request)
-
-        minute_key = f"rl:ip:{ip}:minute:{int(time.time() // 60)}"
-        hour_key   = f"rl:ip:{ip}:hour:{int(time.time() // 3600)}"
-        day_key    = f"rl:ip:{ip}:day:{int(time.time() // 86400)}"
+    def get_cache_keys(self, ip):
+        prefix = f"rl:{self.SCOPE}:{ip}"
+        minute_key = f"{prefix}:minute:{int(time.time() // 60)}"
+        hour_key   = f"{prefix}:hour:{int(time.time() // 3600)}"
+        day_key    = f"{prefix}:day:{int(time.time() // 86400)}"
 
-        violation_key = f"rl:ip:{ip}:violations"
-        banned_key    = f"rl:ip:{ip}:banned"
+        violation_key = f"{prefix}:violations"
 
-        return minute_key, hour_key, day_key, violation_key, banned_key
+        return minute_key, hour_key, day_key, violation_key
 
     def allow_request(self, request, view):
-        r = get_redis_connection()
         ip = get_client_ip(request)
 
-        minute_key, hour_key, day_key, violation_key, banned_key = self.get_cache_keys(request)
-
-        # 🚫 Is IP banned?
-        if r.exists(banned_key):
+        # 🚫 Is IP banned (or allow-listed)? Answered in-process, no Redis
+        verdict = banlist.check(ip)
+        if verdict == banlist.BANNED:
             return False
+        if verdict == banlist.ALLOWED:
+            return True
 
-        # Count current usage
-        minute_count = r.incr(minute_key)
-        hour_count   = r.incr(hour_key)
-        day_count    = r.incr(day_key)
-
-        if minute_count == 1:
-            r.expire(minute_key, 60)
-        if hour_count == 1:
-            r.expire(hour_key, 3600)
-        if day_count == 1:
-            r.expire(day_key, 86400)
+        r = get_redis_connection()
+        minute_key, hour_key, day_key, violation_key = self.get_cache_keys(ip)
+
+        # Counters in one round trip. The counter keys are per time bucket,
+        # so refreshing their TTL on every hit is harmless.
+        pipe = r.pipeline(transaction=False)
+        pipe.incr(minute_key)
+        pipe.expire(minute_key, 60)
+        pipe.incr(hour_key)
+        pipe.expire(hour_key, 3600)
+        pipe.incr(day_key)
+        pipe.expire(day_key, 86400)
+        minute_count, _, hour_count, _, day_count, _ = pipe.execute()
 
         # Check limits
         if (
@@ -58,16 +63,22 @@ class AnonymousRateThrottle(BaseThrottle):
             hour_count > self.HOURLY_LIMIT or
             day_count > self.DAILY_LIMIT
         ):
-            # Increase violation count
-            violations = r.incr(violation_key)
+            if not self.BAN_ENABLED:
+                return False
 
-            # Expire violation counter in 24 hours
-            if violations == 1:
-                r.expire(violation_key, 86400)
+            # Increase violation count, expiring the counter 24 hours
+            # after the first violation
+            pipe = r.pipeline(transaction=False)
+            pipe.incr(violation_key)
+            pipe.expire(violation_key, 86400, nx=True)
+            violations, _ = pipe.execute()
 
-            # Ban if too many violations
+            # Ban if too many violations. Until every worker has loaded the
+            # ban, the address keeps reaching this point; only the first
+            # request bans it instead of each one re-banning and publishing.
             if violations >= self.VIOLATION_THRESHOLD:
-                r.setex(banned_key, self.BAN_DURATION, 1)
+                if r.set(f"rl:{self.SCOPE}:{ip}:banned", 1, nx=True, ex=self.BAN_DURATION):
+                    banlist.ban(ip, self.BAN_DURATION)
                 return False
 
             return False
@@ -76,3 +87,35 @@ class AnonymousRateThrottle(BaseThrottle):
 
     def wait(self):
         return None
+
+
+class PollingRateThrottle(AnonymousRateThrottle):
+    """
+    Job status polling: cheap cache reads that clients repeat every few
+    seconds, so generous limits and no automatic ban (an already banned IP
+    is still refused)
+    """
+
+    SCOPE = "poll"
+
+    MINUTE_LIMIT = 120
+    HOURLY_LIMIT = 3000
+    DAILY_LIMIT = 20000
+
+    BAN_ENABLED = False
+
+
+class ImageProxyRateThrottle(AnonymousRateThrottle):
+    """
+    Poster proxy cache misses, each of which downloads from TMDB. A page of
+    results loads 20 posters at once, so generous limits and no automatic
+    ban; disk hits are not throttled at all.
+    """
+
+    SCOPE = "img"
+
+    MINUTE_LIMIT = 60
+    HOURLY_LIMIT = 600
+    DAILY_LIMIT = 3000
+
+    BAN_ENABLED = False
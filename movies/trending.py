@@ -0,0 +1,171 @@
+"""
+Materialized trending-by-genre-and-year listings
+
+Browsing /trending-genres/ across genres x years x pages almost never hits
+the per-request cache. A background job (manage.py materialize_trending)
+instead pulls the top discover results for every genre and each year of
+TRENDING_YEARS_BACK into the TrendingMovie table; the view then sorts and
+paginates a slice locally, without calling TMDB at request time.
+"""
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import governor
+from .models import Genre, TrendingMovie
+from .resolution import sync_genres
+from .services import TMDBService
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 20
+MAX_PAGE = 500  # TMDB's limit
+
+# TMDB sort_by field -> TrendingMovie column
+SORT_FIELDS = {
+    "popularity": "popularity",
+    "vote_average": "vote_average",
+    "vote_count": "vote_count",
+    "primary_release_date": "release_date",
+    "release_date": "release_date",
+    "title": "title",
+    "original_title": "title",
+}
+
+# Both orders are pulled so the slice covers the popular and the best-rated movies
+MATERIALIZE_SORTS = ["popularity.desc", "vote_average.desc"]
+
+
+def default_years():
+    this_year = date.today().year
+    return list(range(this_year - settings.TRENDING_YEARS_BACK + 1, this_year + 1))
+
+
+def _order_by(sort_by):
+    field, _, direction = (sort_by or "popularity.desc").partition(".")
+    column = SORT_FIELDS.get(field)
+    if column is None or direction not in ("asc", "desc"):
+        return None
+    prefix = "-" if direction == "desc" else ""
+    # movie_id keeps pagination stable between equal values
+    return [f"{prefix}{column}", f"{prefix}movie_id"]
+
+
+def get_listing(genre_id, year, sort_by="popularity.desc", page=1):
+    """
+    A page of a materialized slice in TMDB discover shape
+
+    Returns None when the slice has not been materialized, the sort is not
+    supported locally or the page lies past the slice, so the caller can
+    fall back to TMDB. Totals are TMDB's, so clients can page on past the
+    (truncated) slice.
+    """
+    order_by = _order_by(sort_by)
+    if order_by is None:
+        return None
+    rows = TrendingMovie.objects.filter(genre_id=genre_id, year=year)
+    total = rows.count()
+    page = max(1, page)
+    start = (page - 1) * PAGE_SIZE
+    if start >= total:
+        return None
+
+    results = list(rows.order_by(*order_by).values_list("data", flat=True)[start:start + PAGE_SIZE])
+    total_results = max(total, rows.values_list("slice_total", flat=True).first() or 0)
+    return {
+        "page": page,
+        "results": results,
+        "total_pages": min(MAX_PAGE, math.ceil(total_results / PAGE_SIZE)),
+        "total_results": total_results,
+    }
+
+
+def _fetch_slice(genre_id, year, pages):
+    """
+    Discover results for one (genre, year), de-duplicated by movie ID, and
+    TMDB's total result count for it
+    """
+    tmdb_service = TMDBService()
+    results = {}
+    total = 0
+    for sort_by in MATERIALIZE_SORTS:
+        for page in range(1, pages + 1):
+            data = tmdb_service.get_trending_genres(
+                with_genres=genre_id,
+                primary_release_year=year,
+                sort_by=sort_by,
+                page=page,
+                use_cache=False
+            )
+            for result in data.get("results", []):
+                results.setdefault(result["id"], result)
+            total = max(total, data.get("total_results", 0))
+            if page >= data.get("total_pages", 0):
+                break
+    return list(results.values()), total
+
+
+def materialize_slice(genre_id, year, pages=None):
+    """Replace one (genre, year) slice with fresh TMDB results; returns the row count"""
+    results, total = _fetch_slice(genre_id, year, pages or settings.TRENDING_MATERIALIZE_PAGES)
+    now = timezone.now()
+    rows = [
+        TrendingMovie(
+            genre_id=genre_id,
+            year=year,
+            movie_id=result["id"],
+            title=(result.get("title") or "")[:300],
+            popularity=result.get("popularity") or 0,
+            vote_average=result.get("vote_average") or 0,
+            vote_count=result.get("vote_count") or 0,
+            release_date=parse_date(result.get("release_date") or "") if result.get("release_date") else None,
+            data=result,
+            slice_total=total,
+            refreshed_at=now,
+        )
+        for result in results
+    ]
+    with transaction.atomic():
+        TrendingMovie.objects.filter(genre_id=genre_id, year=year).delete()
+        TrendingMovie.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def materialize(genre_ids=None, years=None, pages=None, workers=4):
+    """
+    Materialize every (genre, year) slice
+
+    Slices are refreshed independently; a failing slice keeps its previous
+    rows and is logged. Returns (slices refreshed, slices failed, rows).
+    """
+    if not genre_ids:
+        genre_ids = list(Genre.objects.values_list("id", flat=True)) or [g[0] for g in sync_genres()]
+    slices = [(genre_id, year) for genre_id in genre_ids for year in (years or default_years())]
+    start = time.monotonic()
+
+    def run(slice_):
+        try:
+            return materialize_slice(*slice_, pages=pages)
+        except Exception as e:
+            logger.warning("Materializing trending slice %s/%s failed: %s", *slice_, e)
+            return None
+        finally:
+            # Pool threads would otherwise each keep a connection open
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        counts = list(pool.map(governor.bind(run), slices))
+
+    refreshed = [c for c in counts if c is not None]
+    logger.info(
+        "Materialized %d/%d trending slices (%d rows) in %.1fs",
+        len(refreshed), len(slices), sum(refreshed), time.monotonic() - start
+    )
+    return len(refreshed), len(slices) - len(refreshed), sum(refreshed)
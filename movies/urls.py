@@ -6,11 +6,22 @@ from .views import (
     MoviesByGenreView,
     MovieByTitleView,
     GenreListView,
+    PosterProxyView,
     RecommendationView,
     SearchView,
     DiscoverView,
     movie_keywords_view,
     TrendingGenresView,
+    UserProfileView,
+    FavoritesView,
+    PreferencesView,
+    PersonalizedRecommendationView,
+    RecommendationJobView,
+    RecommendationJobStatusView,
+    TMDBGovernorView,
+    CachePurgeView,
+    ProfileListView,
+    ProfileDetailView,
 )
 
 urlpatterns = [
@@ -23,8 +34,23 @@ urlpatterns = [
     path('by-genre/', MoviesByGenreView.as_view(), name='by-genre'),
     path('by-title/', MovieByTitleView.as_view(), name='by-title'),
     path('genres/', GenreListView.as_view(), name='genres'),
+    path('images/<str:size>/<str:filename>', PosterProxyView.as_view(), name='poster-proxy'),
     path('recommendations/', RecommendationView.as_view(), name='recommendations'),
+    path('recommendations/me/', PersonalizedRecommendationView.as_view(), name='recommendations-me'),
+    path('recommendations/jobs/', RecommendationJobView.as_view(), name='recommendation-jobs'),
+    path('recommendations/jobs/<str:job_id>/', RecommendationJobStatusView.as_view(), name='recommendation-job'),
+
+    # Authenticated user endpoints
+    path('me/', UserProfileView.as_view(), name='me'),
+    path('me/favorites/', FavoritesView.as_view(), name='me-favorites'),
+    path('me/preferences/', PreferencesView.as_view(), name='me-preferences'),
     
+    # Operator endpoints (X-Admin-Token)
+    path('internal/tmdb-governor/', TMDBGovernorView.as_view(), name='tmdb-governor'),
+    path('internal/cache/purge/', CachePurgeView.as_view(), name='cache-purge'),
+    path('internal/profiles/', ProfileListView.as_view(), name='profiles'),
+    path('internal/profiles/<str:profile_id>/', ProfileDetailView.as_view(), name='profile'),
+
     # Legacy endpoints (for backward compatibility)
     path('search/', SearchView.as_view(), name='search'),
     path('discover/', DiscoverView.as_view(), name='discover'),
@@ -1,5 +1,10 @@
+import logging
+
+from .resolution import get_index, ingest_keywords
 from .services import TMDBService
 
+logger = logging.getLogger(__name__)
+
 
 def fetch_movie_details_with_keywords(movie_ids):
     """
@@ -12,22 +17,18 @@ def fetch_movie_details_with_keywords(movie_ids):
         list of movie detail dictionaries with keywords included
     """
     tmdb_service = TMDBService()
-    movies_data = []
+    movies_data, errors = tmdb_service.get_movies_with_keywords(movie_ids)
+    
+    for movie_id, e in errors.items():
+        # Log error but continue with other movies
+        logger.warning("Error fetching movie %s: %s", movie_id, e)
     
-    for movie_id in movie_ids:
-        try:
-            # Get movie details
-            movie_details = tmdb_service.get_movie_details(movie_id)
-            
-            # Get keywords
-            keywords_data = tmdb_service.get_movie_keywords(movie_id)
-            movie_details['keywords'] = keywords_data
-            
-            movies_data.append(movie_details)
-        except Exception as e:
-            # Log error but continue with other movies
-            print(f"Error fetching movie {movie_id}: {e}")
-            continue
+    # One ingest for the whole batch
+    ingest_keywords([
+        keyword
+        for movie_details in movies_data
+        for keyword in movie_details['keywords'].get('keywords', [])
+    ])
     
     return movies_data
 
@@ -37,10 +38,7 @@ def get_genre_id_mapping():
     Get a mapping of genre names to TMDB genre IDs
     
     Returns:
-        dict mapping genre names (lowercase) to genre IDs
+        dict mapping normalized genre names and aliases to genre IDs
     """
-    tmdb_service = TMDBService()
-    genre_list = tmdb_service.get_genre_list()
-    
-    return {genre['name'].lower(): genre['id'] for genre in genre_list.get('genres', [])}
+    return get_index().genres
 
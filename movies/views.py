@@ -1,15 +1,45 @@
+import base64
+import mimetypes
+
+import requests
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAuthenticated
 
-from .services import TMDBService, LLMService
-from .utils import fetch_movie_details_with_keywords, get_genre_id_mapping
+from . import governor, profiling
+from .caching import purge_all, purge_family, purge_movie
+from .authentication import ClerkUserAuthentication
+from .exceptions import NoSeedMovies, UpstreamUnavailable
+from .fastpath import ReadOnlyJSONView
+from .favorites import add_favorites, remove_favorites
+from .images import attach_image_urls, cached_image, download_image, image_path
+from .profiles import bump_profile_version, get_personalized_recommendations
+from .models import Favorite, Preference
+from .permissions import HasAdminToken
+from .trending import get_listing
+from .throttling import ImageProxyRateThrottle, PollingRateThrottle
+from .tasks import callback_allowed, enqueue_recommendation_job, get_job, public_job
+from .serializers import (
+    CachePurgeSerializer,
+    FavoriteMovieIdsSerializer,
+    FavoriteSerializer,
+    PreferenceSerializer,
+    UserSerializer,
+)
+from .services import TMDBService
+from .recommendations import generate_recommendations
 
 
 def health(request):
     return JsonResponse({"status": "ok"})
     
-class TrendingView(APIView):
+class TrendingView(ReadOnlyJSONView):
     """Get trending movies"""
     def get(self, request):
         page = request.GET.get("page", 1)
@@ -25,9 +55,9 @@ class TrendingView(APIView):
         # time_window = request.GET.get("time_window", "week")
         tmdb_service = TMDBService()
         data = tmdb_service.get_trending_movies(page=page, time_window=time_window)
-        return Response(data)
+        return Response(attach_image_urls(data))
 
-class TrendingGenresView(APIView):
+class TrendingGenresView(ReadOnlyJSONView):
     # something along the lines of /discover/movie?with_genres=28&primary_release_year=2025&sort_by=popularity.desc
     """Get trending genres"""
     def get(self, request):
@@ -49,12 +79,16 @@ class TrendingGenresView(APIView):
                 {"error": "with_genres and primary_release_year must be integers"},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if settings.TRENDING_MATERIALIZED_ENABLED:
+            data = get_listing(with_genres, primary_release_year, sort_by=sort_by, page=page)
+            if data is not None:
+                return Response(attach_image_urls(data))
         tmdb_service = TMDBService()
         data = tmdb_service.get_trending_genres(with_genres=with_genres, primary_release_year=primary_release_year, sort_by=sort_by, page=page)
-        return Response(data)
+        return Response(attach_image_urls(data))
 
 
-class TopRatedView(APIView):
+class TopRatedView(ReadOnlyJSONView):
     """Get top rated movies"""
     def get(self, request):
         page = request.GET.get("page", 1)
@@ -65,10 +99,10 @@ class TopRatedView(APIView):
         
         tmdb_service = TMDBService()
         data = tmdb_service.get_top_rated_movies(page=page)
-        return Response(data)
+        return Response(attach_image_urls(data))
 
 
-class movie_details_view(APIView):
+class movie_details_view(ReadOnlyJSONView):
     """Get movie details by ID"""
     def get(self, request):
         movie_id = request.GET.get("movie_id")
@@ -86,9 +120,9 @@ class movie_details_view(APIView):
             )
         tmdb_service = TMDBService()
         data = tmdb_service.get_movie_details(movie_id)
-        return Response(data)
+        return Response(attach_image_urls(data))
 
-class movie_keywords_view(APIView):
+class movie_keywords_view(ReadOnlyJSONView):
     """Get movie keywords by ID"""
     def get(self, request):
         movie_id = request.GET.get("movie_id")
@@ -96,7 +130,7 @@ class movie_keywords_view(APIView):
         data = tmdb_service.get_movie_keywords(movie_id)
         return Response(data)
 
-class MoviesByGenreView(APIView):
+class MoviesByGenreView(ReadOnlyJSONView):
     """Get movies by genre ID"""
     def get(self, request):
         genre_id = request.GET.get("genre_id")
@@ -119,10 +153,10 @@ class MoviesByGenreView(APIView):
         
         tmdb_service = TMDBService()
         data = tmdb_service.get_movies_by_genre(genre_id, page=page)
-        return Response(data)
+        return Response(attach_image_urls(data))
 
 
-class MovieByTitleView(APIView):
+class MovieByTitleView(ReadOnlyJSONView):
     """Search movies by title"""
     def get(self, request):
         query = request.GET.get("query", "")
@@ -141,10 +175,10 @@ class MovieByTitleView(APIView):
         
         tmdb_service = TMDBService()
         data = tmdb_service.search_movie_by_title(query, page=page)
-        return Response(data)
+        return Response(attach_image_urls(data))
 
 
-class SearchView(APIView):
+class SearchView(ReadOnlyJSONView):
     """Legacy search endpoint - redirects to MovieByTitleView"""
     def get(self, request):
         # Keep for backward compatibility
@@ -152,7 +186,7 @@ class SearchView(APIView):
         return view.get(request)
 
 
-class DiscoverView(APIView):
+class DiscoverView(ReadOnlyJSONView):
     """Legacy discover endpoint"""
     def get(self, request):
         genres = request.GET.get("with_genres", "")
@@ -176,10 +210,10 @@ class DiscoverView(APIView):
             sort_by=sort_by,
             page=page
         )
-        return Response(data)
+        return Response(attach_image_urls(data))
 
 
-class GenreListView(APIView):
+class GenreListView(ReadOnlyJSONView):
     """Get list of all available genres"""
     def get(self, request):
         tmdb_service = TMDBService()
@@ -187,6 +221,73 @@ class GenreListView(APIView):
         return Response(data)
 
 
+class PosterProxyView(ReadOnlyJSONView):
+    """Serve a TMDB poster thumbnail from the local disk cache (IMAGE_PROXY_ENABLED)"""
+    # A page of results loads 20 posters at once; the anonymous limit is for
+    # API calls. Only cache misses reach TMDB, so only they are throttled.
+    throttle_classes = []
+
+    def get(self, request, size, filename):
+        if not settings.IMAGE_PROXY_ENABLED:
+            return Response({"error": "Image proxy is disabled"}, status=status.HTTP_404_NOT_FOUND)
+        if image_path(size, filename) is None:
+            return Response({"error": "Unknown image size or file"}, status=status.HTTP_404_NOT_FOUND)
+
+        path = cached_image(size, filename)
+        if path is None:
+            throttle = ImageProxyRateThrottle()
+            if not throttle.allow_request(request, self):
+                self.throttled(request, throttle.wait())
+            path = download_image(size, filename)
+            if path is None:
+                return Response({"error": "Image not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if settings.IMAGE_PROXY_SENDFILE_HEADER:
+            response = HttpResponse(content_type=mimetypes.guess_type(filename)[0])
+            response[settings.IMAGE_PROXY_SENDFILE_HEADER] = f"{settings.IMAGE_PROXY_SENDFILE_PREFIX}{size}/{filename}"
+        else:
+            # Gunicorn hands FileResponse to sendfile() via wsgi.file_wrapper
+            response = FileResponse(open(path, "rb"))
+        # TMDB never reuses an image path for different content
+        response["Cache-Control"] = f"public, max-age={settings.IMAGE_PROXY_MAX_AGE}, immutable"
+        return response
+
+
+def validate_recommendation_request(data):
+    """
+    Validate a recommendation payload
+
+    Returns (movie_ids, preferences, error_response); error_response is
+    None when the payload is valid.
+    """
+    movie_ids = data.get("movie_ids", [])
+    preferences = data.get("preferences", {})
+    
+    # Validate input
+    if not movie_ids:
+        return None, None, Response(
+            {"error": "movie_ids is required and cannot be empty"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if not isinstance(movie_ids, list):
+        return None, None, Response(
+            {"error": "movie_ids must be a list"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Validate preferences
+    required_prefs = ["genres", "mood", "description"]
+    for pref in required_prefs:
+        if pref not in preferences:
+            return None, None, Response(
+                {"error": f"preferences.{pref} is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    return movie_ids, preferences, None
+
+
 class RecommendationView(APIView):
     """Get movie recommendations based on user preferences and liked movies"""
     
@@ -204,85 +305,243 @@ class RecommendationView(APIView):
             }
         }
         """
-        movie_ids = request.data.get("movie_ids", [])
-        preferences = request.data.get("preferences", {})
+        movie_ids, preferences, error = validate_recommendation_request(request.data)
+        if error:
+            return error
         
-        # Validate input
-        if not movie_ids:
+        try:
+            return Response(attach_image_urls(generate_recommendations(preferences, movie_ids=movie_ids)))
+        except NoSeedMovies as e:
             return Response(
-                {"error": "movie_ids is required and cannot be empty"},
+                {"error": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        if not isinstance(movie_ids, list):
+        except UpstreamUnavailable as e:
             return Response(
-                {"error": "movie_ids must be a list"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Validate preferences
-        required_prefs = ["genres", "mood", "description"]
-        for pref in required_prefs:
-            if pref not in preferences:
-                return Response(
-                    {"error": f"preferences.{pref} is required"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        
-        try:
-            # Fetch movie details with keywords
-            movie_data_list = fetch_movie_details_with_keywords(movie_ids)
-            
-            if not movie_data_list:
-                return Response(
-                    {"error": "No valid movie data could be fetched"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Get recommendation filters from LLM
-            llm_service = LLMService()
-            recommendation_filters = llm_service.get_recommendation_filters(
-                preferences, 
-                movie_data_list
-            )
-            
-            # Extract TMDB filters
-            tmdb_filters = recommendation_filters.get("tmdbFilters", {})
-            with_genres = tmdb_filters.get("with_genres", [])
-            with_keywords = tmdb_filters.get("with_keywords", [])
-            sort_by = tmdb_filters.get("sort_by", "popularity.desc")
-            
-            # Convert genre names to IDs if needed
-            if with_genres and isinstance(with_genres[0], str):
-                genre_mapping = get_genre_id_mapping()
-                with_genres = [genre_mapping.get(genre.lower()) for genre in with_genres if genre_mapping.get(genre.lower())]
-            
-            # Ensure with_genres and with_keywords are lists of integers
-            with_genres = [int(g) for g in with_genres if g] if with_genres else None
-            with_keywords = [int(k) for k in with_keywords if k] if with_keywords else None
-            
-            # Discover movies using the filters
-            tmdb_service = TMDBService()
-            recommendations = tmdb_service.discover_movies(
-                with_genres=with_genres,
-                with_keywords=with_keywords,
-                sort_by=sort_by,
-                page=1
+                {"error": f"Failed to generate recommendations: {str(e)}"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(int(e.retry_after or 30))}
             )
-            
-            # Return recommendations along with the analysis
-            return Response({
-                "recommendations": recommendations,
-                "analysis": {
-                    "themes": recommendation_filters.get("themes", []),
-                    "genres": recommendation_filters.get("genres", []),
-                    "keywords": recommendation_filters.get("keywords", []),
-                    "mood": recommendation_filters.get("mood", ""),
-                }
-            })
-            
+        except requests.RequestException:
+            # 502/504 from upstream_exception_handler
+            raise
         except Exception as e:
             return Response(
                 {"error": f"Failed to generate recommendations: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class FavoriteCursorPagination(CursorPagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    ordering = "-created_at"
+
+
+class UserScopedView(APIView):
+    """Base for endpoints acting on the authenticated user"""
+    authentication_classes = [ClerkUserAuthentication]
+    permission_classes = [IsAuthenticated]
+
+
+class UserProfileView(UserScopedView):
+    """Get or update the authenticated user's profile, preferences and favorites"""
+
+    def get(self, request):
+        user = request.user
+        # Preferences come from the authentication query; favorites and
+        # their movies are one extra query however many there are
+        prefetch_related_objects(
+            [user],
+            Prefetch("favorites", queryset=Favorite.objects.select_related("movie").order_by("-created_at"))
+        )
+        return Response(UserSerializer(user).data)
+
+    def patch(self, request):
+        serializer = UserSerializer(request.user, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return self.get(request)
+
+
+class FavoritesView(UserScopedView):
+    """List, bulk add and bulk remove the authenticated user's favorites"""
+
+    def get(self, request):
+        queryset = Favorite.objects.filter(user=request.user).select_related("movie")
+        paginator = FavoriteCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(FavoriteSerializer(page, many=True).data)
+
+    def post(self, request):
+        """
+        Add favorites in bulk
+
+        Expected payload:
+        {
+            "movie_ids": [123, 456, 789]
+        }
+        """
+        serializer = FavoriteMovieIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        added = add_favorites(request.user, serializer.validated_data["movie_ids"])
+        return Response({"added": added}, status=status.HTTP_201_CREATED)
+
+    def delete(self, request):
+        """Remove favorites in bulk (same payload as POST)"""
+        serializer = FavoriteMovieIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        removed = remove_favorites(request.user, serializer.validated_data["movie_ids"])
+        return Response({"removed": removed})
+
+
+class PreferencesView(UserScopedView):
+    """Get or replace the authenticated user's preferences"""
+
+    def get(self, request):
+        preference = Preference.objects.filter(user=request.user).first()
+        if preference is None:
+            return Response(
+                {"error": "No preferences saved"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(PreferenceSerializer(preference).data)
+
+    def put(self, request):
+        preference = Preference.objects.filter(user=request.user).first()
+        serializer = PreferenceSerializer(preference, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(id=request.user.id, user=request.user)
+        bump_profile_version(request.user)
+        return Response(serializer.data)
+
+
+class RecommendationJobView(APIView):
+    """Queue a recommendation job and return its ID without waiting for the LLM"""
+
+    def post(self, request):
+        """
+        Same payload as RecommendationView, plus an optional "callback_url"
+        (https, allow-listed host) that receives the finished job as JSON
+        """
+        movie_ids, preferences, error = validate_recommendation_request(request.data)
+        if error:
+            return error
+
+        callback_url = request.data.get("callback_url")
+        if callback_url and not callback_allowed(callback_url):
+            return Response(
+                {"error": "callback_url host is not allowed"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        job = enqueue_recommendation_job(movie_ids, preferences, callback_url=callback_url)
+        data = public_job(job)
+        data["status_url"] = reverse("recommendation-job", args=[job["id"]])
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+
+class RecommendationJobStatusView(APIView):
+    """Poll a recommendation job"""
+
+    throttle_classes = [PollingRateThrottle]
+
+    def get(self, request, job_id):
+        job = get_job(job_id)
+        if job is None:
+            return Response(
+                {"error": "Job not found or expired"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(public_job(job))
+
+
+class PersonalizedRecommendationView(UserScopedView):
+    """Get recommendations from the authenticated user's stored favorites and preferences"""
+
+    def get(self, request):
+        try:
+            return Response(attach_image_urls(get_personalized_recommendations(request.user)))
+        except NoSeedMovies:
+            return Response(
+                {"error": "Add some favorites to get personalized recommendations"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+
+class TMDBGovernorView(APIView):
+    """Upstream call rate and queue wait metrics of the TMDB governor (operators only)"""
+    authentication_classes = []
+    permission_classes = [HasAdminToken]
+    throttle_classes = []
+
+    def get(self, request):
+        try:
+            minutes = min(int(request.GET.get("minutes", 15)), 360)
+        except ValueError:
+            minutes = 15
+        return Response(governor.metrics(minutes=max(1, minutes)))
+
+
+class CachePurgeView(APIView):
+    """
+    Invalidate cached TMDB responses by family or movie ID (operators only)
+
+    The HTTP counterpart of manage.py purge_cache, for deployments where
+    the admin site is not installed (API_ONLY). Returns the new generations.
+    """
+    authentication_classes = []
+    permission_classes = [HasAdminToken]
+    throttle_classes = []
+
+    def post(self, request):
+        serializer = CachePurgeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        generations = purge_all() if data["all"] else {}
+        for family in data["families"]:
+            generations[family] = purge_family(family)
+        for movie_id in data["movie_ids"]:
+            generations[f"movie:{movie_id}"] = purge_movie(movie_id)
+        return Response({"generations": generations})
+
+
+class ProfileListView(APIView):
+    """Recently captured request profiles (operators only)"""
+    authentication_classes = []
+    permission_classes = [HasAdminToken]
+    throttle_classes = []
+
+    def get(self, request):
+        return Response({"profiles": profiling.recent_profiles()})
+
+
+class ProfileDetailView(APIView):
+    """
+    One captured profile
+
+    Returns the summary and recorded calls; with ?flame=1 the raw profile
+    (.pstats for cProfile, speedscope JSON for pyinstrument) as a download.
+    """
+    authentication_classes = []
+    permission_classes = [HasAdminToken]
+    throttle_classes = []
+
+    def get(self, request, profile_id):
+        profile = profiling.get_profile(profile_id)
+        if profile is None:
+            return Response({"error": "Profile not found or expired"}, status=status.HTTP_404_NOT_FOUND)
+
+        flame = profile.pop("flame")
+        if not request.GET.get("flame"):
+            return Response(profile)
+        if profile["flame_format"] == "pstats":
+            response = HttpResponse(base64.b64decode(flame), content_type="application/octet-stream")
+            filename = f"{profile_id}.pstats"
+        else:
+            response = HttpResponse(flame, content_type="application/json")
+            filename = f"{profile_id}.speedscope.json"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
@@ -0,0 +1,59 @@
+"""
+Pre-fork warm-up for gunicorn --preload
+
+Run once in the master after the app is loaded: heavy imports and shared,
+read-mostly state (URL resolver, genre/keyword resolution index, tokenizer,
+movie catalog) are built there and inherited copy-on-write by every
+worker, so workers start serving immediately. Connections and threads
+are not fork-safe: nothing here calls TMDB or starts a thread (the genre
+sync would start the durable store's flusher), and the database and
+Redis connections used are closed before forking.
+"""
+import gc
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """Build shared state before forking; returns the seconds it took"""
+    start = time.monotonic()
+
+    import numpy  # noqa: F401  Used by reranking, imported lazily otherwise
+    from django.urls import get_resolver
+
+    from .prompting import count_tokens
+    from .resolution import get_index
+
+    get_resolver().url_patterns
+    count_tokens("warm up")  # Loads the tiktoken encoding when installed
+    if settings.LOCAL_DISCOVER_ENABLED:
+        from .catalog import get_catalog
+
+        # Memory-mapped: workers share the pages, not copies
+        get_catalog()
+    try:
+        # Reads the version key from Redis, but never syncs genres from TMDB
+        get_index(sync=False)
+    except Exception as e:
+        # Workers load the index lazily on first use instead
+        logger.warning("Resolution index not preloaded: %s", e)
+
+    # Workers must open their own database and Redis connections
+    connections.close_all()
+    try:
+        get_redis_connection("default").connection_pool.disconnect()
+    except NotImplementedError:
+        pass  # Not a Redis cache
+    # Keep the garbage collector from touching (and so copying) the
+    # inherited objects in every worker
+    gc.freeze()
+
+    elapsed = time.monotonic() - start
+    logger.info("Pre-fork warm-up done in %.2fs", elapsed)
+    return elapsed
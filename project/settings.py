@@ -43,6 +43,11 @@ SECRET_KEY = env('SECRET_KEY', default='django-insecure-i52rx(knzkw&!g%_k1())a6o
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = env('DEBUG', default=True)
 
+# Lean profile for API-only workers: no admin, sessions, messages or static
+# files, and only the middleware a JSON API needs. Saves import time and
+# per-request work; run admin/management tasks with API_ONLY unset.
+API_ONLY = env.bool('API_ONLY', default=False)
+
 ALLOWED_HOSTS = [
     "api.cinematch.muhacodes.com",
     "localhost",
@@ -71,17 +76,73 @@ CORS_ALLOW_HEADERS = [
 
 # Application definition
 
+# One connection pool per process, shared by the cache, the throttle and
+# the job queue (via django_redis.get_redis_connection)
+REDIS_OPTIONS = {
+    "CLIENT_CLASS": "django_redis.client.DefaultClient",
+    "SOCKET_CONNECT_TIMEOUT": env.float('REDIS_SOCKET_CONNECT_TIMEOUT', default=1.0),
+    "SOCKET_TIMEOUT": env.float('REDIS_SOCKET_TIMEOUT', default=1.0),
+    "CONNECTION_POOL_KWARGS": {
+        "max_connections": env.int('REDIS_MAX_CONNECTIONS', default=50),
+        "health_check_interval": env.int('REDIS_HEALTH_CHECK_INTERVAL', default=30),
+        "retry_on_timeout": True,
+    },
+}
+try:
+    # Optional C reply parser; much faster for MGET/pipelines of large payloads
+    import hiredis  # noqa: F401
+    REDIS_OPTIONS["PARSER_CLASS"] = "redis.connection._HiredisParser"
+except ImportError:
+    pass
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": env('REDIS_URL', default='redis://localhost:6379/1'),
         "TIMEOUT": 86400,   # 24 hours
-        "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
-        }
+        "OPTIONS": REDIS_OPTIONS,
     }
 }
 
+# Seconds a process trusts its copy of the cache family generation counters
+# (bounds how long a purge takes to reach every worker)
+CACHE_GENERATION_REFRESH = env.float('CACHE_GENERATION_REFRESH', default=1.0)
+
+# Durable second-level store for TMDB payloads (TMDBResponse table), read
+# when Redis misses and written behind in batches
+TMDB_STORE_ENABLED = env.bool('TMDB_STORE_ENABLED', default=True)
+TMDB_STORE_FAMILIES = env.list('TMDB_STORE_FAMILIES', default=['movie', 'genre_list', 'configuration'])
+TMDB_STORE_FLUSH_INTERVAL = env.float('TMDB_STORE_FLUSH_INTERVAL', default=2.0)  # Seconds
+TMDB_STORE_BATCH_SIZE = env.int('TMDB_STORE_BATCH_SIZE', default=200)  # Flush early at this many
+TMDB_STORE_WARM_LIMIT = env.int('TMDB_STORE_WARM_LIMIT', default=5000)
+
+# Materialized trending-by-genre-and-year listings (manage.py materialize_trending)
+TRENDING_MATERIALIZED_ENABLED = env.bool('TRENDING_MATERIALIZED_ENABLED', default=True)
+TRENDING_YEARS_BACK = env.int('TRENDING_YEARS_BACK', default=10)  # Years up to and including this one
+TRENDING_MATERIALIZE_PAGES = env.int('TRENDING_MATERIALIZE_PAGES', default=5)  # Discover pages per sort
+
+# Columnar movie catalog built from the Movie table (manage.py build_catalog),
+# memory-mapped by every worker; see movies/catalog.py
+CATALOG_ROOT = env('CATALOG_ROOT', default=str(BASE_DIR / 'catalog'))
+CATALOG_REFRESH = env.float('CATALOG_REFRESH', default=30.0)  # Seconds between checks for a new build
+CATALOG_KEEP_BUILDS = env.int('CATALOG_KEEP_BUILDS', default=2)
+# Answer /discover/movie queries from the catalog (movies/discover.py) once
+# it holds at least LOCAL_DISCOVER_MIN_MOVIES; kept fresh by manage.py sync_catalog
+LOCAL_DISCOVER_ENABLED = env.bool('LOCAL_DISCOVER_ENABLED', default=True)
+LOCAL_DISCOVER_MIN_MOVIES = env.int('LOCAL_DISCOVER_MIN_MOVIES', default=10000)
+
+# Slim middleware/view path for the read-only movie endpoints (movies/fastpath.py)
+FAST_PATH_ENABLED = env.bool('FAST_PATH_ENABLED', default=True)
+
+# Proxies whose X-Forwarded-For is trusted when finding the client IP
+TRUSTED_PROXIES = env.list('TRUSTED_PROXIES', default=[
+    '127.0.0.0/8', '::1/128', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16',
+])
+
+# In-process IP ban/allow lists synced from Redis (movies/banlist.py, manage.py ipban)
+IP_BANLIST_ENABLED = env.bool('IP_BANLIST_ENABLED', default=True)
+IP_BANLIST_REFRESH = env.float('IP_BANLIST_REFRESH', default=30.0)  # Seconds between version checks
+
 # REST Framework settings
 REST_FRAMEWORK = {
 
@@ -97,7 +158,12 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'EXCEPTION_HANDLER': 'movies.exceptions.upstream_exception_handler',
 }
+if API_ONLY:
+    # Session/basic auth need the apps removed above; user endpoints set
+    # ClerkUserAuthentication explicitly
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] = []
 
 # TMDB API Configuration
 TMDB_READ_ACCESS_TOKEN = env('TMDB_READ_ACCESS_TOKEN', default='')
@@ -108,6 +174,118 @@ LLM_API_KEY = env('LLM_API_KEY', default='')
 LLM_API_BASE_URL = env('LLM_API_BASE_URL', default='https://api.openai.com/v1')
 LLM_MODEL = env('LLM_MODEL', default='gpt-4o-mini')
 
+# Shared secret the frontend server sends with X-Clerk-User-Id for user endpoints
+INTERNAL_API_TOKEN = env('INTERNAL_API_TOKEN', default='')
+
+# Shared secret for operator endpoints (X-Admin-Token), disabled when empty
+ADMIN_API_TOKEN = env('ADMIN_API_TOKEN', default='')
+
+# Per-user recommendation cache (invalidated early by taste profile changes)
+PERSONALIZED_RECOMMENDATIONS_TTL = env.int('PERSONALIZED_RECOMMENDATIONS_TTL', default=3600 * 6)
+
+# Background recommendation jobs: "redis" (run_recommendation_worker) or "local" (in-process threads)
+RECOMMENDATION_JOBS_BACKEND = env('RECOMMENDATION_JOBS_BACKEND', default='redis')
+RECOMMENDATION_JOB_TTL = env.int('RECOMMENDATION_JOB_TTL', default=3600)
+RECOMMENDATION_JOB_LOCAL_WORKERS = env.int('RECOMMENDATION_JOB_LOCAL_WORKERS', default=2)
+# Seconds a worker's claim on a running job lasts without a heartbeat
+RECOMMENDATION_JOB_LEASE = env.int('RECOMMENDATION_JOB_LEASE', default=60)
+# Seconds a job may wait for a worker before it is considered lost
+RECOMMENDATION_JOB_QUEUE_TIMEOUT = env.int('RECOMMENDATION_JOB_QUEUE_TIMEOUT', default=600)
+RECOMMENDATION_CALLBACK_HOSTS = env.list('RECOMMENDATION_CALLBACK_HOSTS', default=[])
+
+# LLM prompt budgeting
+LLM_PROMPT_TOKEN_BUDGET = env.int('LLM_PROMPT_TOKEN_BUDGET', default=1200)  # Movie data section only
+LLM_MAX_SEED_MOVIES = env.int('LLM_MAX_SEED_MOVIES', default=8)
+LLM_OVERVIEW_MAX_TOKENS = env.int('LLM_OVERVIEW_MAX_TOKENS', default=60)
+LLM_MAX_KEYWORDS = env.int('LLM_MAX_KEYWORDS', default=20)
+
+# Seconds between checks for a newer genre/keyword resolution index
+RESOLUTION_INDEX_REFRESH = env.int('RESOLUTION_INDEX_REFRESH', default=60)
+# Newly ingested keywords reach other processes (a full index reload) at most this often
+RESOLUTION_KEYWORDS_PUBLISH_INTERVAL = env.int('RESOLUTION_KEYWORDS_PUBLISH_INTERVAL', default=900)
+
+# Fall back to local (LLM-free) filter extraction when the LLM is down or slower than the budget
+LOCAL_FILTERS_FALLBACK_ENABLED = env.bool('LOCAL_FILTERS_FALLBACK_ENABLED', default=True)
+LLM_LATENCY_BUDGET = env.float('LLM_LATENCY_BUDGET', default=10.0)  # Seconds
+
+# Stream LLM completions and start TMDB discover as soon as the filters arrive
+# (takes precedence over batching for recommendation requests)
+LLM_STREAM_ENABLED = env.bool('LLM_STREAM_ENABLED', default=False)
+
+# Local reranking/diversification of discover candidates for recommendations
+RERANK_ENABLED = env.bool('RERANK_ENABLED', default=True)
+RERANK_PAGES = env.int('RERANK_PAGES', default=3)  # Discover pages pulled per query
+RERANK_TOP_K = env.int('RERANK_TOP_K', default=20)
+RERANK_DIVERSITY = env.float('RERANK_DIVERSITY', default=0.3)  # MMR: 0 = relevance only
+
+# Micro-batching of concurrent LLM analyses into one multi-item prompt
+LLM_BATCH_ENABLED = env.bool('LLM_BATCH_ENABLED', default=False)
+LLM_BATCH_MAX_SIZE = env.int('LLM_BATCH_MAX_SIZE', default=4)
+LLM_BATCH_WINDOW = env.float('LLM_BATCH_WINDOW', default=0.05)  # Seconds
+
+# Upstream resilience (timeouts in seconds, circuit breaker state lives in Redis)
+TMDB_CONNECT_TIMEOUT = env.float('TMDB_CONNECT_TIMEOUT', default=2.0)
+TMDB_TIMEOUTS = {
+    # Read timeouts keyed by the first path segment of the TMDB endpoint
+    'default': env.float('TMDB_READ_TIMEOUT', default=5.0),
+    'movie': 4.0,
+    'search': 3.0,
+    'discover': 5.0,
+    'genre': 4.0,
+}
+# Seconds a copy of a response is kept for serving while TMDB is down, per
+# cache family. Other families keep no copy: the durable store covers movie,
+# genre_list and configuration, and search/discover keys rarely repeat.
+TMDB_STALE_TTLS = {
+    'trending': env.int('TMDB_STALE_TTL_TRENDING', default=86400),
+    'trending_genres': env.int('TMDB_STALE_TTL_TRENDING_GENRES', default=86400),
+    'top_rated': env.int('TMDB_STALE_TTL_TOP_RATED', default=86400 * 7),
+    'genre': env.int('TMDB_STALE_TTL_GENRE', default=86400 * 3),
+}
+TMDB_HEDGE_ENABLED = env.bool('TMDB_HEDGE_ENABLED', default=False)
+TMDB_HEDGE_DEFAULT_DELAY = env.float('TMDB_HEDGE_DEFAULT_DELAY', default=0.8)
+TMDB_HEDGE_MIN_DELAY = env.float('TMDB_HEDGE_MIN_DELAY', default=0.1)
+TMDB_HEDGE_MAX_WORKERS = env.int('TMDB_HEDGE_MAX_WORKERS', default=8)
+LLM_CONNECT_TIMEOUT = env.float('LLM_CONNECT_TIMEOUT', default=3.0)
+LLM_READ_TIMEOUT = env.float('LLM_READ_TIMEOUT', default=30.0)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = env.int('CIRCUIT_BREAKER_FAILURE_THRESHOLD', default=5)
+CIRCUIT_BREAKER_WINDOW = env.int('CIRCUIT_BREAKER_WINDOW', default=60)
+CIRCUIT_BREAKER_RESET_TIMEOUT = env.int('CIRCUIT_BREAKER_RESET_TIMEOUT', default=30)
+
+# Cluster-wide TMDB token bucket (movies/governor.py); rates in requests/second
+TMDB_GOVERNOR_ENABLED = env.bool('TMDB_GOVERNOR_ENABLED', default=True)
+TMDB_GOVERNOR_RATE = env.float('TMDB_GOVERNOR_RATE', default=35.0)
+TMDB_GOVERNOR_BURST = env.float('TMDB_GOVERNOR_BURST', default=40.0)
+TMDB_GOVERNOR_MIN_RATE = env.float('TMDB_GOVERNOR_MIN_RATE', default=2.0)  # Floor after repeated 429s
+TMDB_GOVERNOR_RECOVERY = env.float('TMDB_GOVERNOR_RECOVERY', default=0.5)  # Rate regained per second
+TMDB_GOVERNOR_MAX_WAIT = env.float('TMDB_GOVERNOR_MAX_WAIT', default=2.0)  # Seconds a user request queues
+TMDB_GOVERNOR_BACKGROUND_MAX_WAIT = env.float('TMDB_GOVERNOR_BACKGROUND_MAX_WAIT', default=60.0)
+TMDB_GOVERNOR_BACKGROUND_RESERVE = env.float('TMDB_GOVERNOR_BACKGROUND_RESERVE', default=0.5)  # Of the burst
+TMDB_GOVERNOR_RETRIES = env.int('TMDB_GOVERNOR_RETRIES', default=2)  # Retries after a 429
+
+# Image URLs attached to movie payloads (movies/images.py); sizes are TMDB size names
+IMAGE_CONFIG_REFRESH = env.int('IMAGE_CONFIG_REFRESH', default=86400)  # Seconds
+IMAGE_POSTER_SIZES = env.list('IMAGE_POSTER_SIZES', default=['w185', 'w342', 'w500'])
+IMAGE_BACKDROP_SIZES = env.list('IMAGE_BACKDROP_SIZES', default=['w780', 'w1280'])
+IMAGE_DEFAULT_POSTER_SIZE = env('IMAGE_DEFAULT_POSTER_SIZE', default='w342')  # Movie.poster_url
+# Local poster proxy with an on-disk LRU cache, for the sizes listed here
+IMAGE_PROXY_ENABLED = env.bool('IMAGE_PROXY_ENABLED', default=False)
+IMAGE_PROXY_SIZES = env.list('IMAGE_PROXY_SIZES', default=['w92', 'w185', 'w342'])
+IMAGE_PROXY_ROOT = env('IMAGE_PROXY_ROOT', default=str(BASE_DIR / 'image_cache'))
+IMAGE_PROXY_MAX_BYTES = env.int('IMAGE_PROXY_MAX_BYTES', default=512 * 1024 * 1024)
+IMAGE_PROXY_BASE_URL = env('IMAGE_PROXY_BASE_URL', default='/api/images/')
+IMAGE_PROXY_MAX_AGE = env.int('IMAGE_PROXY_MAX_AGE', default=86400 * 365)  # Cache-Control max-age
+# e.g. X-Accel-Redirect with nginx serving IMAGE_PROXY_ROOT at IMAGE_PROXY_SENDFILE_PREFIX
+IMAGE_PROXY_SENDFILE_HEADER = env('IMAGE_PROXY_SENDFILE_HEADER', default='')
+IMAGE_PROXY_SENDFILE_PREFIX = env('IMAGE_PROXY_SENDFILE_PREFIX', default='/protected-images/')
+
+# On-demand request profiling (movies/profiling.py): X-Profile + X-Admin-Token, or sampling
+PROFILING_ENABLED = env.bool('PROFILING_ENABLED', default=False)
+PROFILING_SAMPLE_RATE = env.float('PROFILING_SAMPLE_RATE', default=0.0)  # Fraction of requests
+PROFILING_ENGINE = env('PROFILING_ENGINE', default='cprofile')  # or pyinstrument (pip install pyinstrument)
+PROFILING_BUFFER_SIZE = env.int('PROFILING_BUFFER_SIZE', default=50)  # Profiles kept
+PROFILING_TTL = env.int('PROFILING_TTL', default=86400)  # Seconds
+
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -132,6 +310,8 @@ if not DEBUG:
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Must be at the top, before all other middleware
     'django.middleware.security.SecurityMiddleware',
+    'movies.profiling.ProfilingMiddleware',  # Removes itself unless PROFILING_ENABLED
+    'movies.fastpath.FastPathMiddleware',  # Read-only movie endpoints skip everything below
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Serve static files
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -141,6 +321,24 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Lean profile (API_ONLY): drop the apps and middleware the JSON API does not use
+if API_ONLY:
+    LEAN_REMOVED_APPS = [
+        'django.contrib.admin',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+        'django.contrib.staticfiles',
+        'whitenoise.runserver_nostatic',
+    ]
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in LEAN_REMOVED_APPS]
+    MIDDLEWARE = [
+        'corsheaders.middleware.CorsMiddleware',
+        'django.middleware.security.SecurityMiddleware',
+        'movies.profiling.ProfilingMiddleware',
+        'movies.fastpath.FastPathMiddleware',
+        'django.middleware.common.CommonMiddleware',
+    ]
+
 ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
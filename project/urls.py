@@ -14,12 +14,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 
 from movies.views import health
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('movies.urls')),
     path('health/', health),
 ]
+
+# Not installed in the lean API_ONLY profile
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+    urlpatterns.append(path('admin/', admin.site.urls))